@@ -4,7 +4,7 @@ from django.db import transaction
 from django.utils import timezone
 
 from expeditions.models import ExpeditionRunResult, ExpeditionDailyPayout
-from notes.views import get_or_create_profile
+from notes.services.wallet import credit
 
 REWARDS = {1: 1000, 2: 500, 3: 300}
 
@@ -42,16 +42,14 @@ class Command(BaseCommand):
                 if uid in paid_users:
                     continue
 
-                payout = ExpeditionDailyPayout.objects.create(
+                ExpeditionDailyPayout.objects.create(
                     day=day_to_pay,
                     user_id=uid,
                     coins=coins,
                     rank=rank,
                 )
 
-                profile = get_or_create_profile(payout.user)
-                profile.coins += coins
-                profile.save(update_fields=["coins"])
+                credit(uid, coins=coins, reason="expedition_top")
 
                 paid_users.add(uid)
 
@@ -10,36 +10,56 @@ class Fighter:
     defense: int
 
 
+# Actores de los eventos del duelo
+DUEL_FIGHTER = 0
+DUEL_ENEMY = 1
+
+
 @dataclass
 class DuelResult:
     victory: bool
     fighter_end_hp: int
-    log: list[str]
+    # (turno, actor, daño, hp del objetivo tras el golpe)
+    events: list[tuple[int, int, int, int]]
+    username: str = ""
+
+    @property
+    def log(self) -> list[str]:
+        """Líneas de texto del duelo; solo se generan si alguien las pide."""
+        lines = []
+        for t, actor, dmg, target_hp in self.events:
+            if actor == DUEL_FIGHTER:
+                lines.append(f"T{t}: {self.username} golpea por {dmg} (enemigo {target_hp} HP)")
+            else:
+                lines.append(f"T{t}: enemigo golpea por {dmg} ({self.username} {target_hp} HP)")
+        return lines
 
 
 def simulate_duel(f: Fighter, enemy_hp: int, enemy_atk: int, enemy_def: int, max_turns: int = 50) -> DuelResult:
-    log = []
+    events = []
     p_hp = int(f.hp)
     e_hp = int(enemy_hp)
 
+    # el daño no cambia durante el duelo
+    dmg = max(1, f.attack - enemy_def)
+    edmg = max(1, enemy_atk - f.defense)
+
     for t in range(1, max_turns + 1):
         if p_hp <= 0 or e_hp <= 0:
             break
 
         # jugador pega
-        dmg = max(1, f.attack - enemy_def)
         e_hp -= dmg
-        log.append(f"T{t}: {f.username} golpea por {dmg} (enemigo {max(e_hp,0)} HP)")
+        events.append((t, DUEL_FIGHTER, dmg, max(e_hp, 0)))
         if e_hp <= 0:
             break
 
         # enemigo pega
-        edmg = max(1, enemy_atk - f.defense)
         p_hp -= edmg
-        log.append(f"T{t}: enemigo golpea por {edmg} ({f.username} {max(p_hp,0)} HP)")
+        events.append((t, DUEL_ENEMY, edmg, max(p_hp, 0)))
 
     victory = e_hp <= 0 and p_hp > 0
-    return DuelResult(victory=victory, fighter_end_hp=max(p_hp, 0), log=log)
+    return DuelResult(victory=victory, fighter_end_hp=max(p_hp, 0), events=events, username=f.username)
 
 
 def apply_enemy_stat_buffs(participants, enemy_snapshot: dict | None, killer_user_id: int | None):
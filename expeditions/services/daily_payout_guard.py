@@ -3,7 +3,7 @@ from django.utils import timezone
 from django.db import transaction
 
 from expeditions.models import ExpeditionDailyPayout, ExpeditionRunResult
-from notes.views import get_or_create_profile
+from notes.services.wallet import credit
 
 REWARDS = {1: 1000, 2: 500, 3: 300}
 
@@ -34,15 +34,13 @@ def try_pay_daily_top():
             if uid in paid_users:
                 continue
 
-            payout = ExpeditionDailyPayout.objects.create(
+            ExpeditionDailyPayout.objects.create(
                 day=day_to_pay,
                 user_id=uid,
                 coins=coins,
                 rank=rank,
             )
 
-            profile = get_or_create_profile(payout.user)
-            profile.coins += coins
-            profile.save(update_fields=["coins"])
+            credit(uid, coins=coins, reason="expedition_top")
 
             paid_users.add(uid)
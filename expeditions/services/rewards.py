@@ -2,6 +2,8 @@ from datetime import timedelta
 from django.db import transaction
 from django.utils import timezone
 
+from notes.services.wallet import credit
+
 from ..models import (
     ExpeditionDailyEarning,
     ExpeditionRunResult,
@@ -49,11 +51,8 @@ def grant_base_run_rewards(lobby, floor_reached: int):
         earning.earned_coins += add
         earning.save(update_fields=["earned_coins"])
 
-        # Sumamos al saldo real del usuario (tu sistema usa profile)
-        from notes.views import get_or_create_profile  # tu helper existente
-        profile = get_or_create_profile(earning.user)
-        profile.coins += add
-        profile.save(update_fields=["coins"])
+        # Sumamos al saldo real del usuario
+        credit(uid, coins=add, reason="expedition_run")
 
 
 @transaction.atomic
@@ -8,10 +8,15 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "noteboard.settings")
 django_asgi_app = get_asgi_application()
 
 import expeditions.routing  # noqa
+import notes.routing  # noqa
+from notes.scheduler import PeriodicSchedulerMiddleware  # noqa
 
-application = ProtocolTypeRouter({
+application = PeriodicSchedulerMiddleware(ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
-        URLRouter(expeditions.routing.websocket_urlpatterns)
+        URLRouter(
+            expeditions.routing.websocket_urlpatterns
+            + notes.routing.websocket_urlpatterns
+        )
     ),
-})
+}))
@@ -95,6 +95,11 @@ DATABASES = {
     )
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # La BD de test de SQLite en memoria no espera los bloqueos entre hilos:
+    # en un fichero corren también los tests de concurrencia
+    DATABASES['default']['TEST'] = {'NAME': str(BASE_DIR / 'test_db.sqlite3')}
+
 
 # ---------------------------------------------------------
 # AUTH PASSWORD VALIDATORS (DESACTIVADOS)
@@ -142,3 +147,23 @@ CHANNEL_LAYERS = {
         "BACKEND": "channels.layers.InMemoryChannelLayer",
     }
 }
+
+# World Boss: los turnos se avanzan en segundo plano dentro de daphne
+# (notes/scheduler.py). Alternativa manual: python manage.py world_boss_tick
+WORLD_BOSS_SCHEDULER_ENABLED = True
+
+# Gacha: resumen horario de tiradas en GachaRollStat, en el mismo scheduler
+# pero con su propio interruptor. Alternativa manual: python manage.py gacha_rollup
+GACHA_ROLLUP_SCHEDULER_ENABLED = True
+
+# Monedas / rubíes: cada movimiento de notes/services/wallet.py deja además
+# una fila en CurrencyLedgerEntry (desactivar para no guardar el historial)
+WALLET_LEDGER_ENABLED = True
+
+# Notificaciones leídas con más de estos días se borran con
+# `python manage.py purge_notifications` (las no leídas se conservan)
+NOTIFICATION_RETENTION_DAYS = 30
+
+# Avisos en vivo por WebSocket (notes/services/realtime.py): notificaciones
+# nuevas y saldos. Con varios procesos, CHANNEL_LAYERS debe ser compartido.
+REALTIME_PUSH_ENABLED = True
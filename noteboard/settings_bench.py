@@ -0,0 +1,22 @@
+"""
+Settings para los benchmarks de combate (python manage.py bench_combat
+--settings=noteboard.settings_bench). Usa SQLite en memoria: no necesita
+red ni Postgres y nunca toca la base de datos real.
+"""
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": ":memory:",
+        # Los tests (manage.py test) sí van a un fichero: los de concurrencia
+        # se saltan con SQLite en memoria
+        "TEST": {"NAME": str(BASE_DIR / "test_bench.sqlite3")},
+    }
+}
+
+WORLD_BOSS_SCHEDULER_ENABLED = False
+GACHA_ROLLUP_SCHEDULER_ENABLED = False
+
+# bench_combat se niega a correr si esto no está activo
+BENCHMARK_MODE = True
@@ -12,6 +12,8 @@ from .models import (
     TowerProgress,
     TowerBattleResult,
     GachaProbability,
+    GachaRollLog,
+    GachaRollStat,
     PvpRanking,
     PvpBattleLog,
     Trade,
@@ -19,19 +21,32 @@ from .models import (
     WorldBossParticipant,
     MiniBossLobby,
     MiniBossParticipant,
+    BattleLogEntry,
     MarketListing,
+    MarketPriceStat,
     VipShopOffer,
     Raffle,
-    RaffleEntry
+    RaffleEntry,
+    CurrencyLedgerEntry,
 )
 
+from .services.note_feed import recount_note_counters
+from .services.notifications import recount_unread
+
 # --- Notas -------------------------------------------------------
 
 @admin.register(Note)
 class NoteAdmin(admin.ModelAdmin):
-    list_display = ("id", "author", "recipient", "text", "created_at")
+    list_display = ("id", "author", "recipient", "text", "likes_count", "replies_count", "created_at")
     list_filter = ("created_at", "author", "recipient")
     search_fields = ("text", "author__username", "recipient__username")
+    readonly_fields = ("likes_count", "replies_count")
+    actions = ["recount_counters"]
+
+    @admin.action(description="Recalcular likes y respuestas")
+    def recount_counters(self, request, queryset):
+        updated = recount_note_counters(queryset)
+        self.message_user(request, f"Contadores recalculados en {updated} notas.")
 
 
 @admin.register(NoteLike)
@@ -53,6 +68,15 @@ class NotificationAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "message", "is_read", "created_at")
     list_filter = ("is_read", "created_at")
     search_fields = ("message", "user__username")
+    # is_read solo cambia vía services/notifications.py (mantiene el contador)
+    readonly_fields = ("is_read",)
+    actions = ["recount_unread_counters"]
+
+    @admin.action(description="Recalcular no leídas de sus usuarios")
+    def recount_unread_counters(self, request, queryset):
+        user_ids = set(queryset.values_list("user_id", flat=True))
+        updated = recount_unread(user_ids)
+        self.message_user(request, f"Contador de no leídas recalculado en {updated} perfiles.")
 
 
 @admin.register(InvitationCode)
@@ -115,6 +139,22 @@ class GachaProbabilityAdmin(admin.ModelAdmin):
     search_fields = ("rarity",)
 
 
+@admin.register(GachaRollLog)
+class GachaRollLogAdmin(admin.ModelAdmin):
+    list_display = ("user", "gacha_type", "rarity", "slot", "created_at")
+    list_filter = ("gacha_type", "rarity")
+    search_fields = ("user__username",)
+    raw_id_fields = ("user",)
+    # Millones de filas: sin COUNT(*) completo en el listado
+    show_full_result_count = False
+
+
+@admin.register(GachaRollStat)
+class GachaRollStatAdmin(admin.ModelAdmin):
+    list_display = ("period_start", "gacha_type", "rarity", "count")
+    list_filter = ("gacha_type", "rarity")
+
+
 # --- PvP --------------------------------------------------------
 
 @admin.register(PvpRanking)
@@ -180,14 +220,25 @@ class MiniBossParticipantAdmin(admin.ModelAdmin):
     search_fields = ("user__username",)
 
 
+@admin.register(BattleLogEntry)
+class BattleLogEntryAdmin(admin.ModelAdmin):
+    list_display = ("id", "cycle", "lobby", "turn")
+    raw_id_fields = ("cycle", "lobby")
+
+
 # --- Mercado ----------------------------------------------------
 
 @admin.register(MarketListing)
 class MarketListingAdmin(admin.ModelAdmin):
     list_display = ("id", "item", "seller", "buyer", "price_coins", "is_active", "created_at")
-    list_filter = ("is_active", "created_at")
+    list_filter = ("is_active", "rarity", "slot", "created_at")
     search_fields = ("item__name", "seller__username", "buyer__username")
 
+@admin.register(MarketPriceStat)
+class MarketPriceStatAdmin(admin.ModelAdmin):
+    list_display = ("day", "slot", "rarity", "sales", "min_price", "max_price", "total_coins")
+    list_filter = ("slot", "rarity", "day")
+
 @admin.register(VipShopOffer)
 class VipShopOfferAdmin(admin.ModelAdmin):
     list_display = ("id", "offer_type", "item", "ruby_amount", "price_coins", "price_rubies", "is_active", "created_by", "buyer", "created_at")
@@ -206,3 +257,12 @@ class RaffleEntryAdmin(admin.ModelAdmin):
     list_display = ("id", "raffle", "user", "weight", "created_at")
     list_filter = ("raffle",)
     search_fields = ("user__username", "raffle__title")
+
+
+@admin.register(CurrencyLedgerEntry)
+class CurrencyLedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ("user", "coins", "rubies", "reason", "created_at")
+    list_filter = ("reason",)
+    search_fields = ("user__username",)
+    raw_id_fields = ("user",)
+    show_full_result_count = False
@@ -0,0 +1,300 @@
+"""
+Benchmarks de los motores de combate (torre, PvP, duelo de expediciones,
+World Boss y minijefe). Los usa el comando bench_combat.
+
+Cada benchmark es una función prepare(size, seed) que crea los datos
+sintéticos (fuera de la medición) y devuelve el callable a medir.
+Todo usa RNG con semilla para que dos corridas hagan exactamente lo mismo.
+"""
+import gc
+import json
+import random
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.utils import timezone
+
+from expeditions.services.combat import Fighter, simulate_duel
+
+from .models import (
+    MiniBossLobby,
+    MiniBossParticipant,
+    UserProfile,
+    WorldBossCycle,
+    WorldBossParticipant,
+)
+from .services.miniboss import MINI_BOSS_TURN_SECONDS, advance_miniboss_battle
+from .services.world_boss import PREP_DURATION, advance_world_boss_battle
+from .views import enemy_stats_for_floor, simulate_battle, simulate_pvp_battle
+
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+DEFAULT_SEED = 1234
+
+# Turnos pendientes que resuelve cada benchmark de jefe
+BOSS_PENDING_TURNS = 60
+
+BENCH_USER_PREFIX = "bench_"
+
+
+def random_stats(rng):
+    return {
+        "hp": rng.randint(100, 1500),
+        "attack": rng.randint(10, 200),
+        "defense": rng.randint(0, 80),
+        "crit_chance": float(rng.randint(0, 40)),
+        "dodge_chance": float(rng.randint(0, 30)),
+        "speed": rng.randint(0, 20),
+    }
+
+
+def ensure_bench_users(count, seed=DEFAULT_SEED):
+    """
+    Crea (una sola vez) `count` usuarios sintéticos con perfil y snapshot de
+    stats aleatorio. Devuelve los primeros `count` usuarios de benchmark.
+    """
+    existing = User.objects.filter(username__startswith=BENCH_USER_PREFIX).count()
+    if existing < count:
+        rng = random.Random(seed + existing)
+        users = User.objects.bulk_create([
+            User(username=f"{BENCH_USER_PREFIX}{i}", password="!")
+            for i in range(existing, count)
+        ])
+        profiles = []
+        for user in users:
+            stats = random_stats(rng)
+            profiles.append(UserProfile(
+                user=user,
+                stats_hp=stats["hp"],
+                stats_attack=stats["attack"],
+                stats_defense=stats["defense"],
+                stats_crit_chance=stats["crit_chance"],
+                stats_dodge_chance=stats["dodge_chance"],
+                stats_speed=stats["speed"],
+            ))
+        UserProfile.objects.bulk_create(profiles, batch_size=1000)
+
+    return list(
+        User.objects
+        .filter(username__startswith=BENCH_USER_PREFIX)
+        .order_by("id")[:count]
+    )
+
+
+# ------------------------------------------------------------
+#  Benchmarks
+# ------------------------------------------------------------
+
+def prepare_tower(size, seed):
+    """`size` combates de torre contra pisos aleatorios."""
+    rng = random.Random(seed)
+    fights = [
+        (random_stats(rng), enemy_stats_for_floor(rng.randint(1, 40)))
+        for _ in range(size)
+    ]
+
+    def run():
+        random.seed(seed)
+        for user_stats, enemy in fights:
+            simulate_battle(user_stats, enemy)
+
+    return run
+
+
+def prepare_pvp(size, seed):
+    """`size` combates PvP entre usuarios sintéticos (1 consulta de stats por combate)."""
+    rng = random.Random(seed)
+    users = ensure_bench_users(max(size, 2), seed)
+    fights = [tuple(rng.sample(users, 2)) for _ in range(size)]
+
+    def run():
+        random.seed(seed)
+        for attacker, defender in fights:
+            simulate_pvp_battle(attacker, defender)
+
+    return run
+
+
+def prepare_duel(size, seed):
+    """`size` duelos de expedición."""
+    rng = random.Random(seed)
+    duels = []
+    for i in range(size):
+        stats = random_stats(rng)
+        fighter = Fighter(
+            username=f"{BENCH_USER_PREFIX}{i}",
+            max_hp=stats["hp"],
+            hp=stats["hp"],
+            attack=stats["attack"],
+            defense=stats["defense"],
+        )
+        enemy = enemy_stats_for_floor(rng.randint(1, 40))
+        duels.append((fighter, enemy))
+
+    def run():
+        for fighter, enemy in duels:
+            simulate_duel(fighter, enemy["hp"], enemy["attack"], enemy["defense"])
+
+    return run
+
+
+def prepare_world_boss(size, seed):
+    """Un ciclo de World Boss con `size` participantes y BOSS_PENDING_TURNS turnos pendientes."""
+    rng = random.Random(seed)
+    users = ensure_bench_users(size, seed)
+
+    WorldBossCycle.objects.all().delete()
+    cycle_start = timezone.localtime().replace(minute=0, second=0, microsecond=0)
+    cycle = WorldBossCycle.objects.create(start_time=cycle_start)
+    WorldBossParticipant.objects.bulk_create([
+        WorldBossParticipant(cycle=cycle, user=u, current_hp=rng.randint(100, 1500))
+        for u in users
+    ], batch_size=1000)
+
+    now_local = cycle_start + PREP_DURATION + timedelta(minutes=BOSS_PENDING_TURNS)
+
+    def run():
+        advance_world_boss_battle(cycle, now_local, cycle_start)
+
+    return run
+
+
+def prepare_miniboss(size, seed):
+    """Un lobby de minijefe con `size` participantes y BOSS_PENDING_TURNS turnos pendientes."""
+    rng = random.Random(seed)
+    users = ensure_bench_users(size, seed)
+
+    MiniBossLobby.objects.all().delete()
+    lobby = MiniBossLobby.objects.create(
+        creator=users[0],
+        boss_code="cat_commander",
+        status=MiniBossLobby.STATUS_RUNNING,
+        started_at=timezone.now() - timedelta(seconds=BOSS_PENDING_TURNS * MINI_BOSS_TURN_SECONDS),
+    )
+    MiniBossParticipant.objects.bulk_create([
+        MiniBossParticipant(lobby=lobby, user=u, hp_remaining=rng.randint(100, 1500))
+        for u in users
+    ], batch_size=1000)
+
+    def run():
+        advance_miniboss_battle(lobby)
+
+    return run
+
+
+BENCHMARKS = {
+    "tower": prepare_tower,
+    "pvp": prepare_pvp,
+    "duel": prepare_duel,
+    "world_boss": prepare_world_boss,
+    "miniboss": prepare_miniboss,
+}
+
+
+# ------------------------------------------------------------
+#  Medición y comparación con el baseline
+# ------------------------------------------------------------
+
+class QueryCounter:
+    """execute_wrapper que solo cuenta consultas (sin el tope de 9000 de queries_log)."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(prepare, size, seed=DEFAULT_SEED, repeat=3):
+    """
+    Mide un benchmark: mejor tiempo de `repeat` corridas, más una corrida
+    extra con tracemalloc (pico de memoria) y contando consultas SQL.
+    """
+    times = []
+    for _ in range(repeat):
+        run = prepare(size, seed)
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    run = prepare(size, seed)
+    gc.collect()
+    queries = QueryCounter()
+    tracemalloc.start()
+    try:
+        with connection.execute_wrapper(queries):
+            run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    best = min(times)
+    return {
+        "seconds": round(best, 6),
+        "ops_per_sec": round(size / best, 1) if best else None,
+        "peak_kb": round(peak / 1024, 1),
+        "queries": queries.count,
+    }
+
+
+def run_benchmarks(names=None, sizes=None, seed=DEFAULT_SEED, repeat=3, progress=None):
+    """Devuelve {nombre: {str(size): resultado}}."""
+    results = {}
+    for name in names or BENCHMARKS:
+        prepare = BENCHMARKS[name]
+        results[name] = {}
+        for size in sizes or DEFAULT_SIZES:
+            result = measure(prepare, size, seed=seed, repeat=repeat)
+            results[name][str(size)] = result
+            if progress:
+                progress(name, size, result)
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance=0.25):
+    """
+    Lista de regresiones respecto al baseline:
+      - ops/sec por debajo de baseline * (1 - tolerance)
+      - pico de memoria por encima de baseline * (1 + tolerance)
+      - cualquier consulta SQL extra (el número de consultas es determinista)
+    """
+    regressions = []
+    for name, by_size in results.items():
+        for size, result in by_size.items():
+            base = baseline.get(name, {}).get(size)
+            if not base:
+                continue
+
+            label = f"{name}[{size}]"
+            if base.get("ops_per_sec") and result["ops_per_sec"] < base["ops_per_sec"] * (1 - tolerance):
+                regressions.append(
+                    f"{label}: {result['ops_per_sec']} ops/s (baseline {base['ops_per_sec']})"
+                )
+            if base.get("peak_kb") and result["peak_kb"] > base["peak_kb"] * (1 + tolerance):
+                regressions.append(
+                    f"{label}: {result['peak_kb']} KB pico (baseline {base['peak_kb']})"
+                )
+            if result["queries"] > base.get("queries", 0):
+                regressions.append(
+                    f"{label}: {result['queries']} consultas (baseline {base['queries']})"
+                )
+    return regressions
+
+
+def load_baseline(path):
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, results):
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(results, fh, indent=2, sort_keys=True)
+        fh.write("\n")
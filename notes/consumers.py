@@ -0,0 +1,67 @@
+import json
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+
+from .models import UserProfile
+from .services.realtime import user_group
+
+
+@database_sync_to_async
+def get_counters(user_id: int):
+    row = (
+        UserProfile.objects
+        .filter(user_id=user_id)
+        .values("unread_notifications", "coins", "rubies")
+        .first()
+    )
+    return row or {"unread_notifications": 0, "coins": 0, "rubies": 0}
+
+
+class UserStreamConsumer(AsyncWebsocketConsumer):
+    """
+    Canal personal del usuario logueado (grupo "user_<id>"): recibe sus
+    notificaciones nuevas, el total sin leer y sus saldos cuando cambian
+    (los envía services/realtime.py). Solo servidor -> navegador.
+    """
+
+    async def connect(self):
+        user = self.scope.get("user")
+        if not user or not user.is_authenticated:
+            await self.close()
+            return
+
+        self.group_name = user_group(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+        # Estado actual, por si cambió entre la carga de la página y la conexión
+        counters = await get_counters(user.id)
+        await self.send(text_data=json.dumps({
+            "type": "state",
+            "unread": counters["unread_notifications"],
+            "coins": counters["coins"],
+            "rubies": counters["rubies"],
+        }))
+
+    async def disconnect(self, code):
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def notification_msg(self, event):
+        await self.send(text_data=json.dumps({
+            "type": "notification",
+            "message": event["message"],
+            "url": event["url"],
+            "unread": event["unread"],
+        }))
+
+    async def unread_msg(self, event):
+        await self.send(text_data=json.dumps({"type": "unread", "unread": event["unread"]}))
+
+    async def balance_msg(self, event):
+        await self.send(text_data=json.dumps({
+            "type": "balance",
+            "coins": event["coins"],
+            "rubies": event["rubies"],
+        }))
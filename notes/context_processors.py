@@ -1,6 +1,4 @@
-from .models import Notification, UserProfile
-
-MODERATOR_GROUP_NAME = "moderador"
+from .services.user_context import get_user_context
 
 
 def notifications_context(request):
@@ -9,25 +7,18 @@ def notifications_context(request):
     user_coins = 0
     user_rubies = 0
 
-    if request.user.is_authenticated:
-        unread_count = Notification.objects.filter(
-            user=request.user,
-            is_read=False,
-        ).count()
-
-        is_moderator = (
-            request.user.is_superuser
-            or request.user.groups.filter(name__iexact=MODERATOR_GROUP_NAME).exists()
-        )
-
-        # Asegurar que el usuario tenga perfil y leer sus monedas
-        profile, _ = UserProfile.objects.get_or_create(user=request.user)
-        user_coins = profile.coins
-        user_rubies = profile.rubies
+    # Perfil, moderador y no leídas salen de una sola consulta, compartida
+    # con la vista (services/user_context.py)
+    ctx = get_user_context(request)
+    if ctx is not None:
+        unread_count = ctx.unread_count
+        is_moderator = ctx.is_moderator
+        user_coins = ctx.profile.coins
+        user_rubies = ctx.profile.rubies
 
     return {
         "unread_notifications_count": unread_count,
         "is_moderator": is_moderator,
         "user_coins": user_coins,
-        "user_rubies": user_rubies, 
+        "user_rubies": user_rubies,
     }
@@ -0,0 +1,102 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.benchmarks import (
+    BENCHMARKS,
+    DEFAULT_SEED,
+    DEFAULT_SIZES,
+    compare_to_baseline,
+    load_baseline,
+    run_benchmarks,
+    save_baseline,
+)
+
+
+DEFAULT_BASELINE = Path(__file__).resolve().parents[2] / "bench_baseline.json"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks de los motores de combate sobre SQLite en memoria. "
+        "Uso: python manage.py bench_combat --settings=noteboard.settings_bench"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--only",
+            nargs="+",
+            choices=sorted(BENCHMARKS),
+            help="Solo estos benchmarks.",
+        )
+        parser.add_argument(
+            "--sizes",
+            nargs="+",
+            type=int,
+            default=DEFAULT_SIZES,
+            help="Número de participantes/combates (por defecto 10 100 1000 10000).",
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+        parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.25,
+            help="Margen permitido en ops/sec y memoria antes de marcar regresión.",
+        )
+        parser.add_argument(
+            "--update-baseline",
+            action="store_true",
+            help="Guardar los resultados como nuevo baseline.",
+        )
+
+    def handle(self, *args, **options):
+        # Crea miles de usuarios sintéticos: jamás contra la BD real
+        if not getattr(settings, "BENCHMARK_MODE", False):
+            raise CommandError(
+                "Ejecuta los benchmarks con --settings=noteboard.settings_bench."
+            )
+
+        call_command("migrate", verbosity=0, interactive=False)
+
+        self.stdout.write(
+            f"{'benchmark':<12} {'size':>6} {'seg':>10} {'ops/s':>12} {'pico KB':>10} {'SQL':>6}"
+        )
+
+        def progress(name, size, result):
+            self.stdout.write(
+                f"{name:<12} {size:>6} {result['seconds']:>10.4f} "
+                f"{result['ops_per_sec']:>12} {result['peak_kb']:>10} {result['queries']:>6}"
+            )
+
+        results = run_benchmarks(
+            names=options["only"],
+            sizes=options["sizes"],
+            seed=options["seed"],
+            repeat=options["repeat"],
+            progress=progress,
+        )
+
+        baseline = load_baseline(options["baseline"])
+
+        if options["update_baseline"]:
+            for name, by_size in results.items():
+                baseline.setdefault(name, {}).update(by_size)
+            save_baseline(options["baseline"], baseline)
+            self.stdout.write(self.style.SUCCESS(f"Baseline guardado en {options['baseline']}."))
+            return
+
+        if not baseline:
+            self.stdout.write(self.style.WARNING("No hay baseline guardado; usa --update-baseline."))
+            return
+
+        regressions = compare_to_baseline(results, baseline, options["tolerance"])
+        if regressions:
+            for line in regressions:
+                self.stdout.write(self.style.ERROR(line))
+            raise CommandError(f"{len(regressions)} regresiones respecto al baseline.")
+
+        self.stdout.write(self.style.SUCCESS("Sin regresiones respecto al baseline."))
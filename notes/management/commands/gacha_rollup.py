@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from notes.services.gacha_audit import rollup_gacha_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Resume en GachaRollStat las horas cerradas del log de tiradas del gacha. "
+        "El scheduler de daphne ya lo hace cada minuto (GACHA_ROLLUP_SCHEDULER_ENABLED); "
+        "esto es para cron o backfill."
+    )
+
+    def handle(self, *args, **options):
+        written = rollup_gacha_stats(timezone.now())
+        self.stdout.write(self.style.SUCCESS(f"{written} filas de estadísticas actualizadas."))
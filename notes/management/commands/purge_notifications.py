@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from notes.services.notifications import PURGE_BATCH_SIZE, purge_read_notifications
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra en tandas las notificaciones ya leídas más antiguas que "
+        "NOTIFICATION_RETENTION_DAYS (pensado para cron, ej. una vez al día)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=None,
+            help="Antigüedad mínima en días (por defecto, la del settings).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=PURGE_BATCH_SIZE,
+            help="Notificaciones borradas por tanda.",
+        )
+
+    def handle(self, *args, **options):
+        deleted = purge_read_notifications(days=options["days"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"{deleted} notificaciones leídas borradas."))
@@ -0,0 +1,28 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from notes.scheduler import WORLD_BOSS_JOB, PeriodicScheduler
+from notes.services.world_boss import tick_world_boss
+
+
+class Command(BaseCommand):
+    help = "Avanza los turnos del World Boss actual (un tick, o en bucle con --loop)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Seguir avanzando cada minuto (sin usar el scheduler de daphne).",
+        )
+
+    def handle(self, *args, **options):
+        if options["loop"]:
+            asyncio.run(PeriodicScheduler(jobs=[WORLD_BOSS_JOB]).run())
+            return
+
+        cycle = tick_world_boss(timezone.now())
+        self.stdout.write(self.style.SUCCESS(
+            f"{cycle}: {cycle.turns_processed} turnos, daño total {cycle.total_damage}."
+        ))
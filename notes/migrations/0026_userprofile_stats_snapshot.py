@@ -0,0 +1,122 @@
+# Generated by Django 5.2.8 on 2026-10-16 23:30
+
+from django.db import migrations, models
+
+# Copia congelada de notes/services/stats.py tal como estaba al crear esta
+# migración: el backfill no debe cambiar aunque el servicio cambie después.
+GEAR_FIELDS = [
+    "equipped_weapon",
+    "equipped_helmet",
+    "equipped_armor",
+    "equipped_pants",
+    "equipped_boots",
+    "equipped_shield",
+    "equipped_amulet1",
+    "equipped_amulet2",
+    "equipped_amulet3",
+]
+EQUIPMENT_FIELDS = GEAR_FIELDS + ["equipped_pet"]
+
+SNAPSHOT_FIELDS = {
+    "hp": "stats_hp",
+    "attack": "stats_attack",
+    "defense": "stats_defense",
+    "crit_chance": "stats_crit_chance",
+    "dodge_chance": "stats_dodge_chance",
+    "speed": "stats_speed",
+}
+
+
+def compute_total_stats(gear_items, pet=None):
+    """Stats base + equipo plano, y luego los % de la mascota sobre la suma."""
+    total = {
+        "hp": 100,
+        "attack": 10,
+        "defense": 0,
+        "crit_chance": 0.0,
+        "dodge_chance": 0.0,
+        "speed": 0,
+    }
+
+    for item in gear_items:
+        if item is None:
+            continue
+        total["hp"] += item.hp
+        total["attack"] += item.attack
+        total["defense"] += item.defense
+        total["crit_chance"] += item.crit_chance
+        total["dodge_chance"] += item.dodge_chance
+        total["speed"] += item.speed
+
+    if pet is not None:
+        hp_pct = getattr(pet, "hp_pct", 0.0) or 0.0
+        atk_pct = getattr(pet, "attack_pct", 0.0) or 0.0
+        def_pct = getattr(pet, "defense_pct", 0.0) or 0.0
+
+        total["hp"] += int(total["hp"] * (hp_pct / 100.0))
+        total["attack"] += int(total["attack"] * (atk_pct / 100.0))
+        total["defense"] += int(total["defense"] * (def_pct / 100.0))
+
+    return total
+
+
+def backfill_stats_snapshot(apps, schema_editor):
+    UserProfile = apps.get_model("notes", "UserProfile")
+    CombatItem = apps.get_model("notes", "CombatItem")
+
+    id_fields = [f"{f}_id" for f in EQUIPMENT_FIELDS]
+    profiles = list(UserProfile.objects.all())
+    equipped_ids = {
+        getattr(p, f) for p in profiles for f in id_fields if getattr(p, f)
+    }
+    items_by_id = CombatItem.objects.in_bulk(equipped_ids)
+
+    for p in profiles:
+        gear = [items_by_id.get(getattr(p, f"{f}_id")) for f in GEAR_FIELDS]
+        pet = items_by_id.get(p.equipped_pet_id)
+        total = compute_total_stats(gear, pet)
+        for stat, column in SNAPSHOT_FIELDS.items():
+            setattr(p, column, total[stat])
+
+    UserProfile.objects.bulk_update(profiles, list(SNAPSHOT_FIELDS.values()), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0025_alter_gachaprobability_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='stats_attack',
+            field=models.IntegerField(default=10),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='stats_crit_chance',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='stats_defense',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='stats_dodge_chance',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='stats_hp',
+            field=models.IntegerField(default=100),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='stats_speed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_stats_snapshot, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.8 on 2026-10-16 23:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_old_logs(apps, schema_editor):
+    """Los logs antiguos se copian enteros como una sola entrada (turno 0)."""
+    WorldBossCycle = apps.get_model("notes", "WorldBossCycle")
+    MiniBossLobby = apps.get_model("notes", "MiniBossLobby")
+    BattleLogEntry = apps.get_model("notes", "BattleLogEntry")
+
+    entries = [
+        BattleLogEntry(cycle_id=pk, turn=0, text=text)
+        for pk, text in WorldBossCycle.objects.exclude(battle_log="").values_list("id", "battle_log")
+    ]
+    entries += [
+        BattleLogEntry(lobby_id=pk, turn=0, text=text)
+        for pk, text in MiniBossLobby.objects.exclude(log_text="").values_list("id", "log_text")
+    ]
+    BattleLogEntry.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0026_userprofile_stats_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BattleLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('turn', models.PositiveIntegerField(default=0)),
+                ('text', models.TextField()),
+                ('cycle', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='log_entries', to='notes.worldbosscycle')),
+                ('lobby', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='log_entries', to='notes.minibosslobby')),
+            ],
+            options={
+                'ordering': ['turn', 'id'],
+                'indexes': [models.Index(fields=['cycle', 'turn'], name='notes_battl_cycle_i_5bfdea_idx'), models.Index(fields=['lobby', 'turn'], name='notes_battl_lobby_i_21e05b_idx')],
+            },
+        ),
+        migrations.RunPython(copy_old_logs, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='minibosslobby',
+            name='log_text',
+        ),
+        migrations.RemoveField(
+            model_name='worldbosscycle',
+            name='battle_log',
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-16 23:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0027_battle_log_entries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pvpbattlelog',
+            name='log_events',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+        migrations.AddField(
+            model_name='towerbattleresult',
+            name='log_events',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+        migrations.AlterField(
+            model_name='pvpbattlelog',
+            name='log_text',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AlterField(
+            model_name='towerbattleresult',
+            name='log_text',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:09
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Max
+
+
+def backfill_pvp_rankings(apps, schema_editor):
+    """
+    Antes los rankings se creaban en cada visita a la arena; a partir de
+    ahora se crean al registrarse. Aquí se crean los que falten, de una vez.
+    """
+    User = apps.get_model("auth", "User")
+    PvpRanking = apps.get_model("notes", "PvpRanking")
+
+    missing = list(
+        User.objects
+        .filter(pvp_ranking__isnull=True)
+        .order_by("date_joined", "id")
+        .values_list("id", flat=True)
+    )
+    next_pos = (PvpRanking.objects.aggregate(Max("position"))["position__max"] or 0) + 1
+    PvpRanking.objects.bulk_create(
+        [PvpRanking(user_id=uid, position=next_pos + i) for i, uid in enumerate(missing)],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notes', '0028_compact_combat_logs'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_pvp_rankings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0029_backfill_pvp_rankings'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pvpranking',
+            name='position',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AddConstraint(
+            model_name='pvpranking',
+            constraint=models.UniqueConstraint(fields=('position',), name='unique_pvp_position'),
+        ),
+    ]
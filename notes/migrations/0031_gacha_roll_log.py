@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:24
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0030_pvp_position_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GachaRollStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateTimeField()),
+                ('gacha_type', models.CharField(choices=[('normal', 'Gacha normal'), ('premium', 'Gacha premium')], max_length=20)),
+                ('rarity', models.CharField(blank=True, choices=[('basic', 'Básica'), ('uncommon', 'Poco común'), ('special', 'Especial'), ('epic', 'Épica'), ('legendary', 'Legendaria'), ('mythic', 'Mítica'), ('ascended', 'Ascendida')], max_length=20)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['period_start', 'gacha_type', 'rarity'],
+                'constraints': [models.UniqueConstraint(fields=('gacha_type', 'period_start', 'rarity'), name='unique_gacha_roll_stat')],
+            },
+        ),
+        migrations.CreateModel(
+            name='GachaRollLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gacha_type', models.CharField(choices=[('normal', 'Gacha normal'), ('premium', 'Gacha premium')], max_length=20)),
+                ('rarity', models.CharField(blank=True, choices=[('basic', 'Básica'), ('uncommon', 'Poco común'), ('special', 'Especial'), ('epic', 'Épica'), ('legendary', 'Legendaria'), ('mythic', 'Mítica'), ('ascended', 'Ascendida')], max_length=20)),
+                ('slot', models.CharField(blank=True, choices=[('weapon', 'Arma'), ('helmet', 'Casco'), ('armor', 'Armadura'), ('pants', 'Pantalones'), ('boots', 'Botas'), ('shield', 'Escudo'), ('amulet', 'Amuleto'), ('pet', 'Mascota')], max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gacha_rolls', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='notes_gacha_created_e98202_idx')],
+            },
+        ),
+    ]
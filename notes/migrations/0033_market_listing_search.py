@@ -0,0 +1,58 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:52
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_listing_rarity_slot(apps, schema_editor):
+    """Copia rarity / slot del ítem a las ofertas ya existentes (un UPDATE)."""
+    MarketListing = apps.get_model("notes", "MarketListing")
+    CombatItem = apps.get_model("notes", "CombatItem")
+    items = CombatItem.objects.filter(id=OuterRef("item_id"))
+    MarketListing.objects.update(
+        rarity=Subquery(items.values("rarity")[:1]),
+        slot=Subquery(items.values("slot")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0032_currency_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marketlisting',
+            name='rarity',
+            field=models.CharField(blank=True, choices=[('basic', 'Básica'), ('uncommon', 'Poco común'), ('special', 'Especial'), ('epic', 'Épica'), ('legendary', 'Legendaria'), ('mythic', 'Mítica'), ('ascended', 'Ascendida')], max_length=20),
+        ),
+        migrations.AddField(
+            model_name='marketlisting',
+            name='slot',
+            field=models.CharField(blank=True, choices=[('weapon', 'Arma'), ('helmet', 'Casco'), ('armor', 'Armadura'), ('pants', 'Pantalones'), ('boots', 'Botas'), ('shield', 'Escudo'), ('amulet', 'Amuleto'), ('pet', 'Mascota')], max_length=20),
+        ),
+        migrations.RunPython(backfill_listing_rarity_slot, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='marketlisting',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['price_coins', 'id'], name='market_active_price'),
+        ),
+        migrations.AddIndex(
+            model_name='marketlisting',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['rarity', 'price_coins', 'id'], name='market_active_rarity_price'),
+        ),
+        migrations.AddIndex(
+            model_name='marketlisting',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['slot', 'price_coins', 'id'], name='market_active_slot_price'),
+        ),
+        migrations.AddIndex(
+            model_name='marketlisting',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at', 'id'], name='market_active_new'),
+        ),
+        migrations.AddIndex(
+            model_name='marketlisting',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['rarity', 'created_at', 'id'], name='market_active_rarity_new'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0033_market_listing_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketPriceStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('slot', models.CharField(choices=[('weapon', 'Arma'), ('helmet', 'Casco'), ('armor', 'Armadura'), ('pants', 'Pantalones'), ('boots', 'Botas'), ('shield', 'Escudo'), ('amulet', 'Amuleto'), ('pet', 'Mascota')], max_length=20)),
+                ('rarity', models.CharField(choices=[('basic', 'Básica'), ('uncommon', 'Poco común'), ('special', 'Especial'), ('epic', 'Épica'), ('legendary', 'Legendaria'), ('mythic', 'Mítica'), ('ascended', 'Ascendida')], max_length=20)),
+                ('sales', models.PositiveIntegerField(default=0)),
+                ('total_coins', models.PositiveBigIntegerField(default=0)),
+                ('min_price', models.PositiveIntegerField(default=0)),
+                ('max_price', models.PositiveIntegerField(default=0)),
+                ('price_buckets', models.JSONField(default=dict)),
+            ],
+            options={
+                'ordering': ['-day', 'slot', 'rarity'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'slot', 'rarity'), name='unique_market_price_stat')],
+            },
+        ),
+    ]
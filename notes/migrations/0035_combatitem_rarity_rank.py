@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0034_market_price_stat'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='combatitem',
+            name='rarity_rank',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(rarity='basic', then=models.Value(0)), models.When(rarity='uncommon', then=models.Value(1)), models.When(rarity='special', then=models.Value(2)), models.When(rarity='epic', then=models.Value(3)), models.When(rarity='legendary', then=models.Value(4)), models.When(rarity='mythic', then=models.Value(5)), models.When(rarity='ascended', then=models.Value(6)), default=models.Value(0)), output_field=models.PositiveSmallIntegerField()),
+        ),
+        migrations.AddIndex(
+            model_name='combatitem',
+            index=models.Index(fields=['owner', 'rarity_rank', 'id'], name='item_owner_rank'),
+        ),
+        migrations.AddIndex(
+            model_name='combatitem',
+            index=models.Index(fields=['owner', 'slot', 'rarity_rank', 'id'], name='item_owner_slot_rank'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread_counts(apps, schema_editor):
+    """Inicializa el contador con las no leídas actuales (un UPDATE)."""
+    UserProfile = apps.get_model("notes", "UserProfile")
+    Notification = apps.get_model("notes", "Notification")
+    unread = (
+        Notification.objects
+        .filter(user=OuterRef("user_id"), is_read=False)
+        .order_by()
+        .values("user")
+        .annotate(n=Count("id"))
+        .values("n")
+    )
+    UserProfile.objects.update(
+        unread_notifications=Coalesce(Subquery(unread, output_field=IntegerField()), Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0035_combatitem_rarity_rank'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='unread_notifications',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_unread_counts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read'], name='notif_user_unread'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-id'], name='notif_user_recent'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:16
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_note_counters(apps, schema_editor):
+    """Inicializa likes_count y replies_count con los totales actuales (un UPDATE)."""
+    Note = apps.get_model("notes", "Note")
+
+    def counter(model_name):
+        rows = (
+            apps.get_model("notes", model_name).objects
+            .filter(note=OuterRef("pk"))
+            .order_by()
+            .values("note")
+            .annotate(n=Count("id"))
+            .values("n")
+        )
+        return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+    Note.objects.update(likes_count=counter("NoteLike"), replies_count=counter("NoteReply"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0036_unread_notifications_counter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='replies_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_note_counters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['recipient', '-likes_count', '-created_at'], name='note_recipient_likes'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0037_note_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['recipient', '-created_at'], name='note_recipient_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['author', 'recipient', '-created_at'], name='note_author_recipient_recent'),
+        ),
+    ]
@@ -4,6 +4,8 @@ import string
 import random
 from django.utils import timezone
 
+from .services.combat_log import render_pvp_log, render_tower_log, unpack_events
+
 
 def generate_invitation_code(length=8):
     chars = string.ascii_uppercase + string.digits
@@ -24,8 +26,27 @@ class Note(models.Model):
     text = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Contadores desnormalizados: los mantiene services/note_feed.py al dar
+    # like / quitarlo y al responder (así el muro no agrega COUNT por página)
+    likes_count = models.PositiveIntegerField(default=0)
+    replies_count = models.PositiveIntegerField(default=0)
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # "Más likeadas": recorrido por índice con paginación por cursor
+            models.Index(
+                fields=['recipient', '-likes_count', '-created_at'],
+                name='note_recipient_likes',
+            ),
+            # Muro público (recipient NULL) y privadas recibidas, por fecha
+            models.Index(fields=['recipient', '-created_at'], name='note_recipient_recent'),
+            # Privadas enviadas
+            models.Index(
+                fields=['author', 'recipient', '-created_at'],
+                name='note_author_recipient_recent',
+            ),
+        ]
 
     def __str__(self):
         if self.recipient:
@@ -81,6 +102,11 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=["user", "is_read"], name="notif_user_unread"),
+            # Historial paginado por cursor (id descendente)
+            models.Index(fields=["user", "-id"], name="notif_user_recent"),
+        ]
 
     def __str__(self):
         estado = "NUEVA" if not self.is_read else "leída"
@@ -124,6 +150,10 @@ class UserProfile(models.Model):
 
     auto_sell_rarities = models.CharField(max_length=200, blank=True, default="")
 
+    # Notificaciones sin leer; lo mantiene services/notifications.py al
+    # crear y al marcar como leídas (así ninguna página hace COUNT)
+    unread_notifications = models.PositiveIntegerField(default=0)
+
     # Equipamiento actual
     equipped_weapon = models.ForeignKey(
         'CombatItem', null=True, blank=True,
@@ -167,6 +197,15 @@ class UserProfile(models.Model):
         on_delete=models.SET_NULL, related_name='+'
     )
 
+    # Snapshot de stats de combate (equipo + mascota).
+    # Se recalcula solo cuando cambia el equipamiento (ver notes/services/stats.py).
+    stats_hp = models.IntegerField(default=100)
+    stats_attack = models.IntegerField(default=10)
+    stats_defense = models.IntegerField(default=0)
+    stats_crit_chance = models.FloatField(default=0.0)
+    stats_dodge_chance = models.FloatField(default=0.0)
+    stats_speed = models.IntegerField(default=0)
+
     def __str__(self):
         return f"Perfil de {self.user.username} (monedas: {self.coins})"
 
@@ -247,8 +286,25 @@ class CombatItem(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Orden real de la rareza (0 = básica ... 6 = ascendida). Lo calcula la
+    # BD a partir de `rarity`, así que también vale con bulk_create.
+    rarity_rank = models.GeneratedField(
+        expression=models.Case(
+            *[models.When(rarity=code, then=models.Value(rank))
+              for rank, code in enumerate(ItemRarity.values)],
+            default=models.Value(0),
+        ),
+        output_field=models.PositiveSmallIntegerField(),
+        db_persist=True,
+    )
+
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Inventario paginado por cursor: rareza desc, más nuevos primero
+            models.Index(fields=["owner", "rarity_rank", "id"], name="item_owner_rank"),
+            models.Index(fields=["owner", "slot", "rarity_rank", "id"], name="item_owner_slot_rank"),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.get_rarity_display()} - {self.get_slot_display()})"
@@ -276,7 +332,9 @@ class TowerBattleResult(models.Model):
     )
     floor = models.PositiveIntegerField()
     victory = models.BooleanField(default=False)
-    log_text = models.TextField()
+    # Log antiguo en texto; los combates nuevos guardan log_events (empaquetado)
+    log_text = models.TextField(blank=True, default="")
+    log_events = models.BinaryField(blank=True, default=b"")
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -286,6 +344,13 @@ class TowerBattleResult(models.Model):
         estado = "Victoria" if self.victory else "Derrota"
         return f"{self.user.username} - Piso {self.floor} ({estado})"
 
+    def render_log(self):
+        """Texto del combate, generado a partir de los eventos solo al mostrarlo."""
+        if self.log_text:
+            return self.log_text
+        _, events = unpack_events(self.log_events)
+        return render_tower_log(events)
+
 
 class GachaProbability(models.Model):
     gacha_type = models.CharField(
@@ -309,6 +374,55 @@ class GachaProbability(models.Model):
         return f"[{self.get_gacha_type_display()}] {self.get_rarity_display()}: {self.probability:.6f}"
 
 
+class GachaRollLog(models.Model):
+    """
+    Registro de solo-inserción de cada tirada de gacha (también las auto
+    vendidas y las de rubí). Se escribe con bulk_create, una vez por tanda.
+    rarity vacío = +1 rubí (premium).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="gacha_rolls",
+    )
+    gacha_type = models.CharField(max_length=20, choices=GachaType.choices)
+    rarity = models.CharField(max_length=20, choices=ItemRarity.choices, blank=True)
+    slot = models.CharField(max_length=20, choices=ItemSlot.choices, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Agregación por horas (rollup) y conteo de la hora en curso
+            models.Index(fields=["created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.gacha_type} {self.rarity or 'rubí'} ({self.created_at:%Y-%m-%d %H:%M})"
+
+
+class GachaRollStat(models.Model):
+    """
+    Tiradas por hora, tipo de gacha y rareza, precalculadas a partir de
+    GachaRollLog. El informe de tasas solo lee esta tabla (más la hora en curso).
+    """
+    period_start = models.DateTimeField()
+    gacha_type = models.CharField(max_length=20, choices=GachaType.choices)
+    rarity = models.CharField(max_length=20, choices=ItemRarity.choices, blank=True)
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        ordering = ["period_start", "gacha_type", "rarity"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["gacha_type", "period_start", "rarity"],
+                name="unique_gacha_roll_stat",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.period_start:%Y-%m-%d %H:00} {self.gacha_type} {self.rarity or 'rubí'}: {self.count}"
+
+
 # --- PVP ARENA -------------------------------------------------------
 
 class PvpRanking(models.Model):
@@ -321,12 +435,17 @@ class PvpRanking(models.Model):
         on_delete=models.CASCADE,
         related_name="pvp_ranking",
     )
-    position = models.PositiveIntegerField(unique=True)
+    position = models.PositiveIntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
     last_reward_date = models.DateField(null=True, blank=True)
 
     class Meta:
         ordering = ["position"]
+        constraints = [
+            # UNIQUE inmediato en todos los motores (SQLite ignora los DEFERRABLE):
+            # el intercambio tras un desafío pasa por el puesto 0 (services/pvp.py)
+            models.UniqueConstraint(fields=["position"], name="unique_pvp_position"),
+        ]
 
     def __str__(self):
         return f"PvP #{self.position} - {self.user.username}"
@@ -356,7 +475,9 @@ class PvpBattleLog(models.Model):
     )
     attacker_won = models.BooleanField()
     created_at = models.DateTimeField(auto_now_add=True)
-    log_text = models.TextField()
+    # Log antiguo en texto; los combates nuevos guardan log_events (empaquetado)
+    log_text = models.TextField(blank=True, default="")
+    log_events = models.BinaryField(blank=True, default=b"")
 
     class Meta:
         ordering = ["-created_at"]
@@ -365,6 +486,15 @@ class PvpBattleLog(models.Model):
         result = "ganó" if self.attacker_won else "perdió"
         return f"{self.attacker.username} {result} contra {self.defender.username} (PvP)"
 
+    def render_log(self):
+        """Texto del combate, generado a partir de los eventos solo al mostrarlo."""
+        if self.log_text:
+            return self.log_text
+        start_hp, events = unpack_events(self.log_events)
+        return render_pvp_log(
+            events, start_hp, self.attacker.username, self.defender.username
+        )
+
 class Trade(models.Model):
     STATUS_PENDING = "pending"
     STATUS_ACCEPTED = "accepted"
@@ -505,8 +635,6 @@ class WorldBossCycle(models.Model):
     finished = models.BooleanField(default=False)
     rewards_given = models.BooleanField(default=False)
 
-    battle_log = models.TextField(blank=True, default="")
-
     class Meta:
         ordering = ["-start_time"]
         unique_together = ("start_time",)
@@ -571,7 +699,6 @@ class MiniBossLobby(models.Model):
 
     current_turn = models.IntegerField(default=0)
     total_damage = models.IntegerField(default=0)
-    log_text = models.TextField(blank=True, default="")
 
     def __str__(self):
         return f"Lobby #{self.id} - {self.boss_code} ({self.status})"
@@ -597,6 +724,42 @@ class MiniBossParticipant(models.Model):
     def __str__(self):
         return f"{self.user.username} en lobby {self.lobby_id}"
 
+class BattleLogEntry(models.Model):
+    """
+    Un turno del registro de batalla de un World Boss o de un lobby de minijefe.
+    Solo se insertan filas (nunca se reescribe el log entero) y las vistas
+    leen el log paginado por turno.
+    """
+    cycle = models.ForeignKey(
+        WorldBossCycle,
+        on_delete=models.CASCADE,
+        related_name="log_entries",
+        null=True,
+        blank=True,
+    )
+    lobby = models.ForeignKey(
+        MiniBossLobby,
+        on_delete=models.CASCADE,
+        related_name="log_entries",
+        null=True,
+        blank=True,
+    )
+    # 0 = mensajes previos al primer turno (ej. "Comienza la batalla...")
+    turn = models.PositiveIntegerField(default=0)
+    text = models.TextField()
+
+    class Meta:
+        ordering = ["turn", "id"]
+        indexes = [
+            models.Index(fields=["cycle", "turn"]),
+            models.Index(fields=["lobby", "turn"]),
+        ]
+
+    def __str__(self):
+        owner = f"ciclo {self.cycle_id}" if self.cycle_id else f"lobby {self.lobby_id}"
+        return f"Log {owner} - turno {self.turn}"
+
+
 class MarketListing(models.Model):
     item = models.OneToOneField(
         CombatItem,
@@ -619,13 +782,81 @@ class MarketListing(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Copia de item.rarity / item.slot (no cambian nunca): los filtros y
+    # órdenes del mercado se resuelven con índices de esta tabla, sin JOIN
+    rarity = models.CharField(max_length=20, choices=ItemRarity.choices, blank=True)
+    slot = models.CharField(max_length=20, choices=ItemSlot.choices, blank=True)
+
     class Meta:
         ordering = ["-created_at"]
+        # Índices parciales: solo las ofertas activas (las vendidas se acumulan)
+        indexes = [
+            models.Index(
+                fields=["price_coins", "id"],
+                condition=models.Q(is_active=True),
+                name="market_active_price",
+            ),
+            models.Index(
+                fields=["rarity", "price_coins", "id"],
+                condition=models.Q(is_active=True),
+                name="market_active_rarity_price",
+            ),
+            models.Index(
+                fields=["slot", "price_coins", "id"],
+                condition=models.Q(is_active=True),
+                name="market_active_slot_price",
+            ),
+            models.Index(
+                fields=["created_at", "id"],
+                condition=models.Q(is_active=True),
+                name="market_active_new",
+            ),
+            models.Index(
+                fields=["rarity", "created_at", "id"],
+                condition=models.Q(is_active=True),
+                name="market_active_rarity_new",
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self.rarity or not self.slot:
+            self.rarity = self.item.rarity
+            self.slot = self.item.slot
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.item.name} por {self.price_coins} monedas ({self.seller.username})"
 
 
+class MarketPriceStat(models.Model):
+    """
+    Ventas del mercado por día, slot y rareza, acumuladas en cada compra
+    (ver services/market.record_sale). Los precios sugeridos se calculan
+    sumando unas pocas filas, sin recorrer el historial de ofertas.
+    """
+    day = models.DateField()
+    slot = models.CharField(max_length=20, choices=ItemSlot.choices)
+    rarity = models.CharField(max_length=20, choices=ItemRarity.choices)
+    sales = models.PositiveIntegerField(default=0)
+    total_coins = models.PositiveBigIntegerField(default=0)
+    min_price = models.PositiveIntegerField(default=0)
+    max_price = models.PositiveIntegerField(default=0)
+    # {bucket: ventas}, buckets logarítmicos de precio para estimar la mediana
+    price_buckets = models.JSONField(default=dict)
+
+    class Meta:
+        ordering = ["-day", "slot", "rarity"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "slot", "rarity"],
+                name="unique_market_price_stat",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.slot}/{self.rarity}: {self.sales} ventas"
+
+
 class VipShopOffer(models.Model):
     TYPE_ITEM = "item"
     TYPE_RUBIES = "rubies"
@@ -742,4 +973,29 @@ class RaffleEntry(models.Model):
         ordering = ["-created_at"]
 
     def __str__(self):
-        return f"{self.user.username} x{self.weight} en {self.raffle.title}"
\ No newline at end of file
+        return f"{self.user.username} x{self.weight} en {self.raffle.title}"
+
+class CurrencyLedgerEntry(models.Model):
+    """
+    Movimiento de monedas / rubíes de un usuario (solo inserción).
+    Lo escribe services/wallet.py si WALLET_LEDGER_ENABLED está activo.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="ledger_entries",
+    )
+    coins = models.IntegerField(default=0)
+    rubies = models.IntegerField(default=0)
+    # Origen del movimiento: "gacha", "tower", "market_buy", ...
+    reason = models.CharField(max_length=40)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["-created_at", "-id"]
+        indexes = [
+            models.Index(fields=["user", "-created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.coins:+} monedas {self.rubies:+} rubíes ({self.reason})"
@@ -0,0 +1,6 @@
+from django.urls import re_path
+from .consumers import UserStreamConsumer
+
+websocket_urlpatterns = [
+    re_path(r"ws/notificaciones/$", UserStreamConsumer.as_asgi()),
+]
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .services.gacha_audit import rollup_gacha_stats
+from .services.world_boss import tick_world_boss
+
+
+logger = logging.getLogger(__name__)
+
+TICK_SECONDS = 60
+
+
+class PeriodicJob:
+    """
+    Tarea que el scheduler corre en cada tick: `func(now)`. Cada una tiene
+    su propio interruptor en settings (`setting`, activo si no está definido).
+    """
+
+    def __init__(self, name, func, setting):
+        self.name = name
+        self.func = func
+        self.setting = setting
+
+    def enabled(self):
+        return getattr(settings, self.setting, True)
+
+
+WORLD_BOSS_JOB = PeriodicJob("World Boss", tick_world_boss, "WORLD_BOSS_SCHEDULER_ENABLED")
+# Resume en GachaRollStat las horas cerradas del log (no hace nada si ya está al día)
+GACHA_ROLLUP_JOB = PeriodicJob(
+    "resumen del gacha", rollup_gacha_stats, "GACHA_ROLLUP_SCHEDULER_ENABLED"
+)
+
+DEFAULT_JOBS = (WORLD_BOSS_JOB, GACHA_ROLLUP_JOB)
+
+
+class PeriodicScheduler:
+    """
+    Corre las tareas periódicas cada minuto dentro del event loop de daphne,
+    sin cron externo. Las vistas solo leen el estado ya calculado.
+
+    `clock` y `sleep` se pueden reemplazar (ej. en tests) por un reloj falso.
+    """
+
+    def __init__(self, jobs=DEFAULT_JOBS, interval=TICK_SECONDS, clock=timezone.now,
+                 sleep=asyncio.sleep):
+        self.jobs = list(jobs)
+        self.interval = interval
+        self.clock = clock
+        self.sleep = sleep
+
+    async def run_job(self, job):
+        return await database_sync_to_async(job.func)(self.clock())
+
+    async def run(self, max_ticks=None):
+        ticks = 0
+        while max_ticks is None or ticks < max_ticks:
+            for job in self.jobs:
+                try:
+                    await self.run_job(job)
+                except Exception:
+                    # Un fallo puntual (BD caída, etc.) no debe matar el
+                    # scheduler ni saltarse las demás tareas
+                    logger.exception("Error en la tarea periódica: %s", job.name)
+            ticks += 1
+            await self.sleep(self.interval)
+
+
+class PeriodicSchedulerMiddleware:
+    """
+    Middleware ASGI que arranca el PeriodicScheduler una sola vez por proceso,
+    en el event loop del servidor (daphne), con la primera conexión recibida,
+    solo con las tareas activas en settings.
+    Si hay varios procesos, el bloqueo de fila en tick_world_boss evita
+    que procesen los mismos turnos.
+    """
+
+    def __init__(self, app, scheduler=None):
+        self.app = app
+        self.scheduler = scheduler
+        self._task = None
+
+    async def __call__(self, scope, receive, send):
+        if self._task is None:
+            if self.scheduler is None:
+                self.scheduler = PeriodicScheduler(
+                    jobs=[job for job in DEFAULT_JOBS if job.enabled()]
+                )
+            if self.scheduler.jobs:
+                self._task = asyncio.ensure_future(self.scheduler.run())
+            else:
+                self._task = False  # nada que correr en este proceso
+        return await self.app(scope, receive, send)
@@ -0,0 +1,54 @@
+from django.core.paginator import Paginator
+
+from ..models import BattleLogEntry
+
+
+# Turnos de log por página en las vistas de World Boss / minijefe
+LOG_TURNS_PER_PAGE = 20
+
+
+def split_log_turns(first_turn, log_lines):
+    """
+    Agrupa las líneas de log de un avance en bloques por turno.
+    Los resolvers terminan cada turno con una línea vacía, que es el separador.
+    Devuelve [(turn, text), ...].
+    """
+    blocks = []
+    current = []
+    for line in log_lines:
+        if line == "":
+            blocks.append(current)
+            current = []
+        else:
+            current.append(line)
+    if current:
+        blocks.append(current)
+
+    return [
+        (first_turn + offset, "\n".join(lines))
+        for offset, lines in enumerate(blocks)
+    ]
+
+
+def append_battle_log(first_turn, log_lines, cycle=None, lobby=None):
+    """
+    Añade al log de un ciclo de World Boss o de un lobby de minijefe
+    una fila por turno, en un solo INSERT. El log existente no se lee.
+    """
+    entries = [
+        BattleLogEntry(cycle=cycle, lobby=lobby, turn=turn, text=text)
+        for turn, text in split_log_turns(first_turn, log_lines)
+    ]
+    if entries:
+        BattleLogEntry.objects.bulk_create(entries)
+    return entries
+
+
+def get_battle_log_page(entries_qs, page_number=None, per_page=LOG_TURNS_PER_PAGE):
+    """
+    Página del log (turnos en orden cronológico). Sin número de página se
+    muestra la última, que es la que interesa mientras la batalla avanza.
+    Solo se cargan de la BD las filas de esa página.
+    """
+    paginator = Paginator(entries_qs.order_by("turn", "id"), per_page)
+    return paginator.get_page(page_number or paginator.num_pages)
@@ -0,0 +1,94 @@
+import struct
+
+
+# Los simuladores emiten eventos compactos (turn, actor, dmg, flags) en vez de
+# frases; el texto solo se genera al mostrar el log (render_*_log).
+
+ACTOR_PLAYER = 0   # torre: jugador / PvP: atacante
+ACTOR_ENEMY = 1    # torre: enemigo / PvP: defensor
+
+FLAG_CRIT = 1
+FLAG_DODGE = 2
+FLAG_KO = 4        # el golpe deja al objetivo a 0 HP
+
+# Cabecera: HP inicial de cada lado. Evento: turno, actor, flags, daño.
+_HEADER = struct.Struct("<II")
+_EVENT = struct.Struct("<IBBI")
+
+
+def pack_events(events, start_hp=(0, 0)):
+    """Empaqueta los eventos en bytes (10 bytes por golpe) para guardarlos en BD."""
+    buf = bytearray(_HEADER.size + _EVENT.size * len(events))
+    _HEADER.pack_into(buf, 0, *start_hp)
+    offset = _HEADER.size
+    for turn, actor, dmg, flags in events:
+        _EVENT.pack_into(buf, offset, turn, actor, flags, dmg)
+        offset += _EVENT.size
+    return bytes(buf)
+
+
+def unpack_events(data):
+    """Inverso de pack_events: devuelve (start_hp, [(turn, actor, dmg, flags), ...])."""
+    data = bytes(data or b"")
+    if len(data) < _HEADER.size:
+        return (0, 0), []
+
+    start_hp = _HEADER.unpack_from(data, 0)
+    events = [
+        (turn, actor, dmg, flags)
+        for turn, actor, flags, dmg in _EVENT.iter_unpack(data[_HEADER.size:])
+    ]
+    return start_hp, events
+
+
+def render_tower_log(events):
+    """Texto del combate de la torre (mismo formato que el log antiguo)."""
+    lines = []
+    current_turn = None
+    for turn, actor, dmg, flags in events:
+        if turn != current_turn:
+            lines.append(f"TURNO {turn}:")
+            current_turn = turn
+
+        if actor == ACTOR_PLAYER:
+            if flags & FLAG_CRIT:
+                lines.append(f"- El jugador hace {dmg} de daño CRÍTICO al enemigo.")
+            else:
+                lines.append(f"- El jugador hace {dmg} de daño al enemigo.")
+            if flags & FLAG_KO:
+                lines.append("El enemigo ha sido derrotado.")
+        else:
+            if flags & FLAG_DODGE:
+                lines.append("- El enemigo ataca pero el jugador ESQUIVA el golpe.")
+            else:
+                lines.append(f"- El enemigo hace {dmg} de daño al jugador.")
+            if flags & FLAG_KO:
+                lines.append("El jugador ha sido derrotado.")
+
+    return "\n".join(lines)
+
+
+def render_pvp_log(events, start_hp, attacker_name, defender_name):
+    """Texto del combate PvP, recalculando la vida restante desde el HP inicial."""
+    atk_hp, def_hp = start_hp
+    lines = [f"Combate PvP entre {attacker_name} y {defender_name}\n"]
+
+    for turn, actor, dmg, flags in events:
+        lines.append(f"Turno {turn}")
+        if actor == ACTOR_PLAYER:
+            if flags & FLAG_DODGE:
+                lines.append(f" - {defender_name} esquiva el ataque.")
+            def_hp -= dmg
+            lines.append(f" - {attacker_name} hace {dmg} de daño.")
+            lines.append(f"   Vida: {attacker_name}={atk_hp} | {defender_name}={max(def_hp, 0)}")
+        else:
+            if flags & FLAG_DODGE:
+                lines.append(f" - {attacker_name} esquiva el ataque.")
+            atk_hp -= dmg
+            lines.append(f" - {defender_name} hace {dmg} de daño.")
+            lines.append(f"   Vida: {attacker_name}={max(atk_hp, 0)} | {defender_name}={def_hp}")
+        lines.append("")
+
+    winner = attacker_name if atk_hp > 0 else defender_name
+    lines.append(f"{winner} gana el combate.")
+    return "\n".join(lines)
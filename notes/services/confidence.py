@@ -0,0 +1,20 @@
+import math
+
+
+# Intervalos de confianza compartidos por la auditoría del gacha y las
+# probabilidades de victoria del PvP (simulaciones Monte Carlo).
+
+# z para intervalos de confianza del 95 %
+Z_95 = 1.96
+
+
+def wilson_interval(successes, total, z=Z_95):
+    """Intervalo de confianza de Wilson para una proporción. (0, 1) si no hay datos."""
+    if total <= 0:
+        return 0.0, 1.0
+    p = successes / total
+    z2 = z * z
+    denom = 1 + z2 / total
+    center = (p + z2 / (2 * total)) / denom
+    half = z * math.sqrt(p * (1 - p) / total + z2 / (4 * total * total)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
@@ -0,0 +1,336 @@
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import (
+    CombatItem,
+    GachaProbability,
+    GachaRollLog,
+    GachaType,
+    ItemRarity,
+)
+from .wallet import InsufficientFunds, change_balance
+
+
+# Probabilidades por defecto del GACHA NORMAL
+# Usamos SIEMPRE códigos string (basic, uncommon, ...)
+DEFAULT_GACHA_PROBS_NORMAL = [
+    (ItemRarity.BASIC.value, 0.80),
+    (ItemRarity.UNCOMMON.value, 0.15),
+    (ItemRarity.SPECIAL.value, 0.04),
+    (ItemRarity.EPIC.value, 0.009),
+    (ItemRarity.LEGENDARY.value, 0.0009),
+    (ItemRarity.MYTHIC.value, 0.00009),
+    (ItemRarity.ASCENDED.value, 0.00001),
+]
+
+# Probabilidades por defecto del GACHA PREMIUM
+# (el resto hasta 1.0 se usa como probabilidad de +1 rubí)
+DEFAULT_GACHA_PROBS_PREMIUM = [
+    (ItemRarity.BASIC.value, 0.0),
+    (ItemRarity.UNCOMMON.value, 0.0),
+    (ItemRarity.SPECIAL.value, 0.65),
+    (ItemRarity.EPIC.value, 0.255),
+    (ItemRarity.LEGENDARY.value, 0.045),
+    (ItemRarity.MYTHIC.value, 0.0049),   # 0.199 %
+    (ItemRarity.ASCENDED.value, 0.0001), # 0.001 %
+]
+
+# De peor a mejor
+RARITY_CODES = [
+    ItemRarity.BASIC.value,
+    ItemRarity.UNCOMMON.value,
+    ItemRarity.SPECIAL.value,
+    ItemRarity.EPIC.value,
+    ItemRarity.LEGENDARY.value,
+    ItemRarity.MYTHIC.value,
+    ItemRarity.ASCENDED.value,
+]
+
+# Resultado de la tirada premium que no da ítem sino +1 rubí
+RUBY = None
+# ... y su valor de rarity en GachaRollLog / GachaRollStat
+RUBY_RARITY = ""
+
+# Coste de una tirada
+GACHA_COST = {
+    GachaType.NORMAL: 15,
+    GachaType.PREMIUM: 300,
+}
+
+# Tiradas múltiples permitidas
+MULTI_PULL_COUNTS = (10, 100)
+
+# Contador de versión compartido (caché de Django): cada guardado de
+# GachaProbability lo incrementa y los procesos recompilan su tabla.
+GACHA_VERSION_KEY = "gacha:probs:version"
+
+# Con la LocMemCache por defecto el contador no se comparte entre workers de
+# daphne: como respaldo, cada proceso recompila su tabla pasado este tiempo.
+LOCAL_TABLE_TTL = 60  # segundos
+
+# {gacha_type: (versión, instante de compilación, CompiledGacha)}
+_compiled = {}
+
+
+def default_probs(gacha_type):
+    if gacha_type == GachaType.NORMAL:
+        return DEFAULT_GACHA_PROBS_NORMAL
+    return DEFAULT_GACHA_PROBS_PREMIUM
+
+
+def build_alias_table(weights):
+    """
+    Método alias de Vose: a partir de pesos (no hace falta que sumen 1)
+    devuelve (prob, alias) para muestrear en O(1).
+    """
+    n = len(weights)
+    total = float(sum(weights))
+    if n == 0 or total <= 0:
+        raise ValueError("Se necesita al menos un peso positivo.")
+
+    scaled = [w * n / total for w in weights]
+    prob = [0.0] * n
+    alias = list(range(n))
+
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+    while small and large:
+        s = small.pop()
+        l = large.pop()
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] = (scaled[l] + scaled[s]) - 1.0
+        if scaled[l] < 1.0:
+            small.append(l)
+        else:
+            large.append(l)
+
+    # Lo que quede vale 1 (salvo error de redondeo)
+    for i in large + small:
+        prob[i] = 1.0
+
+    return prob, alias
+
+
+class CompiledGacha:
+    """
+    Distribución ya compilada de un tipo de gacha.
+
+    `probs` es la lista [(code, prob)] ordenada de peor a mejor, tal como se
+    muestra en las tablas. `sample()` devuelve un código de rareza, o RUBY en
+    el premium (el resto hasta 1.0). En el normal el resto va a la última
+    rareza, igual que hacía el recorrido acumulado.
+    """
+
+    def __init__(self, gacha_type, probs):
+        self.gacha_type = gacha_type
+        self.probs = probs
+
+        outcomes = [code for code, _p in probs]
+        weights = [max(0.0, p) for _c, p in probs]
+        leftover = max(0.0, 1.0 - sum(weights))
+        if gacha_type == GachaType.PREMIUM:
+            outcomes.append(RUBY)
+            weights.append(leftover)
+        else:
+            weights[-1] += leftover
+
+        self.outcomes = outcomes
+        self.ruby_prob = leftover if gacha_type == GachaType.PREMIUM else None
+        self._prob, self._alias = build_alias_table(weights)
+        self._n = len(outcomes)
+
+    def sample(self, rng=random):
+        i = int(rng.random() * self._n)
+        if rng.random() >= self._prob[i]:
+            i = self._alias[i]
+        return self.outcomes[i]
+
+
+def load_gacha_probs(gacha_type):
+    """
+    Lee (una consulta) las probabilidades de BD, creando las filas por
+    defecto si aún no existen. Devuelve [(code, prob)] de peor a mejor.
+    """
+    db_map = dict(
+        GachaProbability.objects
+        .filter(gacha_type=gacha_type)
+        .values_list("rarity", "probability")
+    )
+    if not db_map:
+        # Semilla inicial en BD
+        defaults = default_probs(gacha_type)
+        GachaProbability.objects.bulk_create(
+            [
+                GachaProbability(gacha_type=gacha_type, rarity=code, probability=prob)
+                for code, prob in defaults
+            ],
+            ignore_conflicts=True,
+        )
+        db_map = dict(defaults)
+
+    return [(code, db_map.get(code, 0.0)) for code in RARITY_CODES]
+
+
+def _current_version():
+    return cache.get(GACHA_VERSION_KEY, 0)
+
+
+def get_compiled_gacha(gacha_type):
+    """
+    Tabla compilada del gacha, en memoria del proceso. Solo vuelve a la BD si
+    cambió la versión compartida o si la copia local superó LOCAL_TABLE_TTL.
+    """
+    gacha_type = GachaType(gacha_type)
+    version = _current_version()
+    now = time.monotonic()
+
+    entry = _compiled.get(gacha_type)
+    if entry is not None:
+        cached_version, compiled_at, compiled = entry
+        if cached_version == version and now - compiled_at < LOCAL_TABLE_TTL:
+            return compiled
+
+    compiled = CompiledGacha(gacha_type, load_gacha_probs(gacha_type))
+    _compiled[gacha_type] = (version, now, compiled)
+    return compiled
+
+
+def get_gacha_probs(gacha_type=GachaType.NORMAL):
+    """[(code, prob)] ordenado de peor a mejor, desde la tabla compilada."""
+    return get_compiled_gacha(gacha_type).probs
+
+
+def roll_gacha(gacha_type=GachaType.NORMAL, rng=random):
+    """Código de rareza sorteado, o RUBY (solo premium). Sin consultas a BD."""
+    return get_compiled_gacha(gacha_type).sample(rng)
+
+
+def invalidate_gacha_tables():
+    """Incrementa la versión compartida y descarta las tablas de este proceso."""
+    _compiled.clear()
+    try:
+        cache.incr(GACHA_VERSION_KEY)
+    except ValueError:
+        # La clave no existía (caché vacía o reiniciada): un valor que ningún
+        # proceso pueda tener ya guardado
+        cache.set(GACHA_VERSION_KEY, time.time_ns(), None)
+
+
+@dataclass
+class GachaBatchResult:
+    """Resumen de una tanda de tiradas (ya cobrada y guardada)."""
+    count: int
+    cost: int
+    # Un dict por tirada: {"rarity", "label", "slot", "item", "sold_for", "ruby"}
+    rolls: list = field(default_factory=list)
+    kept_items: list = field(default_factory=list)
+    sold_coins: int = 0
+    rubies: int = 0
+
+    def rarity_summary(self):
+        """Obtenidos / auto vendidos por rareza, de peor a mejor (solo las que salieron)."""
+        kept = Counter(r["rarity"] for r in self.rolls if r["item"] is not None)
+        sold = Counter(r["rarity"] for r in self.rolls if r["sold_for"])
+        return [
+            {
+                "code": code,
+                "label": ItemRarity(code).label,
+                "kept": kept[code],
+                "sold": sold[code],
+            }
+            for code in RARITY_CODES
+            if kept[code] or sold[code]
+        ]
+
+
+def pull_gacha_batch(user, gacha_type, count, slots, build_item, auto_sell_prices, rng=random):
+    """
+    Hace `count` tiradas de una vez.
+
+    Las rarezas se sortean en memoria (tabla compilada) y el auto vender se
+    decide antes de guardar nada. Luego, en una sola transacción: un UPDATE
+    del wallet que cobra el coste, suma lo auto vendido y los rubíes (solo si
+    hay monedas suficientes), un bulk_create de los ítems que se quedan y otro
+    del registro de tiradas (GachaRollLog).
+
+    - slots: lista de slots posibles; se elige uno al azar por tirada.
+    - build_item(user, slot, rarity): devuelve un CombatItem sin guardar.
+    - auto_sell_prices: {rarity_code: monedas} de las rarezas a auto vender.
+
+    Devuelve un GachaBatchResult, o None si no alcanzan las monedas.
+    """
+    gacha_type = GachaType(gacha_type)
+    compiled = get_compiled_gacha(gacha_type)
+    result = GachaBatchResult(count=count, cost=GACHA_COST[gacha_type] * count)
+
+    for _ in range(count):
+        rarity = compiled.sample(rng)
+        if rarity is RUBY:
+            result.rubies += 1
+            result.rolls.append({
+                "rarity": None, "label": "", "slot": None, "item": None, "sold_for": 0, "ruby": True,
+            })
+            continue
+
+        slot = slots[0] if len(slots) == 1 else rng.choice(slots)
+        sell_price = auto_sell_prices.get(rarity, 0)
+        item = None
+        if sell_price > 0:
+            result.sold_coins += sell_price
+        else:
+            item = build_item(user, slot, rarity)
+            result.kept_items.append(item)
+        result.rolls.append({
+            "rarity": rarity,
+            "label": ItemRarity(rarity).label,
+            "slot": slot,
+            "item": item,
+            "sold_for": sell_price,
+            "ruby": False,
+        })
+
+    try:
+        with transaction.atomic():
+            change_balance(
+                user,
+                coins=result.sold_coins - result.cost,
+                rubies=result.rubies,
+                reason=f"gacha_{gacha_type.value}",
+                min_coins=result.cost,
+            )
+            if result.kept_items:
+                CombatItem.objects.bulk_create(result.kept_items, batch_size=500)
+            log_rolls(user, gacha_type, result.rolls)
+    except InsufficientFunds:
+        return None
+
+    return result
+
+
+def log_rolls(user, gacha_type, rolls, now=None):
+    """
+    Registra las tiradas de una tanda en GachaRollLog (un solo bulk_create).
+    `rolls` son los dicts de GachaBatchResult.rolls.
+    """
+    now = now or timezone.now()
+    GachaRollLog.objects.bulk_create(
+        [
+            GachaRollLog(
+                user=user,
+                gacha_type=gacha_type,
+                rarity=RUBY_RARITY if r["ruby"] else r["rarity"],
+                slot="" if r["ruby"] else r["slot"],
+                created_at=now,
+            )
+            for r in rolls
+        ],
+        batch_size=500,
+    )
@@ -0,0 +1,157 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from ..models import GachaRollLog, GachaRollStat, GachaType, ItemRarity
+from .confidence import wilson_interval
+from .gacha import RARITY_CODES, RUBY_RARITY, get_compiled_gacha
+
+
+# Auditoría del gacha: cada tirada queda en GachaRollLog (una fila compacta,
+# insertada en bloque por tanda, ver gacha.log_rolls) y un rollup por horas
+# la resume en GachaRollStat. El informe compara lo observado con lo configurado.
+
+
+def hour_start(dt):
+    """Inicio de la hora (hora local, igual que TruncHour)."""
+    return timezone.localtime(dt).replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_gacha_stats(now=None):
+    """
+    Resume en GachaRollStat las horas ya cerradas del log.
+
+    Siempre vuelve a contar desde la última hora resumida (incluida: pudo
+    entrar alguna tirada tarde, justo al cambiar de hora) hasta la hora en
+    curso, que nunca se guarda. Es idempotente: recalcula los conteos
+    (upsert), no los suma. Devuelve cuántas filas de GachaRollStat escribió.
+    """
+    current_hour = hour_start(now or timezone.now())
+    last = GachaRollStat.objects.aggregate(Max("period_start"))["period_start__max"]
+
+    qs = GachaRollLog.objects.filter(created_at__lt=current_hour)
+    if last is not None:
+        qs = qs.filter(created_at__gte=last)
+
+    rows = (
+        qs.annotate(period=TruncHour("created_at"))
+        .values("period", "gacha_type", "rarity")
+        .annotate(n=Count("id"))
+    )
+    stats = [
+        GachaRollStat(
+            period_start=row["period"],
+            gacha_type=row["gacha_type"],
+            rarity=row["rarity"],
+            count=row["n"],
+        )
+        for row in rows
+    ]
+    if stats:
+        GachaRollStat.objects.bulk_create(
+            stats,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=["gacha_type", "period_start", "rarity"],
+            update_fields=["count"],
+        )
+    return len(stats)
+
+
+def rarity_label(code):
+    return "+1 Rubí" if code == RUBY_RARITY else ItemRarity(code).label
+
+
+def _observed_counts(gacha_type, since, current_hour):
+    """{rarity: tiradas} desde `since` (None = todo): horas resumidas + hora en curso."""
+    stats = GachaRollStat.objects.filter(gacha_type=gacha_type)
+    live = GachaRollLog.objects.filter(gacha_type=gacha_type, created_at__gte=current_hour)
+    if since is not None:
+        stats = stats.filter(period_start__gte=since)
+        live = live.filter(created_at__gte=since)
+
+    counts = Counter()
+    for row in stats.values("rarity").annotate(n=Sum("count")):
+        counts[row["rarity"]] += row["n"]
+    for row in live.values("rarity").annotate(n=Count("id")):
+        counts[row["rarity"]] += row["n"]
+    return counts
+
+
+def gacha_rate_report(gacha_type, days=None, now=None):
+    """
+    Tasas observadas vs configuradas de un tipo de gacha en los últimos
+    `days` días (None = desde siempre), con intervalo de Wilson al 95 %.
+
+    Solo lee GachaRollStat (unas pocas filas por hora) y el log de la hora
+    en curso, así que no depende del total de tiradas registradas.
+    Las tasas configuradas son las ACTUALES: si se cambiaron dentro del
+    periodo, la comparación lo refleja.
+    """
+    gacha_type = GachaType(gacha_type)
+    now = now or timezone.now()
+    rollup_gacha_stats(now)
+
+    current_hour = hour_start(now)
+    since = hour_start(now - timedelta(days=days)) if days else None
+    counts = _observed_counts(gacha_type, since, current_hour)
+    total = sum(counts.values())
+
+    compiled = get_compiled_gacha(gacha_type)
+    configured = list(compiled.probs)
+    if gacha_type == GachaType.PREMIUM:
+        configured.append((RUBY_RARITY, compiled.ruby_prob))
+
+    rows = []
+    for code, prob in configured:
+        n = counts.get(code, 0)
+        low, high = wilson_interval(n, total)
+        rows.append({
+            "code": code,
+            "label": rarity_label(code),
+            "count": n,
+            "expected": prob * total,
+            "configured": prob,
+            "observed": n / total if total else 0.0,
+            "ci_low": low,
+            "ci_high": high,
+            "ok": total == 0 or low <= prob <= high,
+        })
+
+    return {"gacha_type": gacha_type, "total": total, "since": since, "rows": rows}
+
+
+def gacha_daily_counts(gacha_type, days=14, now=None):
+    """
+    Tiradas por día y rareza de los últimos `days` días (solo horas ya
+    resumidas). Devuelve (etiquetas de las columnas,
+    [{"day", "total", "counts": [n por rareza]}]).
+    """
+    now = now or timezone.now()
+    since = hour_start(now - timedelta(days=days))
+    codes = list(RARITY_CODES)
+    if GachaType(gacha_type) == GachaType.PREMIUM:
+        codes.append(RUBY_RARITY)
+
+    by_day = {}
+    rows = (
+        GachaRollStat.objects
+        .filter(gacha_type=gacha_type, period_start__gte=since)
+        .annotate(day=TruncDate("period_start"))
+        .values("day", "rarity")
+        .annotate(n=Sum("count"))
+    )
+    for row in rows:
+        by_day.setdefault(row["day"], Counter())[row["rarity"]] += row["n"]
+
+    return [rarity_label(code) for code in codes], [
+        {
+            "day": day,
+            "total": sum(c.values()),
+            "counts": [c.get(code, 0) for code in codes],
+        }
+        for day, c in sorted(by_day.items(), reverse=True)
+    ]
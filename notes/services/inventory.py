@@ -0,0 +1,142 @@
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, Q, When
+
+from ..models import CombatItem, ItemRarity, ItemSlot, UserProfile
+from .stats import EQUIPMENT_FIELDS, SNAPSHOT_FIELDS, refresh_stats_snapshot
+from .wallet import credit
+
+
+# Ítems por página del inventario (y por cada carga del scroll infinito)
+INVENTORY_PAGE_SIZE = 50
+
+
+def sellable_items(user):
+    """Ítems del usuario que se pueden vender (no están en venta en el mercado)."""
+    return (
+        CombatItem.objects
+        .filter(owner=user)
+        .exclude(market_listing__is_active=True)
+    )
+
+
+def inventory_page(user, slot=None, cursor=None, limit=INVENTORY_PAGE_SIZE):
+    """
+    Una página del inventario, de mejor a peor rareza y de más nuevo a más
+    viejo, paginada por cursor sobre (rarity_rank, id) con los índices
+    item_owner_rank / item_owner_slot_rank: una consulta acotada, tenga el
+    jugador 10 ítems o 10.000. Devuelve (ítems, cursor siguiente o None).
+    """
+    qs = sellable_items(user)
+    if slot:
+        qs = qs.filter(slot=slot)
+
+    if cursor:
+        try:
+            rank, last_id = (int(part) for part in cursor.split(":"))
+        except ValueError:
+            rank = last_id = None
+        if last_id is not None:
+            qs = qs.filter(Q(rarity_rank__lt=rank) | Q(rarity_rank=rank, id__lt=last_id))
+
+    items = list(qs.order_by("-rarity_rank", "-id")[:limit + 1])
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = f"{items[-1].rarity_rank}:{items[-1].id}"
+    return items, next_cursor
+
+
+def inventory_counts(user):
+    """
+    Cuántos ítems tiene el jugador por slot y por rareza, con un solo GROUP BY.
+    Devuelve {"total", "by_slot": {slot: n}, "by_rarity": [(code, label, n)]}
+    (rarezas de peor a mejor, solo las que tiene).
+    """
+    by_slot, by_rank, total = {}, {}, 0
+    rows = (
+        sellable_items(user)
+        .order_by()
+        .values_list("slot", "rarity_rank")
+        .annotate(n=Count("id"))
+    )
+    for slot, rank, n in rows:
+        by_slot[slot] = by_slot.get(slot, 0) + n
+        by_rank[rank] = by_rank.get(rank, 0) + n
+        total += n
+
+    rarities = ItemRarity.choices
+    return {
+        "total": total,
+        "by_slot": {code: by_slot.get(code, 0) for code in ItemSlot.values},
+        "by_rarity": [
+            (rarities[rank][0], rarities[rank][1], n) for rank, n in sorted(by_rank.items())
+        ],
+    }
+
+
+def sell_items(user, prices, item_ids=None, rarity=None, keep_ids=(), profile=None):
+    """
+    Vende de una vez los ítems indicados (`item_ids`) o todos los de una
+    rareza (`rarity`), sin recorrerlos uno a uno:
+
+    - una consulta que bloquea los ítems y otra que suma el precio por rareza,
+    - un UPDATE que desequipa del perfil los que estuvieran puestos,
+    - un DELETE en bloque de los ítems,
+    - un UPDATE del wallet con el total.
+
+    `prices` es {rarity: monedas}; `keep_ids` son ids que no se venden nunca
+    (ej. los equipados al vender toda una rareza). Si se pasa `profile` y se
+    desequipó algo, se recarga su equipo y se recalcula su snapshot.
+    Devuelve (ítems vendidos, monedas).
+    """
+    qs = sellable_items(user)
+    if item_ids is not None:
+        qs = qs.filter(id__in=item_ids)
+    if rarity:
+        qs = qs.filter(rarity=rarity)
+    if keep_ids:
+        qs = qs.exclude(id__in=keep_ids)
+
+    with transaction.atomic():
+        if not connection.features.has_select_for_update:
+            # SQLite: tomar ya el bloqueo de escritura para que el conjunto
+            # vendido no cambie entre la suma y el borrado
+            UserProfile.objects.filter(user=user).update(coins=F("coins"))
+
+        ids = list(qs.select_for_update().values_list("id", flat=True))
+        if not ids:
+            return 0, 0
+
+        by_rarity = (
+            CombatItem.objects
+            .filter(id__in=ids)
+            .values("rarity")
+            .annotate(n=Count("id"))
+        )
+        total_coins = sum(prices.get(row["rarity"], 0) * row["n"] for row in by_rarity)
+
+        # Desequipar en un solo UPDATE lo que se vaya a vender
+        unequipped = (
+            UserProfile.objects
+            .filter(user=user)
+            .filter(Q(*[Q(**{f"{field}__in": ids}) for field in EQUIPMENT_FIELDS], _connector=Q.OR))
+            .update(**{
+                field: Case(When(**{f"{field}__in": ids}, then=None), default=F(field))
+                for field in EQUIPMENT_FIELDS
+            })
+        )
+
+        # El borrado en bloque limpia también, por conjuntos, las referencias
+        # (ofertas del mercado, trades, slots de otros perfiles)
+        CombatItem.objects.filter(id__in=ids).only("id").delete()
+
+        if total_coins:
+            credit(user, coins=total_coins, reason="inventory_sell")
+
+        if profile is not None:
+            profile.refresh_from_db(fields=["coins", "rubies"] + EQUIPMENT_FIELDS)
+            if unequipped:
+                refresh_stats_snapshot(profile, save=False)
+                profile.save(update_fields=list(SNAPSHOT_FIELDS.values()))
+
+    return len(ids), total_coins
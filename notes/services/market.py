@@ -0,0 +1,252 @@
+import math
+import random
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import OperationalError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ..models import CombatItem, MarketListing, MarketPriceStat
+from .wallet import transfer
+
+
+# Reintentos de la compra si choca con otra (bloqueo / deadlock)
+PURCHASE_ATTEMPTS = 5
+
+# Ofertas por página del mercado
+MARKET_PAGE_SIZE = 24
+
+# Órdenes del mercado: (campo, descendente). El id desempata.
+MARKET_SORTS = {
+    "price": ("price_coins", False),
+    "price_desc": ("price_coins", True),
+    "new": ("created_at", True),
+}
+MARKET_SORT_LABELS = [
+    ("price", "Más baratos"),
+    ("price_desc", "Más caros"),
+    ("new", "Más recientes"),
+]
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# Mayor entero que cabe en una columna BIGINT
+_MAX_CURSOR_INT = 2 ** 63 - 1
+
+# Días que cubren los precios sugeridos
+PRICE_INDEX_DAYS = 7
+
+# Buckets de precio para la mediana: cada uno un 10 % más ancho que el anterior
+PRICE_BUCKET_BASE = 1.1
+
+
+class PurchaseError(Exception):
+    """La compra no procede (oferta vendida, cancelada o propia). Nada cambió."""
+
+
+def buy_listing(listing_id, buyer):
+    """
+    Compra una oferta del mercado en una sola transacción:
+
+    1. bloquea la fila de la oferta (select_for_update) y comprueba que sigue activa,
+    2. cobra al comprador con un UPDATE condicionado al saldo y paga al vendedor,
+    3. pasa el ítem al comprador, cierra la oferta y la suma al índice de precios.
+
+    Si dos compradores llegan a la vez, el segundo espera al bloqueo y ve la
+    oferta ya cerrada. Lanza PurchaseError o wallet.InsufficientFunds sin
+    haber cambiado nada. Devuelve la oferta cerrada (con su ítem).
+    """
+    for attempt in range(PURCHASE_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                if not connection.features.has_select_for_update:
+                    # SQLite no tiene SELECT ... FOR UPDATE: una escritura nula
+                    # toma el bloqueo de escritura antes de leer la oferta
+                    MarketListing.objects.filter(id=listing_id).update(is_active=F("is_active"))
+
+                listing = (
+                    MarketListing.objects
+                    .select_for_update()
+                    .select_related("item")
+                    .filter(id=listing_id)
+                    .first()
+                )
+                if listing is None or not listing.is_active:
+                    raise PurchaseError("Esta oferta ya no está disponible.")
+                if listing.seller_id == buyer.id:
+                    raise PurchaseError("No puedes comprar tu propio objeto.")
+
+                transfer(buyer, listing.seller_id, listing.price_coins, reason="market")
+
+                CombatItem.objects.filter(id=listing.item_id).update(owner=buyer)
+                listing.item.owner = buyer
+
+                listing.is_active = False
+                listing.buyer = buyer
+                listing.save(update_fields=["is_active", "buyer"])
+
+                record_sale(listing)
+                return listing
+
+        except OperationalError:
+            if attempt == PURCHASE_ATTEMPTS - 1:
+                raise
+            # Pequeña espera aleatoria antes de reintentar
+            time.sleep(random.uniform(0, 0.01 * (attempt + 1)))
+
+
+def _encode_cursor(listing, field):
+    value = getattr(listing, field)
+    if field == "created_at":
+        # Microsegundos desde epoch: exacto y sin caracteres raros en la URL
+        value = (value - _EPOCH) // timedelta(microseconds=1)
+    return f"{value}:{listing.id}"
+
+
+def _decode_cursor(cursor, field):
+    """
+    (valor, id) del cursor, o None si no es válido. Viene de la URL: se
+    descartan también números fuera de rango para la BD o para una fecha.
+    """
+    try:
+        value, last_id = (int(part) for part in cursor.split(":"))
+    except (AttributeError, ValueError):
+        return None
+    if abs(value) > _MAX_CURSOR_INT or abs(last_id) > _MAX_CURSOR_INT:
+        return None
+    if field == "created_at":
+        try:
+            value = _EPOCH + timedelta(microseconds=value)
+        except OverflowError:
+            return None
+    return value, last_id
+
+
+def search_listings(rarity=None, slot=None, min_price=None, max_price=None,
+                    sort="price", cursor=None, limit=MARKET_PAGE_SIZE):
+    """
+    Una página de ofertas activas con paginación por cursor (keyset).
+
+    Filtra por las columnas copiadas del ítem (rarity, slot) y por precio, y
+    ordena por (campo, id): cada página es una sola consulta acotada sobre
+    los índices parciales de MarketListing, sin OFFSET ni COUNT.
+    Devuelve (ofertas, cursor de la página siguiente o None).
+    """
+    field, desc = MARKET_SORTS.get(sort, MARKET_SORTS["price"])
+
+    qs = MarketListing.objects.filter(is_active=True)
+    if rarity:
+        qs = qs.filter(rarity=rarity)
+    if slot:
+        qs = qs.filter(slot=slot)
+    if min_price is not None:
+        qs = qs.filter(price_coins__gte=min_price)
+    if max_price is not None:
+        qs = qs.filter(price_coins__lte=max_price)
+
+    after = _decode_cursor(cursor, field) if cursor else None
+    if after is not None:
+        value, last_id = after
+        op = "lt" if desc else "gt"
+        qs = qs.filter(
+            Q(**{f"{field}__{op}": value}) | Q(**{field: value, f"id__{op}": last_id})
+        )
+
+    order = [f"-{field}", "-id"] if desc else [field, "id"]
+    listings = list(qs.select_related("item", "seller").order_by(*order)[:limit + 1])
+
+    next_cursor = None
+    if len(listings) > limit:
+        listings = listings[:limit]
+        next_cursor = _encode_cursor(listings[-1], field)
+    return listings, next_cursor
+
+
+def _price_bucket(price):
+    return int(math.log(max(price, 1), PRICE_BUCKET_BASE))
+
+
+def _bucket_price(bucket):
+    """Precio representativo de un bucket (su centro geométrico)."""
+    return round(PRICE_BUCKET_BASE ** (bucket + 0.5))
+
+
+def record_sale(listing, day=None):
+    """
+    Suma una venta a MarketPriceStat (día, slot, rareza): ventas, total,
+    mínimo, máximo y el bucket de precio. Se llama dentro de la transacción
+    de la compra, así que el índice nunca cuenta una venta que no ocurrió.
+    """
+    day = day or timezone.localdate()
+    price = listing.price_coins
+    with transaction.atomic():
+        stat, created = (
+            MarketPriceStat.objects
+            .select_for_update()
+            .get_or_create(
+                day=day,
+                slot=listing.slot,
+                rarity=listing.rarity,
+                defaults={"min_price": price, "max_price": price},
+            )
+        )
+        stat.sales += 1
+        stat.total_coins += price
+        stat.min_price = min(stat.min_price, price)
+        stat.max_price = max(stat.max_price, price)
+        bucket = str(_price_bucket(price))
+        stat.price_buckets[bucket] = stat.price_buckets.get(bucket, 0) + 1
+        stat.save()
+
+
+def suggested_prices(days=PRICE_INDEX_DAYS, today=None, slot=None, rarity=None):
+    """
+    Precios de referencia de los últimos `days` días por (slot, rareza):
+    {(slot, rarity): {"sales", "min", "median", "max", "avg"}}.
+
+    Lee como mucho days × slots × rarezas filas de MarketPriceStat (una
+    consulta), sea cual sea el número de ventas. La mediana sale de los
+    buckets de precio, así que es aproximada (±5 %) y se recorta a [min, max].
+    """
+    today = today or timezone.localdate()
+    qs = MarketPriceStat.objects.filter(day__gt=today - timedelta(days=days))
+    if slot:
+        qs = qs.filter(slot=slot)
+    if rarity:
+        qs = qs.filter(rarity=rarity)
+
+    merged = {}
+    for stat in qs:
+        key = (stat.slot, stat.rarity)
+        agg = merged.get(key)
+        if agg is None:
+            agg = merged[key] = {
+                "sales": 0, "total": 0, "min": stat.min_price, "max": stat.max_price, "buckets": {},
+            }
+        agg["sales"] += stat.sales
+        agg["total"] += stat.total_coins
+        agg["min"] = min(agg["min"], stat.min_price)
+        agg["max"] = max(agg["max"], stat.max_price)
+        for bucket, n in stat.price_buckets.items():
+            agg["buckets"][int(bucket)] = agg["buckets"].get(int(bucket), 0) + n
+
+    result = {}
+    for key, agg in merged.items():
+        if not agg["sales"]:
+            continue
+        # Bucket donde cae la venta central
+        half, seen, median = (agg["sales"] + 1) / 2, 0, agg["max"]
+        for bucket in sorted(agg["buckets"]):
+            seen += agg["buckets"][bucket]
+            if seen >= half:
+                median = min(max(_bucket_price(bucket), agg["min"]), agg["max"])
+                break
+        result[key] = {
+            "sales": agg["sales"],
+            "min": agg["min"],
+            "median": median,
+            "max": agg["max"],
+            "avg": round(agg["total"] / agg["sales"]),
+        }
+    return result
@@ -0,0 +1,215 @@
+from django.utils import timezone
+
+from ..models import MiniBossLobby, MiniBossParticipant
+from .battle_log import append_battle_log
+from .stats import get_total_stats_many
+from .wallet import credit_many
+
+
+# ============================================================
+#  MINI BOSS — Definiciones
+# ============================================================
+
+MINI_BOSS_DEFINITIONS = {
+    "moth_baron": {
+        "code": "moth_baron",
+        "name": "Varón Polilla",
+        "damage_per_turn": 30,
+        "reward_per_100": 5,   # 1 moneda por cada 100 de daño
+        "max_reward": 40,      # máximo 40 monedas
+    },
+    "cat_commander": {
+        "code": "cat_commander",
+        "name": "Comandante Gato",
+        "damage_per_turn": 50,
+        "reward_per_100": 5,
+        "max_reward": 60,
+    },
+    "nightmare_freddy": {
+        "code": "nightmare_freddy",
+        "name": "Pesadilla Freddy",
+        "damage_per_turn": 100,
+        "reward_per_100": 5,
+        "max_reward": 100,
+    },
+}
+
+# Segundos reales por turno de batalla
+MINI_BOSS_TURN_SECONDS = 10
+
+
+def get_miniboss_def(boss_code):
+    return MINI_BOSS_DEFINITIONS.get(boss_code)
+
+
+def resolve_miniboss_turns(participants, stats_map, damage_per_turn,
+                           current_turn, total_damage, turns_should_have):
+    """
+    Resuelve en bloque los turnos pendientes de un minijefe.
+
+    El jefe hace daño fijo y cada jugador pega siempre lo mismo (su ataque),
+    así que el turno en que muere cada uno es ceil(hp / damage_per_turn) y el
+    daño global en ese momento sale de sumas acumuladas por turno.
+
+    Modifica los participantes en memoria (hp_remaining, is_alive,
+    total_damage_done, boss_damage_at_death) y devuelve
+    (current_turn, total_damage, log_lines).
+    """
+    alive = [p for p in participants if p.is_alive and p.hp_remaining > 0]
+    if not alive or turns_should_have <= current_turn:
+        return current_turn, total_damage, []
+
+    # Arrays paralelos: daño por turno y turnos de vida de cada jugador vivo
+    damages = [max(1, stats_map[p.user_id]["attack"]) for p in alive]
+    lives = [-(-p.hp_remaining // damage_per_turn) for p in alive]
+
+    last_death = max(lives)
+    turns_run = min(turns_should_have - current_turn, last_death)
+
+    # dropped[t] = daño que deja de entrar a partir del turno t+1
+    # (jugadores que mueren en el turno t)
+    dropped = [0] * (turns_run + 1)
+    for dmg, life in zip(damages, lives):
+        if life <= turns_run:
+            dropped[life] += dmg
+
+    # Daño global acumulado al final de cada turno (índice 1..turns_run)
+    turn_damage = sum(damages)
+    cumulative = [total_damage]
+    log_lines = []
+    for t in range(1, turns_run + 1):
+        cumulative.append(cumulative[-1] + turn_damage)
+
+        log_lines.append(f"Turno {current_turn + t}")
+        log_lines.append(f"- Los jugadores infligen {turn_damage} de daño al jefe.")
+        log_lines.append(f"- El jefe contraataca con {damage_per_turn} de daño a cada jugador.")
+        if t == last_death:
+            log_lines.append("- Todos los jugadores han sido derrotados.")
+        log_lines.append("")
+
+        turn_damage -= dropped[t]
+
+    for p, dmg, life in zip(alive, damages, lives):
+        turns_alive = min(life, turns_run)
+        p.total_damage_done += dmg * turns_alive
+        if life <= turns_run:
+            p.hp_remaining = 0
+            p.is_alive = False
+            # 🔥 Guardamos el daño global del jefe en el momento de la muerte
+            if p.boss_damage_at_death == 0:
+                p.boss_damage_at_death = cumulative[life]
+        else:
+            p.hp_remaining -= damage_per_turn * turns_run
+
+    return current_turn + turns_run, cumulative[-1], log_lines
+
+
+def apply_miniboss_rewards(lobby, participants):
+    """
+    Calcula y entrega recompensas SEGÚN EL DAÑO TOTAL GLOBAL
+    que llevaba el jefe en el momento en que murió el jugador.
+
+    Ejemplo: si el jugador muere cuando lobby.total_damage era 1100,
+    se usan esos 1100 para el cálculo de monedas.
+
+    Las monedas se suman con un UPDATE por cada monto distinto (hay pocos:
+    el premio tiene tope) y los participantes se guardan con bulk_update.
+    """
+    boss_def = get_miniboss_def(lobby.boss_code)
+    if not boss_def:
+        return
+
+    reward_per_100 = boss_def["reward_per_100"]
+    max_reward = boss_def["max_reward"]
+
+    rewarded = []
+    for p in participants:
+        if p.reward_given:
+            continue
+
+        # Si nunca se seteó durante la batalla (por seguridad),
+        # usamos el total de daño final del lobby
+        effective_damage = p.boss_damage_at_death or lobby.total_damage
+
+        # monedas = floor(effective_damage / 100) * reward_per_100, cap max_reward
+        coins = (effective_damage // 100) * reward_per_100
+        if coins > max_reward:
+            coins = max_reward
+
+        p.reward_coins = coins
+        p.reward_given = True
+        rewarded.append(p)
+
+    if not rewarded:
+        return
+
+    # Un UPDATE por importe distinto
+    credit_many(
+        {p.user_id: p.reward_coins for p in rewarded if p.reward_coins > 0},
+        reason="miniboss",
+    )
+
+    MiniBossParticipant.objects.bulk_update(rewarded, ["reward_coins", "reward_given"])
+
+
+def advance_miniboss_battle(lobby: MiniBossLobby):
+    """
+    Avanza la batalla del minijefe según el tiempo transcurrido.
+    - 1 turno cada MINI_BOSS_TURN_SECONDS segundos desde started_at.
+    - El jefe hace daño fijo a todos los jugadores vivos.
+    - Los jugadores hacen daño basado en su ataque total.
+    - La batalla termina cuando todos los jugadores están derrotados.
+
+    Cada participante guarda lobby.total_damage en boss_damage_at_death
+    en el turno en que muere, para usarlo como base de recompensa.
+    Los turnos pendientes se resuelven en bloque (resolve_miniboss_turns).
+    """
+    if lobby.status != MiniBossLobby.STATUS_RUNNING or not lobby.started_at:
+        return
+
+    boss_def = get_miniboss_def(lobby.boss_code)
+    if not boss_def:
+        return
+
+    now = timezone.now()
+    elapsed = (now - lobby.started_at).total_seconds()
+
+    turns_should_have = int(elapsed // MINI_BOSS_TURN_SECONDS)
+    if turns_should_have <= lobby.current_turn:
+        # Ya estamos al día
+        return
+
+    participants = list(MiniBossParticipant.objects.filter(lobby=lobby))
+
+    # Stats de todos los participantes en una sola consulta
+    stats_map = get_total_stats_many([p.user_id for p in participants])
+
+    first_turn = lobby.current_turn + 1
+    lobby.current_turn, lobby.total_damage, log_lines = resolve_miniboss_turns(
+        participants,
+        stats_map,
+        boss_def["damage_per_turn"],
+        current_turn=lobby.current_turn,
+        total_damage=lobby.total_damage,
+        turns_should_have=turns_should_have,
+    )
+
+    # Por seguridad: si alguien nunca quedó con boss_damage_at_death,
+    # le dejamos el total final
+    for p in participants:
+        if p.boss_damage_at_death == 0 and (not p.is_alive or p.hp_remaining <= 0):
+            p.boss_damage_at_death = lobby.total_damage
+
+    MiniBossParticipant.objects.bulk_update(
+        participants,
+        ["hp_remaining", "is_alive", "total_damage_done", "boss_damage_at_death"],
+    )
+
+    # Si ya no quedan vivos, terminamos la batalla
+    if not any(p.is_alive and p.hp_remaining > 0 for p in participants):
+        lobby.status = MiniBossLobby.STATUS_FINISHED
+        lobby.ended_at = timezone.now()
+        apply_miniboss_rewards(lobby, participants)
+
+    append_battle_log(first_turn, log_lines, lobby=lobby)
+    lobby.save()
@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from ..models import Note, NoteLike, NoteReply
+
+
+# Likes y respuestas pasan siempre por aquí para que Note.likes_count y
+# Note.replies_count se actualicen en la misma transacción que la fila.
+
+# Notas por página de los muros (y por cada carga del scroll infinito)
+FEED_PAGE_SIZE = 9
+
+# Órdenes del muro: campos de la clave del cursor, de mayor a menor (el id desempata)
+FEED_SORTS = {
+    "fecha": ("created_at",),
+    "likes": ("likes_count", "created_at"),
+}
+
+# Filtros del muro privado
+PRIVATE_FILTERS = ("recibidas", "enviadas", "todas")
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# Mayor entero que cabe en una columna BIGINT
+_MAX_CURSOR_INT = 2 ** 63 - 1
+
+
+def toggle_note_like(note, user):
+    """
+    Da like a la nota o lo quita si ya lo tenía. El contador solo se toca si
+    la fila realmente se creó o se borró (dos clics a la vez no lo descuadran).
+    Devuelve True si ahora le gusta.
+    """
+    with transaction.atomic():
+        _like, created = NoteLike.objects.get_or_create(note=note, user=user)
+        if created:
+            Note.objects.filter(pk=note.pk).update(likes_count=F("likes_count") + 1)
+            return True
+
+        deleted, _ = NoteLike.objects.filter(note=note, user=user).delete()
+        if deleted:
+            Note.objects.filter(pk=note.pk).update(
+                likes_count=Greatest(F("likes_count") - deleted, Value(0))
+            )
+        return False
+
+
+def add_reply(reply):
+    """Guarda una respuesta (ya con nota y autor) y suma 1 a replies_count."""
+    with transaction.atomic():
+        reply.save()
+        Note.objects.filter(pk=reply.note_id).update(replies_count=F("replies_count") + 1)
+    return reply
+
+
+def recount_note_counters(notes=None):
+    """
+    Recalcula likes_count y replies_count desde las tablas (un UPDATE). Para
+    corregir lo que se borre por fuera del servicio (admin, borrar un usuario).
+    Devuelve cuántas notas actualizó.
+    """
+    def counter(model):
+        rows = (
+            model.objects
+            .filter(note=OuterRef("pk"))
+            .order_by()
+            .values("note")
+            .annotate(n=Count("id"))
+            .values("n")
+        )
+        return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+    qs = Note.objects.all() if notes is None else notes
+    return qs.update(likes_count=counter(NoteLike), replies_count=counter(NoteReply))
+
+
+def _encode_cursor(note, fields):
+    parts = []
+    for field in fields + ("id",):
+        value = getattr(note, field)
+        if field == "created_at":
+            # Microsegundos desde epoch: exacto y sin caracteres raros en la URL
+            value = (value - _EPOCH) // timedelta(microseconds=1)
+        parts.append(str(value))
+    return ":".join(parts)
+
+
+def _decode_cursor(cursor, fields):
+    """
+    Valores de la clave (campos + id) del cursor, o None si no es válido
+    (el muro vuelve entonces a la primera página). Viene de la URL: se
+    descartan también números fuera de rango para la BD o para una fecha.
+    """
+    try:
+        values = [int(part) for part in cursor.split(":")]
+    except (AttributeError, ValueError):
+        return None
+    keys = fields + ("id",)
+    if len(values) != len(keys) or any(abs(value) > _MAX_CURSOR_INT for value in values):
+        return None
+    try:
+        return [
+            _EPOCH + timedelta(microseconds=value) if key == "created_at" else value
+            for key, value in zip(keys, values)
+        ]
+    except OverflowError:
+        return None
+
+
+def keyset_page(qs, fields, cursor=None, limit=FEED_PAGE_SIZE):
+    """
+    Una página de `qs` ordenada de mayor a menor por `fields` + id, a partir
+    del cursor: WHERE (clave) < (cursor) en vez de OFFSET, así que la página
+    100 cuesta lo mismo que la primera. Devuelve (filas, cursor siguiente o None).
+    """
+    keys = fields + ("id",)
+    after = _decode_cursor(cursor, fields) if cursor else None
+    if after is not None:
+        # (a, b, id) < (x, y, z)  ->  a < x  OR  (a = x AND b < y)  OR  ...
+        condition = Q()
+        for i, key in enumerate(keys):
+            equal = {k: v for k, v in zip(keys[:i], after[:i])}
+            condition |= Q(**equal, **{f"{key}__lt": after[i]})
+        qs = qs.filter(condition)
+
+    rows = list(qs.order_by(*[f"-{key}" for key in keys])[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1], fields)
+    return rows, next_cursor
+
+
+def public_notes_page(orden="fecha", cursor=None, limit=FEED_PAGE_SIZE):
+    """
+    Una página del muro público. "likes" recorre el índice note_recipient_likes
+    (recipient, -likes_count, -created_at) sin agregar nada.
+    Devuelve (notas, cursor siguiente o None).
+    """
+    fields = FEED_SORTS.get(orden, FEED_SORTS["fecha"])
+    qs = Note.objects.filter(recipient__isnull=True).select_related("author")
+    return keyset_page(qs, fields, cursor=cursor, limit=limit)
+
+
+def private_notes_page(user, filtro="recibidas", cursor=None, limit=FEED_PAGE_SIZE):
+    """
+    Una página de las notas privadas del usuario, de la más nueva a la más
+    vieja. "recibidas" usa el índice note_recipient_recent, "enviadas"
+    note_author_recipient_recent y "todas" la unión de ambos.
+    Devuelve (notas, cursor siguiente o None).
+    """
+    if filtro == "recibidas":
+        qs = Note.objects.filter(recipient=user)
+    elif filtro == "enviadas":
+        qs = Note.objects.filter(author=user, recipient__isnull=False)
+    else:
+        qs = Note.objects.filter(
+            Q(recipient=user) | Q(author=user, recipient__isnull=False)
+        )
+    qs = qs.select_related("author", "recipient")
+    return keyset_page(qs, FEED_SORTS["fecha"], cursor=cursor, limit=limit)
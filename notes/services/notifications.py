@@ -0,0 +1,158 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from ..models import Notification, UserProfile
+from .realtime import push_notifications, push_unread
+
+
+# Toda notificación se crea y se marca como leída por aquí, para mantener
+# UserProfile.unread_notifications al día en la misma transacción y avisar
+# por WebSocket a los usuarios conectados (services/realtime.py).
+
+# Notificaciones por página del historial
+NOTIFICATIONS_PAGE_SIZE = 30
+
+# Borrado de notificaciones leídas antiguas (ver purge_read_notifications)
+PURGE_BATCH_SIZE = 1000
+
+
+def _user_id(user):
+    return getattr(user, "pk", user)
+
+
+def _bump_unread(user_ids, delta):
+    """Suma `delta` al contador de los perfiles indicados (un UPDATE)."""
+    if delta >= 0:
+        value = F("unread_notifications") + delta
+    else:
+        value = Greatest(F("unread_notifications") + delta, Value(0))
+    return UserProfile.objects.filter(user_id__in=user_ids).update(unread_notifications=value)
+
+
+def notify_many(users, message, url=""):
+    """
+    Envía la misma notificación a varios usuarios: un bulk_create y un
+    UPDATE del contador. Devuelve las notificaciones creadas.
+    """
+    user_ids = list(dict.fromkeys(_user_id(u) for u in users))
+    if not user_ids:
+        return []
+
+    with transaction.atomic():
+        created = Notification.objects.bulk_create(
+            [Notification(user_id=uid, message=message, url=url) for uid in user_ids],
+            batch_size=500,
+        )
+        if _bump_unread(user_ids, 1) < len(user_ids):
+            # Algún usuario aún sin perfil: se crea con el contador ya puesto
+            existing = set(
+                UserProfile.objects
+                .filter(user_id__in=user_ids)
+                .values_list("user_id", flat=True)
+            )
+            UserProfile.objects.bulk_create(
+                [UserProfile(user_id=uid, unread_notifications=1)
+                 for uid in user_ids if uid not in existing],
+                ignore_conflicts=True,
+            )
+        push_notifications(created)
+    return created
+
+
+def notify(user, message, url=""):
+    """Crea una notificación para `user` y suma 1 a su contador de no leídas."""
+    return notify_many([user], message, url=url)[0]
+
+
+def mark_read(user, notification_ids=None):
+    """
+    Marca como leídas las notificaciones indicadas del usuario (todas si
+    `notification_ids` es None). Resta al contador exactamente las que se
+    marcaron (si entra una nueva a la vez, sigue contando).
+    Devuelve cuántas se marcaron.
+    """
+    user_id = _user_id(user)
+    unread = Notification.objects.filter(user_id=user_id, is_read=False)
+    if notification_ids is not None:
+        unread = unread.filter(id__in=notification_ids)
+
+    with transaction.atomic():
+        marked = unread.update(is_read=True)
+        if marked:
+            _bump_unread([user_id], -marked)
+            push_unread(user_id)
+    return marked
+
+
+def mark_all_read(user):
+    """Marca como leídas todas las notificaciones del usuario. Devuelve cuántas."""
+    return mark_read(user)
+
+
+def recount_unread(user_ids=None):
+    """
+    Recalcula UserProfile.unread_notifications desde la tabla (un UPDATE).
+    Para corregir lo que se edite o borre por fuera del servicio (admin).
+    Devuelve cuántos perfiles actualizó.
+    """
+    unread = (
+        Notification.objects
+        .filter(user=OuterRef("user_id"), is_read=False)
+        .order_by()
+        .values("user")
+        .annotate(n=Count("id"))
+        .values("n")
+    )
+    profiles = UserProfile.objects.all()
+    if user_ids is not None:
+        profiles = profiles.filter(user_id__in=user_ids)
+    return profiles.update(
+        unread_notifications=Coalesce(Subquery(unread, output_field=IntegerField()), Value(0))
+    )
+
+
+def notifications_page(user, cursor=None, limit=NOTIFICATIONS_PAGE_SIZE):
+    """
+    Una página del historial, de la más nueva a la más vieja, paginada por
+    id (índice notif_user_recent). Devuelve (notificaciones, cursor siguiente o None).
+    """
+    qs = Notification.objects.filter(user_id=_user_id(user))
+    try:
+        qs = qs.filter(id__lt=int(cursor)) if cursor else qs
+    except ValueError:
+        pass
+
+    page = list(qs.order_by("-id")[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = str(page[-1].id)
+    return page, next_cursor
+
+
+def purge_read_notifications(days=None, batch_size=PURGE_BATCH_SIZE, now=None):
+    """
+    Borra las notificaciones YA LEÍDAS de hace más de `days` días (por
+    defecto settings.NOTIFICATION_RETENTION_DAYS), en tandas de `batch_size`
+    para no bloquear la tabla mucho rato. Las no leídas no se tocan, así que
+    los contadores no cambian. Devuelve cuántas borró.
+    """
+    if days is None:
+        days = getattr(settings, "NOTIFICATION_RETENTION_DAYS", 30)
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+
+    # Las más antiguas tienen los ids más bajos: recorrer por id encuentra
+    # cada tanda al principio de la clave primaria, sin índice extra
+    old_read = Notification.objects.filter(is_read=True, created_at__lt=cutoff).order_by("id")
+
+    total = 0
+    while True:
+        ids = list(old_read.values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return total
+        total += Notification.objects.filter(id__in=ids).delete()[0]
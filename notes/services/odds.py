@@ -0,0 +1,187 @@
+import random
+
+from django.core.cache import cache
+
+from .confidence import wilson_interval
+from .stats import SNAPSHOT_FIELDS
+
+
+# Probabilidad de victoria estimada por Monte Carlo: se simulan muchos combates
+# con las mismas reglas que simulate_battle / simulate_pvp_battle, pero sin log
+# ni escrituras en BD, y el resultado se cachea por (snapshot de stats, rival).
+
+DEFAULT_TRIALS = 2000
+ODDS_CACHE_TIMEOUT = 60 * 60  # 1 hora
+
+TOWER_MAX_TURNS = 50
+# simulate_pvp_battle no tiene límite; aquí cortamos por si ambos esquivan siempre
+# (los combates que llegan al corte cuentan como "indecisos", no como derrotas)
+PVP_MAX_ATTACKS = 1000
+
+# Parada temprana del PvP: se simula por tandas y se para en cuanto el
+# intervalo de Wilson (95%) de la victoria mide ±ODDS_MARGIN, o al gastar
+# ODDS_ATTACK_BUDGET ataques (rivales muy tanques), tras un mínimo de tiradas.
+ODDS_BATCH = 100
+ODDS_MIN_TRIALS = 200
+ODDS_MARGIN = 0.03
+ODDS_ATTACK_BUDGET = 200_000
+
+
+def _stats_key(stats):
+    return ":".join(str(stats[stat]) for stat in SNAPSHOT_FIELDS)
+
+
+def _seed_for(key):
+    # Semilla estable por clave: la misma consulta da siempre la misma estimación
+    return sum(ord(c) * (i + 1) for i, c in enumerate(key))
+
+
+def simulate_tower_odds(user_stats, enemy_stats, trials=DEFAULT_TRIALS, rng=None,
+                        max_turns=TOWER_MAX_TURNS):
+    """
+    Corre `trials` combates de torre en bloque.
+    Devuelve {"win_prob": 0..1, "expected_turns": float}.
+    """
+    rng = rng or random.Random()
+    rand = rng.random
+
+    dmg = max(1, user_stats["attack"] - enemy_stats["defense"])
+    edmg = max(1, enemy_stats["attack"] - user_stats["defense"])
+    crit_p = user_stats["crit_chance"] / 100.0
+    dodge_p = user_stats["dodge_chance"] / 100.0
+    start_player_hp = user_stats["hp"]
+    start_enemy_hp = enemy_stats["hp"]
+
+    # El enemigo de la torre tiene velocidad 0
+    if user_stats["speed"] > 0:
+        player_first = True
+    elif user_stats["speed"] < 0:
+        player_first = False
+    else:
+        player_first = None  # se sortea cada turno
+
+    wins = 0
+    total_turns = 0
+    for _ in range(trials):
+        player_hp = start_player_hp
+        enemy_hp = start_enemy_hp
+        turn = 0
+        while turn < max_turns and player_hp > 0 and enemy_hp > 0:
+            turn += 1
+            first = player_first if player_first is not None else rand() < 0.5
+
+            if first:
+                enemy_hp -= dmg * 2 if rand() < crit_p else dmg
+                if enemy_hp <= 0:
+                    break
+                if not rand() < dodge_p:
+                    player_hp -= edmg
+            else:
+                if not rand() < dodge_p:
+                    player_hp -= edmg
+                if player_hp <= 0:
+                    break
+                enemy_hp -= dmg * 2 if rand() < crit_p else dmg
+
+        if player_hp > 0 and enemy_hp <= 0:
+            wins += 1
+        total_turns += turn
+
+    return {
+        "win_prob": wins / trials if trials else 0.0,
+        "expected_turns": total_turns / trials if trials else 0.0,
+    }
+
+
+def simulate_pvp_odds(attacker_stats, defender_stats, trials=DEFAULT_TRIALS, rng=None,
+                      max_attacks=PVP_MAX_ATTACKS, margin=ODDS_MARGIN,
+                      attack_budget=ODDS_ATTACK_BUDGET):
+    """
+    Corre hasta `trials` combates PvP (mismas reglas que simulate_pvp_battle),
+    con parada temprana (ver ODDS_MARGIN / ODDS_ATTACK_BUDGET).
+    Devuelve, desde el punto de vista del atacante:
+    {"win_prob", "undecided_prob": combates cortados en `max_attacks`,
+     "expected_turns", "trials": combates simulados}.
+    Cada ataque cuenta como un turno, igual que en el log.
+    """
+    rng = rng or random.Random()
+    rand = rng.random
+
+    a, d = attacker_stats, defender_stats
+    a_base = max(1, a["attack"] - d["defense"])
+    d_base = max(1, d["attack"] - a["defense"])
+    a_crit, a_dodge = a["crit_chance"] / 100.0, a["dodge_chance"] / 100.0
+    d_crit, d_dodge = d["crit_chance"] / 100.0, d["dodge_chance"] / 100.0
+
+    if a["speed"] > d["speed"]:
+        attacker_first = True
+    elif d["speed"] > a["speed"]:
+        attacker_first = False
+    else:
+        attacker_first = None
+
+    wins = 0
+    undecided = 0
+    total_turns = 0
+    done = 0
+    while done < trials:
+        for _ in range(min(ODDS_BATCH, trials - done)):
+            atk_hp = a["hp"]
+            def_hp = d["hp"]
+            attacker_turn = attacker_first if attacker_first is not None else rand() < 0.5
+            attacks = 0
+            while atk_hp > 0 and def_hp > 0 and attacks < max_attacks:
+                attacks += 1
+                # Igual que el simulador: se sortea crítico y luego esquiva
+                if attacker_turn:
+                    crit = rand() < a_crit
+                    if not rand() < d_dodge:
+                        def_hp -= a_base * 2 if crit else a_base
+                else:
+                    crit = rand() < d_crit
+                    if not rand() < a_dodge:
+                        atk_hp -= d_base * 2 if crit else d_base
+                attacker_turn = not attacker_turn
+
+            if def_hp <= 0:
+                wins += 1
+            elif atk_hp > 0:
+                undecided += 1
+            total_turns += attacks
+            done += 1
+
+        if done >= ODDS_MIN_TRIALS:
+            low, high = wilson_interval(wins, done)
+            if high - low <= 2 * margin or total_turns >= attack_budget:
+                break
+
+    return {
+        "win_prob": wins / done if done else 0.0,
+        "undecided_prob": undecided / done if done else 0.0,
+        "expected_turns": total_turns / done if done else 0.0,
+        "trials": done,
+    }
+
+
+def get_tower_odds(user_stats, floor, enemy_stats, trials=DEFAULT_TRIALS):
+    """Probabilidad de ganar el piso `floor`, cacheada por (snapshot de stats, piso)."""
+    key = f"odds:tower:{floor}:{trials}:{_stats_key(user_stats)}"
+    odds = cache.get(key)
+    if odds is None:
+        odds = simulate_tower_odds(
+            user_stats, enemy_stats, trials=trials, rng=random.Random(_seed_for(key))
+        )
+        cache.set(key, odds, ODDS_CACHE_TIMEOUT)
+    return odds
+
+
+def get_pvp_odds(attacker_stats, defender_stats, trials=DEFAULT_TRIALS):
+    """Probabilidad de ganar contra un rival, cacheada por el snapshot de ambos."""
+    key = f"odds:pvp:{trials}:{_stats_key(attacker_stats)}:{_stats_key(defender_stats)}"
+    odds = cache.get(key)
+    if odds is None:
+        odds = simulate_pvp_odds(
+            attacker_stats, defender_stats, trials=trials, rng=random.Random(_seed_for(key))
+        )
+        cache.set(key, odds, ODDS_CACHE_TIMEOUT)
+    return odds
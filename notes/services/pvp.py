@@ -0,0 +1,122 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import F, Max
+
+from ..models import PvpRanking
+
+
+# Reintentos si dos altas simultáneas calculan la misma última posición
+CREATE_RANKING_ATTEMPTS = 5
+
+# Solo se puede desafiar hasta 3 puestos por encima
+MAX_CHALLENGE_GAP = 3
+
+# Reintentos del intercambio si choca con otro desafío (bloqueo / deadlock)
+SWAP_ATTEMPTS = 5
+
+
+def _last_position():
+    # MAX sobre una columna UNIQUE (indexada): no recorre la tabla
+    return PvpRanking.objects.aggregate(Max("position"))["position__max"] or 0
+
+
+def create_pvp_ranking(user: User) -> PvpRanking:
+    """
+    Agrega al usuario al final del ranking PvP.
+    Se llama al registrarse (señal post_save de User).
+    """
+    for attempt in range(CREATE_RANKING_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return PvpRanking.objects.create(user=user, position=_last_position() + 1)
+        except IntegrityError:
+            # Otro usuario tomó esa posición, o este usuario ya tiene ranking
+            existing = PvpRanking.objects.filter(user=user).first()
+            if existing is not None:
+                return existing
+            if attempt == CREATE_RANKING_ATTEMPTS - 1:
+                raise
+
+
+def get_or_create_pvp_ranking(user: User) -> PvpRanking:
+    """
+    Devuelve el ranking PvP del usuario: una búsqueda por user_id (único).
+    Solo crea la fila si el usuario es anterior a la señal de alta y se
+    escapó del backfill.
+    """
+    ranking = PvpRanking.objects.filter(user=user).first()
+    if ranking is None:
+        ranking = create_pvp_ranking(user)
+    return ranking
+
+
+def can_challenge(attacker_position, target_position):
+    """El rival debe estar por encima, como mucho MAX_CHALLENGE_GAP puestos."""
+    return 0 < attacker_position - target_position <= MAX_CHALLENGE_GAP
+
+
+# Puesto libre donde se aparca al atacante durante el intercambio
+# (los puestos reales empiezan en 1)
+PARKING_POSITION = 0
+
+
+def _swap_positions(attacker_rank, target_rank):
+    """
+    Intercambia los puestos de dos rankings ya bloqueados. El UNIQUE de
+    position se comprueba fila a fila, así que el atacante se aparca antes
+    en PARKING_POSITION. Dos intercambios a la vez se esperan en ese puesto
+    (o chocan y se reintentan en swap_after_victory).
+    """
+    PvpRanking.objects.filter(id=attacker_rank.id).update(position=PARKING_POSITION)
+    PvpRanking.objects.filter(id=target_rank.id).update(position=attacker_rank.position)
+    PvpRanking.objects.filter(id=attacker_rank.id).update(position=target_rank.position)
+
+    attacker_rank.position, target_rank.position = target_rank.position, attacker_rank.position
+
+
+def swap_after_victory(attacker_rank_id, target_rank_id):
+    """
+    Tras ganar un desafío, el atacante y el rival intercambian puestos.
+
+    Bloquea ambas filas (select_for_update, siempre en orden de id para no
+    provocar deadlocks) y vuelve a validar el desafío con los puestos ACTUALES:
+    otro combate pudo moverlos mientras se simulaba este.
+    Devuelve el nuevo puesto del atacante, o None si ya no procede el cambio.
+    """
+    for attempt in range(SWAP_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                if not connection.features.has_select_for_update:
+                    # SQLite no tiene SELECT ... FOR UPDATE: una escritura nula
+                    # toma el bloqueo de escritura antes de leer los puestos
+                    PvpRanking.objects.filter(
+                        id__in=[attacker_rank_id, target_rank_id]
+                    ).update(position=F("position"))
+
+                ranks = {
+                    r.id: r
+                    for r in PvpRanking.objects
+                    .select_for_update()
+                    .filter(id__in=[attacker_rank_id, target_rank_id])
+                    .order_by("id")
+                }
+                attacker_rank = ranks.get(attacker_rank_id)
+                target_rank = ranks.get(target_rank_id)
+                if (
+                    attacker_rank is None
+                    or target_rank is None
+                    or not can_challenge(attacker_rank.position, target_rank.position)
+                ):
+                    return None
+
+                _swap_positions(attacker_rank, target_rank)
+                return attacker_rank.position
+
+        except (IntegrityError, OperationalError):
+            if attempt == SWAP_ATTEMPTS - 1:
+                raise
+            # Pequeña espera aleatoria antes de reintentar
+            time.sleep(random.uniform(0, 0.01 * (attempt + 1)))
@@ -0,0 +1,103 @@
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from ..models import UserProfile
+
+
+# Avisos en tiempo real por WebSocket (ver notes/consumers.UserStreamConsumer).
+# Cada usuario conectado está en el grupo "user_<id>"; aquí se le envían las
+# notificaciones nuevas y sus saldos, siempre DESPUÉS del commit (si la
+# transacción se deshace, no se avisa de nada).
+#
+# Con InMemoryChannelLayer solo llegan a los sockets del mismo proceso; con
+# varios workers hace falta un channel layer compartido (ej. Redis).
+
+logger = logging.getLogger(__name__)
+
+
+def user_group(user_id):
+    return f"user_{user_id}"
+
+
+def _enabled():
+    return getattr(settings, "REALTIME_PUSH_ENABLED", True)
+
+
+async def _group_send_all(layer, events):
+    for user_id, message in events:
+        await layer.group_send(user_group(user_id), message)
+
+
+def _send(events):
+    """events: [(user_id, mensaje)]. Un fallo del channel layer no rompe la request."""
+    layer = get_channel_layer()
+    if layer is None or not events:
+        return
+    try:
+        # Un solo salto al event loop para toda la tanda (ej. premios del World Boss)
+        async_to_sync(_group_send_all)(layer, events)
+    except Exception:
+        logger.exception("No se pudo enviar el aviso en tiempo real")
+
+
+def push_notifications(notifications):
+    """Avisa a cada destinatario de su notificación y de su nuevo total sin leer."""
+    if not _enabled() or not notifications:
+        return
+    items = [(n.user_id, n.message, n.url) for n in notifications]
+
+    def send():
+        unread = dict(
+            UserProfile.objects
+            .filter(user_id__in={uid for uid, _m, _u in items})
+            .values_list("user_id", "unread_notifications")
+        )
+        _send([
+            (uid, {"type": "notification.msg", "message": message, "url": url, "unread": unread.get(uid, 0)})
+            for uid, message, url in items
+        ])
+
+    transaction.on_commit(send)
+
+
+def push_unread(user_id):
+    """Total actual sin leer (ej. tras marcarlas como leídas, para las otras pestañas)."""
+    if not _enabled():
+        return
+
+    def send():
+        unread = (
+            UserProfile.objects
+            .filter(user_id=user_id)
+            .values_list("unread_notifications", flat=True)
+            .first()
+        )
+        _send([(user_id, {"type": "unread.msg", "unread": unread or 0})])
+
+    transaction.on_commit(send)
+
+
+def push_balances(user_ids):
+    """Envía los saldos actuales (monedas y rubíes) a los usuarios indicados."""
+    if not _enabled():
+        return
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+
+    def send():
+        rows = (
+            UserProfile.objects
+            .filter(user_id__in=user_ids)
+            .values_list("user_id", "coins", "rubies")
+        )
+        _send([
+            (uid, {"type": "balance.msg", "coins": coins, "rubies": rubies})
+            for uid, coins, rubies in rows
+        ])
+
+    transaction.on_commit(send)
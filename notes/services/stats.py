@@ -0,0 +1,144 @@
+from ..models import CombatItem, UserProfile
+
+
+BASE_HP = 100
+BASE_ATK = 10
+BASE_DEF = 0
+BASE_CRIT = 0.0
+BASE_DODGE = 0.0
+BASE_SPEED = 0
+
+# Slots de equipo con stats planos (sin mascota)
+GEAR_FIELDS = [
+    "equipped_weapon",
+    "equipped_helmet",
+    "equipped_armor",
+    "equipped_pants",
+    "equipped_boots",
+    "equipped_shield",
+    "equipped_amulet1",
+    "equipped_amulet2",
+    "equipped_amulet3",
+]
+
+EQUIPMENT_FIELDS = GEAR_FIELDS + ["equipped_pet"]
+
+# stat -> columna del snapshot en UserProfile
+SNAPSHOT_FIELDS = {
+    "hp": "stats_hp",
+    "attack": "stats_attack",
+    "defense": "stats_defense",
+    "crit_chance": "stats_crit_chance",
+    "dodge_chance": "stats_dodge_chance",
+    "speed": "stats_speed",
+}
+
+
+def base_stats():
+    return {
+        "hp": BASE_HP,
+        "attack": BASE_ATK,
+        "defense": BASE_DEF,
+        "crit_chance": BASE_CRIT,
+        "dodge_chance": BASE_DODGE,
+        "speed": BASE_SPEED,
+    }
+
+
+def compute_total_stats(gear_items, pet=None):
+    """
+    Suma los stats planos del equipo y luego aplica los % de la mascota
+    sobre los stats YA SUMADOS. Función pura (no toca la BD).
+    """
+    total = base_stats()
+
+    for item in gear_items:
+        if item is None:
+            continue
+        total["hp"] += item.hp
+        total["attack"] += item.attack
+        total["defense"] += item.defense
+        total["crit_chance"] += item.crit_chance
+        total["dodge_chance"] += item.dodge_chance
+        total["speed"] += item.speed
+
+    if pet is not None:
+        hp_pct = getattr(pet, "hp_pct", 0.0) or 0.0
+        atk_pct = getattr(pet, "attack_pct", 0.0) or 0.0
+        def_pct = getattr(pet, "defense_pct", 0.0) or 0.0
+
+        total["hp"] += int(total["hp"] * (hp_pct / 100.0))
+        total["attack"] += int(total["attack"] * (atk_pct / 100.0))
+        total["defense"] += int(total["defense"] * (def_pct / 100.0))
+
+    return total
+
+
+def equipped_item_ids(profile):
+    """IDs de todos los ítems equipados (incluida la mascota), sin tocar la BD."""
+    ids = set()
+    for field in EQUIPMENT_FIELDS:
+        item_id = getattr(profile, f"{field}_id", None)
+        if item_id:
+            ids.add(item_id)
+    return ids
+
+
+def unequip_items(profile, item_ids):
+    """
+    Desequipa los ítems indicados de cualquier slot del perfil.
+    No guarda: devuelve True si cambió algo.
+    """
+    item_ids = {int(i) for i in item_ids}
+    changed = False
+    for field in EQUIPMENT_FIELDS:
+        if getattr(profile, f"{field}_id", None) in item_ids:
+            setattr(profile, field, None)
+            changed = True
+    return changed
+
+
+def refresh_stats_snapshot(profile, save=True):
+    """
+    Recalcula el snapshot de stats del perfil a partir del equipo actual.
+    Carga todos los ítems equipados en UNA sola consulta.
+    Llamar cada vez que cambie el equipamiento (equipar, vender, listar, trade, VIP).
+    """
+    ids = equipped_item_ids(profile)
+    items_by_id = CombatItem.objects.in_bulk(ids) if ids else {}
+
+    gear = [items_by_id.get(getattr(profile, f"{f}_id")) for f in GEAR_FIELDS]
+    pet = items_by_id.get(profile.equipped_pet_id)
+
+    total = compute_total_stats(gear, pet)
+    for stat, column in SNAPSHOT_FIELDS.items():
+        setattr(profile, column, total[stat])
+
+    if save:
+        profile.save(update_fields=list(SNAPSHOT_FIELDS.values()))
+    return total
+
+
+def stats_from_profile(profile):
+    """Devuelve el snapshot guardado como el dict clásico de get_total_stats."""
+    return {stat: getattr(profile, column) for stat, column in SNAPSHOT_FIELDS.items()}
+
+
+def get_total_stats_many(user_ids):
+    """
+    Stats de muchos usuarios en UNA consulta: {user_id: stats_dict}.
+    Los usuarios sin perfil aún no tienen equipo, así que reciben los stats base.
+    """
+    user_ids = list(user_ids)
+    result = {uid: base_stats() for uid in user_ids}
+    if not user_ids:
+        return result
+
+    rows = UserProfile.objects.filter(user_id__in=user_ids).values(
+        "user_id", *SNAPSHOT_FIELDS.values()
+    )
+    for row in rows:
+        result[row["user_id"]] = {
+            stat: row[column] for stat, column in SNAPSHOT_FIELDS.items()
+        }
+    return result
@@ -0,0 +1,63 @@
+from django.contrib.auth.models import Group
+from django.db.models import Exists, OuterRef
+
+from ..models import UserProfile
+
+MODERATOR_GROUP_NAME = "moderador"
+
+# Atributo de la request donde se guarda el contexto ya cargado
+REQUEST_ATTR = "_user_context"
+
+
+class UserContext:
+    """
+    Lo que casi todas las páginas necesitan del usuario logueado: su perfil,
+    si es moderador y cuántas notificaciones tiene sin leer.
+    Se carga una vez por request (ver get_user_context).
+    """
+
+    def __init__(self, profile, is_moderator):
+        self.profile = profile
+        self.is_moderator = is_moderator
+
+    @property
+    def unread_count(self):
+        return self.profile.unread_notifications
+
+
+def _load(user):
+    """Perfil + moderador + no leídas en una sola consulta."""
+    # El contador de no leídas es una columna del perfil (services/notifications.py)
+    moderator = Group.objects.filter(user=OuterRef("user_id"), name__iexact=MODERATOR_GROUP_NAME)
+    qs = UserProfile.objects.filter(user=user).annotate(in_moderator_group=Exists(moderator))
+
+    profile = qs.first()
+    if profile is None:
+        # Primera visita sin perfil: se crea y se vuelve a leer
+        UserProfile.objects.get_or_create(user=user)
+        profile = qs.first()
+
+    return UserContext(
+        profile=profile,
+        is_moderator=user.is_superuser or profile.in_moderator_group,
+    )
+
+
+def get_user_context(request):
+    """
+    UserContext del usuario de la request, memorizado en la propia request:
+    las vistas y el context processor comparten el mismo perfil y no repiten
+    consultas. None si el usuario no está logueado.
+    """
+    if not request.user.is_authenticated:
+        return None
+    ctx = getattr(request, REQUEST_ATTR, None)
+    if ctx is None:
+        ctx = _load(request.user)
+        setattr(request, REQUEST_ATTR, ctx)
+    return ctx
+
+
+def get_request_profile(request):
+    """Perfil del usuario logueado (el mismo objeto durante toda la request)."""
+    return get_user_context(request).profile
@@ -0,0 +1,147 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import CurrencyLedgerEntry, UserProfile
+from .realtime import push_balances
+
+
+# Monedas y rubíes de UserProfile: todo cambio de saldo pasa por aquí.
+# Cada cambio es un UPDATE ... SET coins = coins + x (sin leer-modificar-guardar
+# el perfil entero) y el saldo suficiente se comprueba en el mismo UPDATE.
+# Tras el commit, el nuevo saldo se envía por WebSocket (services/realtime.py).
+
+
+class InsufficientFunds(Exception):
+    """El usuario no tiene monedas / rubíes suficientes (no se cambió nada)."""
+
+
+def _user_id(user):
+    return getattr(user, "pk", user)
+
+
+def _ledger_enabled():
+    return getattr(settings, "WALLET_LEDGER_ENABLED", True)
+
+
+def _record(entries, reason):
+    """entries: [(user_id, coins, rubies)]"""
+    if not _ledger_enabled():
+        return
+    now = timezone.now()
+    CurrencyLedgerEntry.objects.bulk_create(
+        [
+            CurrencyLedgerEntry(user_id=uid, coins=coins, rubies=rubies, reason=reason, created_at=now)
+            for uid, coins, rubies in entries
+            if coins or rubies
+        ],
+        batch_size=500,
+    )
+
+
+def change_balance(user, coins=0, rubies=0, reason="", min_coins=None, min_rubies=None,
+                   profile=None):
+    """
+    Suma `coins` / `rubies` (negativos = cobrar) al saldo del usuario.
+
+    Por defecto exige tener al menos lo que se cobra; `min_coins` /
+    `min_rubies` permiten exigir otro mínimo (ej. el gacha cobra el coste
+    completo aunque la misma tirada devuelva monedas por auto vender).
+    Lanza InsufficientFunds sin tocar nada si no alcanza.
+    Si se pasa `profile`, se refrescan sus coins / rubies tras el cambio.
+    """
+    user_id = _user_id(user)
+    if min_coins is None:
+        min_coins = max(0, -coins)
+    if min_rubies is None:
+        min_rubies = max(0, -rubies)
+
+    qs = UserProfile.objects.filter(user_id=user_id)
+    if min_coins > 0:
+        qs = qs.filter(coins__gte=min_coins)
+    if min_rubies > 0:
+        qs = qs.filter(rubies__gte=min_rubies)
+
+    changes = {
+        "coins": F("coins") + coins,
+        "rubies": F("rubies") + rubies,
+        "updated_at": timezone.now(),
+    }
+
+    with transaction.atomic():
+        if not qs.update(**changes):
+            if min_coins > 0 or min_rubies > 0:
+                raise InsufficientFunds()
+            # Perfil aún no creado: saldo 0, se crea y se abona
+            UserProfile.objects.get_or_create(user_id=user_id)
+            qs.update(**changes)
+        _record([(user_id, coins, rubies)], reason)
+        push_balances([user_id])
+
+    if profile is not None:
+        profile.refresh_from_db(fields=["coins", "rubies"])
+
+
+def credit(user, coins=0, rubies=0, reason="", profile=None):
+    """Abona monedas / rubíes."""
+    change_balance(user, coins=coins, rubies=rubies, reason=reason, profile=profile)
+
+
+def debit(user, coins=0, rubies=0, reason="", profile=None):
+    """Cobra monedas / rubíes; InsufficientFunds si no alcanza."""
+    change_balance(user, coins=-coins, rubies=-rubies, reason=reason, profile=profile)
+
+
+def transfer(from_user, to_user, coins, reason=""):
+    """
+    Pasa `coins` de un usuario a otro en una transacción.
+    InsufficientFunds si el que paga no tiene suficiente.
+    """
+    from_id, to_id = _user_id(from_user), _user_id(to_user)
+    with transaction.atomic():
+        # Siempre se escribe primero el id menor: dos transferencias cruzadas
+        # no se bloquean mutuamente
+        if from_id < to_id:
+            debit(from_id, coins=coins, reason=reason)
+            credit(to_id, coins=coins, reason=reason)
+        else:
+            credit(to_id, coins=coins, reason=reason)
+            debit(from_id, coins=coins, reason=reason)
+
+
+def credit_many(coins_by_user, reason=""):
+    """
+    Abona monedas a muchos usuarios: un UPDATE por cada importe distinto
+    (no uno por usuario). coins_by_user: {user_id: monedas}.
+    """
+    by_amount = defaultdict(list)
+    for uid, coins in coins_by_user.items():
+        if coins:
+            by_amount[coins].append(uid)
+    if not by_amount:
+        return
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Perfiles que falten (saldo 0); casi siempre no falta ninguno
+        existing = set(
+            UserProfile.objects
+            .filter(user_id__in=list(coins_by_user))
+            .values_list("user_id", flat=True)
+        )
+        missing = [uid for uid in coins_by_user if uid not in existing]
+        if missing:
+            UserProfile.objects.bulk_create(
+                [UserProfile(user_id=uid) for uid in missing],
+                ignore_conflicts=True,
+            )
+        for coins, user_ids in by_amount.items():
+            UserProfile.objects.filter(user_id__in=user_ids).update(
+                coins=F("coins") + coins,
+                updated_at=now,
+            )
+        _record([(uid, coins, 0) for uid, coins in coins_by_user.items()], reason)
+        push_balances([uid for uid, coins in coins_by_user.items() if coins])
@@ -0,0 +1,215 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import WorldBossCycle, WorldBossParticipant
+from .battle_log import append_battle_log
+from .stats import get_total_stats_many
+from .wallet import credit_many
+
+
+WORLD_BOSS_DAMAGE_PER_TURN = 75
+
+# Duración de cada fase dentro del bloque de 3 horas
+PREP_DURATION = timedelta(hours=1)
+BATTLE_DURATION = timedelta(hours=1)
+CYCLE_DURATION = timedelta(hours=3)
+# 1 turno por minuto de batalla
+BATTLE_TURNS = int(BATTLE_DURATION.total_seconds() // 60)
+
+
+def get_current_world_boss_cycle(now=None):
+    """
+    Cada día se divide en bloques de 3 horas empezando a las 00:00 (hora local).
+    Este helper devuelve el ciclo actual de World Boss (prep/batalla/reposo).
+    `now` permite inyectar un reloj falso (tests / scheduler).
+    """
+    now = timezone.localtime(now or timezone.now())
+    start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    minutes_since_midnight = now.hour * 60 + now.minute
+    block_minutes = 3 * 60  # 3 horas
+    cycle_index = minutes_since_midnight // block_minutes
+
+    cycle_start = start_of_day + timedelta(hours=3 * cycle_index)
+
+    cycle, _ = WorldBossCycle.objects.get_or_create(start_time=cycle_start)
+    return cycle, now, cycle_start
+
+
+def world_boss_phase(cycle, now_local, cycle_start):
+    """Devuelve "prep", "battle" o "rest" para el instante dado."""
+    if cycle.finished:
+        return "rest"
+
+    elapsed = now_local - cycle_start
+    if elapsed < PREP_DURATION:
+        return "prep"
+    if elapsed < PREP_DURATION + BATTLE_DURATION:
+        return "battle"
+    return "rest"
+
+
+def _turns_to_defeat(hp):
+    """Turnos que aguanta un jugador con `hp` de vida (0 si ya está derrotado)."""
+    if hp <= 0:
+        return 0
+    return -(-hp // WORLD_BOSS_DAMAGE_PER_TURN)
+
+
+def resolve_world_boss_turns(participants, stats_map, first_turn, pending_turns):
+    """
+    Resuelve de golpe `pending_turns` turnos de World Boss sin simular turno a turno.
+    Cada turno es determinista (ataque plano, daño fijo del jefe), así que el turno
+    en que cae cada jugador se calcula directamente desde su HP.
+
+    Modifica current_hp / total_damage_done de los participantes en memoria y
+    devuelve (turnos_ejecutados, daño_total_infligido, log_lines).
+    """
+    damage = {p.id: max(1, stats_map[p.user_id]["attack"]) for p in participants}  # sin defensa del jefe
+    lives = {p.id: _turns_to_defeat(p.current_hp) for p in participants}
+
+    turns_run = min(pending_turns, max(lives.values(), default=0))
+
+    log_lines = []
+    for offset in range(turns_run):
+        alive = [p for p in participants if lives[p.id] > offset]
+
+        log_lines.append(f"Turno {first_turn + offset}")
+        for p in alive:
+            log_lines.append(f"- {p.user.username} inflige {damage[p.id]} de daño al jefe.")
+
+        log_lines.append(f"- El jefe golpea a todos y hace 50 de daño.")
+        for p in alive:
+            if lives[p.id] == offset + 1:
+                log_lines.append(f"  · {p.user.username} ha sido derrotado.")
+
+        log_lines.append("")
+
+    total_damage = 0
+    for p in participants:
+        turns_alive = min(turns_run, lives[p.id])
+        if turns_alive <= 0:
+            continue
+        dealt = damage[p.id] * turns_alive
+        p.total_damage_done += dealt
+        total_damage += dealt
+        p.current_hp = max(0, p.current_hp - WORLD_BOSS_DAMAGE_PER_TURN * turns_alive)
+
+    return turns_run, total_damage, log_lines
+
+
+def advance_world_boss_battle(cycle: WorldBossCycle, now_local, cycle_start):
+    """
+    Avanza los turnos de la batalla en base al tiempo real transcurrido desde
+    el inicio de la fase de batalla. 1 turno = 1 minuto.
+    El jefe:
+      - recibe daño: sumamos el ataque de cada jugador vivo (sin defensa)
+      - golpea a todos los jugadores vivos con 75 de daño fijo.
+    La batalla termina cuando todos los participantes tienen 0 o menos de HP.
+    Al terminar:
+      - Se reparten 5 monedas por cada 100 puntos de daño TOTAL recibido
+        a TODOS los participantes de este ciclo.
+
+    Los turnos pendientes se resuelven en bloque (resolve_world_boss_turns), así
+    que el coste no depende de cuántos minutos lleve la batalla sin avanzarse.
+    """
+    if cycle.finished:
+        return
+
+    battle_start = cycle_start + PREP_DURATION  # prep = 1h, luego batalla
+
+    # Si aún no empieza la fase de batalla, no hacemos nada
+    if now_local <= battle_start:
+        return
+
+    # ¿Cuántos turnos deberían haberse ejecutado hasta ahora?
+    total_minutes = int((now_local - battle_start).total_seconds() // 60)
+    pending_turns = total_minutes - cycle.turns_processed
+    if pending_turns <= 0:
+        return
+
+    participants = list(
+        cycle.participants.select_related("user")
+    )
+    if not participants:
+        # Nadie participó: marcamos como terminada.
+        cycle.finished = True
+        cycle.save()
+        return
+
+    # Stats de todos los participantes en una sola consulta
+    stats_map = get_total_stats_many([p.user_id for p in participants])
+
+    first_turn = cycle.turns_processed + 1
+    turns_run, turn_damage, log_lines = resolve_world_boss_turns(
+        participants,
+        stats_map,
+        first_turn=first_turn,
+        pending_turns=pending_turns,
+    )
+    cycle.turns_processed += turns_run
+    cycle.total_damage += turn_damage
+
+    # Guardamos cambios en los participantes
+    WorldBossParticipant.objects.bulk_update(
+        participants,
+        ["current_hp", "total_damage_done"],
+    )
+
+    # Append del log (una fila por turno, sin releer lo anterior)
+    append_battle_log(first_turn, log_lines, cycle=cycle)
+
+    # ¿Queda alguien vivo?
+    if not any(p.current_hp > 0 for p in participants):
+        cycle.finished = True
+
+    # Si la batalla acaba y aún no se han repartido las recompensas, las damos
+    if cycle.finished and not cycle.rewards_given and cycle.total_damage > 0:
+        reward_per_player = (cycle.total_damage // 100) * 5
+        if reward_per_player > 0:
+            credit_many(
+                {p.user_id: reward_per_player for p in participants},
+                reason="world_boss",
+            )
+        cycle.rewards_given = True
+
+    cycle.save()
+
+
+def _advance_locked(cycle_pk, now_local, cycle_start):
+    """Avanza un ciclo con su fila bloqueada, como mucho hasta el final de su batalla."""
+    battle_end = cycle_start + PREP_DURATION + BATTLE_DURATION
+
+    with transaction.atomic():
+        cycle = WorldBossCycle.objects.select_for_update().get(pk=cycle_pk)
+        advance_world_boss_battle(cycle, min(now_local, battle_end), cycle_start)
+    return cycle
+
+
+def tick_world_boss(now=None):
+    """
+    Un "tick" del World Boss: avanza el ciclo actual hasta `now`.
+    Bloquea la fila del ciclo (select_for_update) para que varios workers
+    o procesos no procesen los mismos turnos a la vez.
+    Si ya terminó la ventana de batalla, se avanza hasta el final de esa ventana.
+
+    Si el scheduler estuvo parado (o el reloj saltó) al cambiar de ciclo, el
+    ciclo anterior se termina antes hasta el final de su batalla.
+
+    Devuelve el ciclo actualizado.
+    """
+    cycle, now_local, cycle_start = get_current_world_boss_cycle(now)
+
+    previous_start = cycle_start - CYCLE_DURATION
+    previous = (
+        WorldBossCycle.objects
+        .filter(start_time=previous_start, finished=False, turns_processed__lt=BATTLE_TURNS)
+        .values_list("pk", flat=True)
+        .first()
+    )
+    if previous is not None:
+        _advance_locked(previous, now_local, previous_start)
+
+    return _advance_locked(cycle.pk, now_local, cycle_start)
@@ -0,0 +1,22 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import GachaProbability
+from .services.gacha import invalidate_gacha_tables
+from .services.pvp import create_pvp_ranking
+
+
+@receiver(post_save, sender=User)
+def create_ranking_for_new_user(sender, instance, created, raw=False, **kwargs):
+    """Cada usuario nuevo entra al final del ranking PvP al registrarse."""
+    if created and not raw:
+        create_pvp_ranking(instance)
+
+
+@receiver(post_save, sender=GachaProbability)
+@receiver(post_delete, sender=GachaProbability)
+def invalidate_gacha_on_change(sender, **kwargs):
+    """Las tablas compiladas del gacha se recompilan tras confirmar el cambio."""
+    transaction.on_commit(invalidate_gacha_tables)
@@ -1,3 +1,1361 @@
-from django.test import TestCase
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from importlib import import_module
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.apps import apps as django_apps
+from django.contrib.auth.models import Group, User
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from expeditions.services.combat import Fighter, simulate_duel
+
+from .consumers import UserStreamConsumer
+from .models import (
+    CombatItem,
+    MarketListing,
+    GachaProbability,
+    GachaRollLog,
+    GachaRollStat,
+    CurrencyLedgerEntry,
+    GachaType,
+    ItemSlot,
+    MiniBossParticipant,
+    Note,
+    NoteLike,
+    NoteReply,
+    Notification,
+    PvpBattleLog,
+    PvpRanking,
+    TowerBattleResult,
+    UserProfile,
+    WorldBossParticipant,
+)
+from .scheduler import PeriodicJob, PeriodicScheduler
+from .services.battle_log import split_log_turns
+from .services.confidence import wilson_interval
+from .services.gacha import (
+    RUBY,
+    CompiledGacha,
+    build_alias_table,
+    get_compiled_gacha,
+    invalidate_gacha_tables,
+    pull_gacha_batch,
+    roll_gacha,
+)
+from .services.gacha_audit import gacha_rate_report, rollup_gacha_stats
+from .services.inventory import inventory_counts, inventory_page, sell_items
+from .services.market import PurchaseError, buy_listing, search_listings, suggested_prices
+from .services.miniboss import resolve_miniboss_turns
+from .services.note_feed import (
+    add_reply,
+    private_notes_page,
+    public_notes_page,
+    recount_note_counters,
+    toggle_note_like,
+)
+from .services.notifications import (
+    NOTIFICATIONS_PAGE_SIZE,
+    mark_all_read,
+    notifications_page,
+    notify,
+    notify_many,
+    purge_read_notifications,
+    recount_unread,
+)
+from .services.odds import ODDS_MIN_TRIALS, simulate_pvp_odds
+from .services.pvp import can_challenge, get_or_create_pvp_ranking, swap_after_victory
+from .services.stats import get_total_stats_many, refresh_stats_snapshot, stats_from_profile, unequip_items
+from .services.user_context import MODERATOR_GROUP_NAME, get_user_context
+from .services.wallet import InsufficientFunds, change_balance, credit_many, debit, transfer
+from .services.world_boss import get_current_world_boss_cycle, resolve_world_boss_turns, tick_world_boss
+
+
+def _legacy_miniboss_turns(participants, stats_map, damage_per_turn,
+                           current_turn, total_damage, turns_should_have):
+    """Copia del bucle turno a turno original, usada como referencia."""
+    alive = [p for p in participants if p.is_alive and p.hp_remaining > 0]
+    log_lines = []
+
+    while current_turn < turns_should_have and alive:
+        current_turn += 1
+        log_lines.append(f"Turno {current_turn}")
+
+        turn_total_damage = 0
+        for p in alive:
+            dmg = max(1, stats_map[p.user_id]["attack"])
+            p.total_damage_done += dmg
+            turn_total_damage += dmg
+
+        total_damage += turn_total_damage
+        log_lines.append(f"- Los jugadores infligen {turn_total_damage} de daño al jefe.")
+
+        log_lines.append(f"- El jefe contraataca con {damage_per_turn} de daño a cada jugador.")
+        for p in alive:
+            p.hp_remaining -= damage_per_turn
+            if p.hp_remaining <= 0:
+                p.hp_remaining = 0
+                p.is_alive = False
+                if p.boss_damage_at_death == 0:
+                    p.boss_damage_at_death = total_damage
+
+        alive = [p for p in alive if p.is_alive and p.hp_remaining > 0]
+        if not alive:
+            log_lines.append("- Todos los jugadores han sido derrotados.")
+        log_lines.append("")
+
+    return current_turn, total_damage, "\n".join(log_lines)
+
+
+def _random_participants(rng, count):
+    participants = []
+    for i in range(count):
+        dead = rng.random() < 0.1
+        participants.append(MiniBossParticipant(
+            user_id=i + 1,
+            hp_remaining=0 if dead else rng.randint(1, 600),
+            is_alive=not dead,
+            total_damage_done=rng.randint(0, 50),
+            boss_damage_at_death=rng.choice([0, 0, 0, 123]) if dead else 0,
+        ))
+    return participants
+
+
+def _snapshot(participants):
+    return [
+        (p.hp_remaining, p.is_alive, p.total_damage_done, p.boss_damage_at_death)
+        for p in participants
+    ]
+
+
+class MiniBossClosedFormTests(SimpleTestCase):
+    def test_matches_turn_by_turn_loop(self):
+        rng = random.Random(1234)
+        for _ in range(500):
+            count = rng.randint(0, 12)
+            seed = rng.random()
+            legacy = _random_participants(random.Random(seed), count)
+            fast = _random_participants(random.Random(seed), count)
+            stats_map = {
+                i + 1: {"attack": rng.randint(-5, 80)} for i in range(count)
+            }
+
+            damage_per_turn = rng.choice([30, 50, 100])
+            current_turn = rng.randint(0, 5)
+            total_damage = rng.randint(0, 2000)
+            turns_should_have = current_turn + rng.randint(0, 25)
+
+            expected = _legacy_miniboss_turns(
+                legacy, stats_map, damage_per_turn,
+                current_turn, total_damage, turns_should_have,
+            )
+            turn, damage, lines = resolve_miniboss_turns(
+                fast, stats_map, damage_per_turn,
+                current_turn, total_damage, turns_should_have,
+            )
+
+            self.assertEqual((turn, damage, "\n".join(lines)), expected)
+            self.assertEqual(_snapshot(fast), _snapshot(legacy))
+
+    def test_many_pending_turns_stop_when_everyone_dies(self):
+        participants = [
+            MiniBossParticipant(user_id=1, hp_remaining=100, is_alive=True),
+            MiniBossParticipant(user_id=2, hp_remaining=250, is_alive=True),
+        ]
+        stats_map = {1: {"attack": 10}, 2: {"attack": 20}}
+
+        turn, damage, lines = resolve_miniboss_turns(
+            participants, stats_map, 50,
+            current_turn=0, total_damage=0, turns_should_have=10_000,
+        )
+
+        self.assertEqual(turn, 5)
+        self.assertEqual(damage, 2 * 30 + 3 * 20)
+        self.assertEqual(participants[0].boss_damage_at_death, 60)
+        self.assertEqual(participants[1].boss_damage_at_death, 120)
+        self.assertIn("- Todos los jugadores han sido derrotados.", lines)
+
+
+def _legacy_world_boss_turns(participants, stats_map, first_turn, pending_turns):
+    """Copia del bucle turno a turno original del World Boss, usada como referencia."""
+    log_lines = []
+    turn_number = first_turn
+    turns_run = 0
+    total_damage = 0
+
+    for _ in range(pending_turns):
+        alive = [p for p in participants if p.current_hp > 0]
+        if not alive:
+            break
+
+        log_lines.append(f"Turno {turn_number}")
+        for p in alive:
+            dmg = max(1, stats_map[p.user_id]["attack"])
+            p.total_damage_done += dmg
+            total_damage += dmg
+            log_lines.append(f"- {p.user.username} inflige {dmg} de daño al jefe.")
+
+        log_lines.append(f"- El jefe golpea a todos y hace 50 de daño.")
+        for p in alive:
+            p.current_hp -= 75
+            if p.current_hp <= 0:
+                p.current_hp = 0
+                log_lines.append(f"  · {p.user.username} ha sido derrotado.")
+
+        log_lines.append("")
+        turn_number += 1
+        turns_run += 1
+
+    return turns_run, total_damage, log_lines
+
+
+def _random_world_boss_participants(rng, count):
+    return [
+        WorldBossParticipant(
+            id=i + 1,
+            user=User(id=i + 1, username=f"wb{i}"),
+            current_hp=rng.choice([0, rng.randint(1, 2000)]),
+            total_damage_done=rng.randint(0, 500),
+        )
+        for i in range(count)
+    ]
+
+
+class WorldBossClosedFormTests(SimpleTestCase):
+    def test_matches_turn_by_turn_loop(self):
+        rng = random.Random(4321)
+        for _ in range(300):
+            count = rng.randint(0, 10)
+            seed = rng.random()
+            legacy = _random_world_boss_participants(random.Random(seed), count)
+            fast = _random_world_boss_participants(random.Random(seed), count)
+            stats_map = {i + 1: {"attack": rng.randint(-5, 120)} for i in range(count)}
+            first_turn = rng.randint(1, 40)
+            pending_turns = rng.randint(0, 60)
+
+            expected = _legacy_world_boss_turns(legacy, stats_map, first_turn, pending_turns)
+            result = resolve_world_boss_turns(fast, stats_map, first_turn, pending_turns)
+
+            self.assertEqual(result, expected)
+            self.assertEqual(
+                [(p.current_hp, p.total_damage_done) for p in fast],
+                [(p.current_hp, p.total_damage_done) for p in legacy],
+            )
+
+
+class WorldBossTickTests(TestCase):
+    def setUp(self):
+        # Ciclo de 00:00: preparación hasta la 01:00, luego 1 turno por minuto
+        self.cycle_start = timezone.make_aware(datetime(2026, 1, 5, 0, 0))
+        cycle, _now, _start = get_current_world_boss_cycle(self.cycle_start)
+        for i in range(3):
+            user = User.objects.create(username=f"tick{i}")
+            WorldBossParticipant.objects.create(cycle=cycle, user=user, current_hp=5000)
+        self.cycle = cycle
+
+    def at(self, minutes):
+        return self.cycle_start + timedelta(hours=1, minutes=minutes)
+
+    def state(self):
+        self.cycle.refresh_from_db()
+        return self.cycle.turns_processed, self.cycle.total_damage, self.cycle.log_entries.count()
+
+    def test_each_turn_is_processed_once(self):
+        self.assertEqual(tick_world_boss(self.cycle_start + timedelta(minutes=30)).turns_processed, 0)
+
+        tick_world_boss(self.at(10))
+        self.assertEqual(self.state(), (10, 10 * 3 * 10, 10))
+
+        # Repetir el tick con el mismo reloj no rehace turnos
+        tick_world_boss(self.at(10))
+        self.assertEqual(self.state(), (10, 300, 10))
+
+        tick_world_boss(self.at(15))
+        self.assertEqual(self.state(), (15, 450, 15))
+        self.assertEqual(
+            list(self.cycle.log_entries.order_by("turn").values_list("turn", flat=True)),
+            list(range(1, 16)),
+        )
+
+        # Pasada la ventana de batalla solo se llega hasta su final (60 turnos)
+        tick_world_boss(self.at(90))
+        tick_world_boss(self.at(95))
+        self.assertEqual(self.state()[0], 60)
+
+    def test_tick_in_next_cycle_finishes_the_previous_battle(self):
+        tick_world_boss(self.at(10))
+
+        # El reloj salta más allá de toda la ventana: el siguiente tick ya cae
+        # en el ciclo de las 03:00, y aun así se juegan los 50 turnos que faltaban
+        next_cycle = tick_world_boss(self.cycle_start + timedelta(hours=3, minutes=30))
+        self.assertEqual(self.state(), (60, 60 * 3 * 10, 60))
+        self.assertEqual(next_cycle.start_time, self.cycle_start + timedelta(hours=3))
+        self.assertEqual(next_cycle.turns_processed, 0)
+
+        tick_world_boss(self.cycle_start + timedelta(hours=3, minutes=31))
+        self.assertEqual(self.state(), (60, 1800, 60))
+
+
+class PeriodicSchedulerTests(SimpleTestCase):
+    def test_run_survives_job_errors_with_fake_clock(self):
+        start = timezone.make_aware(datetime(2026, 1, 5, 1, 0))
+        ticks = iter(range(100))
+        clock = lambda: start + timedelta(minutes=next(ticks))
+        slept = []
+
+        async def fake_sleep(seconds):
+            slept.append(seconds)
+
+        seen = []
+
+        def flaky(now):
+            seen.append(("flaky", now))
+            if len(seen) == 1:
+                raise RuntimeError("BD caída")
+
+        def steady(now):
+            seen.append(("steady", now))
+
+        scheduler = PeriodicScheduler(
+            jobs=[PeriodicJob("flaky", flaky, "X"), PeriodicJob("steady", steady, "Y")],
+            interval=60, clock=clock, sleep=fake_sleep,
+        )
+        with self.assertLogs("notes.scheduler", "ERROR") as logs:
+            async_to_sync(scheduler.run)(max_ticks=3)
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(slept, [60, 60, 60])
+        self.assertEqual(
+            seen,
+            [(name, start + timedelta(minutes=i)) for i, name in enumerate(["flaky", "steady"] * 3)],
+        )
+
+
+class BattleLogSplitTests(SimpleTestCase):
+    def test_one_block_per_turn(self):
+        lines = ["Turno 3", "- a", "", "Turno 4", "- b", "- c", ""]
+        self.assertEqual(
+            split_log_turns(3, lines),
+            [(3, "Turno 3\n- a"), (4, "Turno 4\n- b\n- c")],
+        )
+
+    def test_lines_without_separator(self):
+        self.assertEqual(split_log_turns(0, ["Comienza la batalla."]), [(0, "Comienza la batalla.")])
+        self.assertEqual(split_log_turns(1, []), [])
+
+
+def _legacy_tower_log(user_stats, enemy_stats, max_turns=50):
+    """Copia del simulate_battle original, que armaba el texto turno a turno."""
+    log_lines = []
+
+    player_hp = user_stats["hp"]
+    player_atk = user_stats["attack"]
+    player_def = user_stats["defense"]
+    player_crit = user_stats["crit_chance"]
+    player_dodge = user_stats["dodge_chance"]
+    player_speed = user_stats["speed"]
+
+    enemy_hp = enemy_stats["hp"]
+    enemy_atk = enemy_stats["attack"]
+    enemy_def = enemy_stats["defense"]
+    enemy_speed = 0
+
+    for turn in range(1, max_turns + 1):
+        if player_hp <= 0 or enemy_hp <= 0:
+            break
+
+        log_lines.append(f"TURNO {turn}:")
+
+        if player_speed > enemy_speed:
+            first = "player"
+        elif enemy_speed > player_speed:
+            first = "enemy"
+        else:
+            first = random.choice(["player", "enemy"])
+
+        def do_attack(attacker_name):
+            nonlocal player_hp, enemy_hp
+            if attacker_name == "player":
+                dmg = max(1, player_atk - enemy_def)
+                crit = random.random() < (player_crit / 100.0)
+                if crit:
+                    dmg *= 2
+                enemy_hp -= dmg
+                if crit:
+                    log_lines.append(f"- El jugador hace {dmg} de daño CRÍTICO al enemigo.")
+                else:
+                    log_lines.append(f"- El jugador hace {dmg} de daño al enemigo.")
+            else:
+                if random.random() < (player_dodge / 100.0):
+                    log_lines.append("- El enemigo ataca pero el jugador ESQUIVA el golpe.")
+                    return
+                dmg = max(1, enemy_atk - player_def)
+                player_hp -= dmg
+                log_lines.append(f"- El enemigo hace {dmg} de daño al jugador.")
+
+        if first == "player":
+            do_attack("player")
+            if enemy_hp <= 0:
+                log_lines.append("El enemigo ha sido derrotado.")
+                break
+            do_attack("enemy")
+            if player_hp <= 0:
+                log_lines.append("El jugador ha sido derrotado.")
+                break
+        else:
+            do_attack("enemy")
+            if player_hp <= 0:
+                log_lines.append("El jugador ha sido derrotado.")
+                break
+            do_attack("player")
+            if enemy_hp <= 0:
+                log_lines.append("El enemigo ha sido derrotado.")
+                break
+
+    victory = player_hp > 0 and enemy_hp <= 0
+    return victory, "\n".join(log_lines)
+
+
+def _legacy_pvp_log(atk, deff, attacker_name, defender_name):
+    """Copia del simulate_pvp_battle original (stats ya leídos)."""
+    log = []
+    log.append(f"Combate PvP entre {attacker_name} y {defender_name}\n")
+
+    atk_hp = atk["hp"]
+    def_hp = deff["hp"]
+
+    if atk["speed"] > deff["speed"]:
+        turn = "A"
+    elif deff["speed"] > atk["speed"]:
+        turn = "D"
+    else:
+        turn = random.choice(["A", "D"])
+
+    turno = 1
+
+    while atk_hp > 0 and def_hp > 0:
+        log.append(f"Turno {turno}")
+
+        if turn == "A":
+            base = max(1, atk["attack"] - deff["defense"])
+            crit = random.random() < (atk["crit_chance"] / 100.0)
+            dodge = random.random() < (deff["dodge_chance"] / 100.0)
+
+            if dodge:
+                log.append(f" - {defender_name} esquiva el ataque.")
+                dmg = 0
+            else:
+                dmg = base * (2 if crit else 1)
+
+            def_hp -= dmg
+            log.append(f" - {attacker_name} hace {dmg} de daño.")
+            log.append(f"   Vida: {attacker_name}={atk_hp} | {defender_name}={max(def_hp, 0)}")
+            turn = "D"
+        else:
+            base = max(1, deff["attack"] - atk["defense"])
+            crit = random.random() < (deff["crit_chance"] / 100.0)
+            dodge = random.random() < (atk["dodge_chance"] / 100.0)
+
+            if dodge:
+                log.append(f" - {attacker_name} esquiva el ataque.")
+                dmg = 0
+            else:
+                dmg = base * (2 if crit else 1)
+
+            atk_hp -= dmg
+            log.append(f" - {defender_name} hace {dmg} de daño.")
+            log.append(f"   Vida: {attacker_name}={max(atk_hp, 0)} | {defender_name}={def_hp}")
+            turn = "A"
+
+        log.append("")
+        turno += 1
+
+    if atk_hp > 0:
+        log.append(f"{attacker_name} gana el combate.")
+        return True, "\n".join(log)
+    log.append(f"{defender_name} gana el combate.")
+    return False, "\n".join(log)
+
+
+def _legacy_duel_log(f, enemy_hp, enemy_atk, enemy_def, max_turns=50):
+    """Copia del simulate_duel original, con el log como lista de frases."""
+    log = []
+    p_hp = int(f.hp)
+    e_hp = int(enemy_hp)
+
+    for t in range(1, max_turns + 1):
+        if p_hp <= 0 or e_hp <= 0:
+            break
+
+        dmg = max(1, f.attack - enemy_def)
+        e_hp -= dmg
+        log.append(f"T{t}: {f.username} golpea por {dmg} (enemigo {max(e_hp,0)} HP)")
+        if e_hp <= 0:
+            break
+
+        edmg = max(1, enemy_atk - f.defense)
+        p_hp -= edmg
+        log.append(f"T{t}: enemigo golpea por {edmg} ({f.username} {max(p_hp,0)} HP)")
+
+    victory = e_hp <= 0 and p_hp > 0
+    return victory, max(p_hp, 0), log
+
+
+def _random_fighter_stats(rng):
+    return {
+        "hp": rng.randint(1, 400),
+        "attack": rng.randint(1, 60),
+        "defense": rng.randint(0, 40),
+        "crit_chance": rng.choice([0.0, 12.5, 50.0, 100.0]),
+        "dodge_chance": rng.choice([0.0, 10.0, 35.0, 90.0]),
+        "speed": rng.randint(0, 3),
+    }
+
+
+class CombatLogRegressionTests(TestCase):
+    """El log empaquetado y luego renderizado debe ser el mismo texto que armaban los simuladores antiguos."""
+
+    def test_tower_log_matches_legacy(self):
+        from .views import simulate_battle
+
+        rng = random.Random(606)
+        for seed in range(300):
+            user_stats = _random_fighter_stats(rng)
+            enemy_stats = _random_fighter_stats(rng)
+            max_turns = rng.choice([1, 5, 50])
+
+            random.seed(seed)
+            expected = _legacy_tower_log(user_stats, enemy_stats, max_turns)
+            random.seed(seed)
+            victory, packed = simulate_battle(user_stats, enemy_stats, max_turns)
+
+            result = TowerBattleResult(victory=victory, log_events=packed)
+            self.assertEqual((victory, result.render_log()), expected, seed)
+
+    def test_pvp_log_matches_legacy(self):
+        from .views import simulate_pvp_battle
+
+        attacker = User.objects.create(username="log_atacante")
+        defender = User.objects.create(username="log_defensor")
+        UserProfile.objects.create(user=attacker)
+        UserProfile.objects.create(user=defender)
+
+        rng = random.Random(607)
+        for seed in range(200):
+            stats = {attacker.id: _random_fighter_stats(rng), defender.id: _random_fighter_stats(rng)}
+            for user_id, values in stats.items():
+                UserProfile.objects.filter(user_id=user_id).update(
+                    **{f"stats_{stat}": value for stat, value in values.items()}
+                )
+
+            random.seed(seed)
+            expected = _legacy_pvp_log(
+                stats[attacker.id], stats[defender.id], attacker.username, defender.username
+            )
+            random.seed(seed)
+            won, packed = simulate_pvp_battle(attacker, defender)
+
+            log = PvpBattleLog(attacker=attacker, defender=defender, attacker_won=won, log_events=packed)
+            self.assertEqual((won, log.render_log()), expected, seed)
+
+    def test_duel_log_matches_legacy(self):
+        rng = random.Random(608)
+        for _ in range(300):
+            fighter = Fighter(
+                username="duelista", max_hp=500, hp=rng.randint(0, 300),
+                attack=rng.randint(0, 60), defense=rng.randint(0, 40),
+            )
+            enemy = (rng.randint(0, 300), rng.randint(0, 60), rng.randint(0, 40))
+            max_turns = rng.choice([1, 5, 50])
+
+            expected = _legacy_duel_log(fighter, *enemy, max_turns=max_turns)
+            result = simulate_duel(fighter, *enemy, max_turns=max_turns)
+
+            self.assertEqual((result.victory, result.fighter_end_hp, result.log), expected)
+
+
+def _alias_distribution(prob, alias):
+    """Probabilidad exacta de cada resultado según la tabla alias."""
+    n = len(prob)
+    dist = [0.0] * n
+    for i in range(n):
+        dist[i] += prob[i] / n
+        dist[alias[i]] += (1.0 - prob[i]) / n
+    return dist
+
+
+class PvpOddsTests(SimpleTestCase):
+    @staticmethod
+    def stats(hp, attack, defense=0, dodge=0):
+        return {"hp": hp, "attack": attack, "defense": defense,
+                "crit_chance": 0, "dodge_chance": dodge, "speed": 0}
+
+    def test_capped_fights_are_undecided_and_stop_early(self):
+        tank = self.stats(5000, 10, defense=50, dodge=50)
+        odds = simulate_pvp_odds(tank, tank, rng=random.Random(1))
+        self.assertEqual((odds["win_prob"], odds["undecided_prob"]), (0.0, 1.0))
+        self.assertEqual(odds["trials"], ODDS_MIN_TRIALS)
+
+    def test_even_fight_stops_at_margin(self):
+        even = self.stats(100, 10)
+        odds = simulate_pvp_odds(even, even, rng=random.Random(1))
+        self.assertLess(odds["trials"], 2000)
+        self.assertAlmostEqual(odds["win_prob"], 0.5, delta=0.05)
+        self.assertEqual(odds["undecided_prob"], 0.0)
+
+
+class GachaAliasTableTests(SimpleTestCase):
+    def test_alias_table_keeps_weights(self):
+        weights = [0.8, 0.15, 0.04, 0.009, 0.0009, 0.00009, 0.00001]
+        dist = _alias_distribution(*build_alias_table(weights))
+        for expected, got in zip(weights, dist):
+            self.assertAlmostEqual(expected, got, places=12)
+
+    def test_premium_leftover_is_ruby(self):
+        compiled = CompiledGacha(GachaType.PREMIUM, [("special", 0.5), ("epic", 0.25)])
+        self.assertEqual(compiled.outcomes[-1], RUBY)
+        dist = _alias_distribution(compiled._prob, compiled._alias)
+        self.assertAlmostEqual(dist[-1], 0.25)
+
+        rng = random.Random(7)
+        rolls = [compiled.sample(rng) for _ in range(20000)]
+        self.assertAlmostEqual(rolls.count(RUBY) / len(rolls), 0.25, delta=0.02)
+
+    def test_normal_leftover_goes_to_last_rarity(self):
+        compiled = CompiledGacha(GachaType.NORMAL, [("basic", 0.5), ("ascended", 0.0)])
+        self.assertNotIn(RUBY, compiled.outcomes)
+        dist = _alias_distribution(compiled._prob, compiled._alias)
+        self.assertAlmostEqual(dist[-1], 0.5)
+
+
+class GachaCacheTests(TestCase):
+    def setUp(self):
+        # La tabla compilada vive en el proceso: no debe venir de otro test
+        invalidate_gacha_tables()
+
+    def test_roll_without_queries_and_invalidation_on_save(self):
+        get_compiled_gacha(GachaType.NORMAL)
+        with self.assertNumQueries(0):
+            for _ in range(100):
+                roll_gacha(GachaType.NORMAL)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            GachaProbability.objects.filter(gacha_type=GachaType.NORMAL).exclude(
+                rarity="epic"
+            ).update(probability=0.0)
+            row = GachaProbability.objects.get(gacha_type=GachaType.NORMAL, rarity="epic")
+            row.probability = 1.0
+            row.save()
+
+        self.assertEqual({roll_gacha(GachaType.NORMAL) for _ in range(50)}, {"epic"})
+
+
+class GachaBatchTests(TestCase):
+    def setUp(self):
+        from .views import _build_gacha_item
+
+        self.build_item = _build_gacha_item
+        invalidate_gacha_tables()
+        self.user = User.objects.create(username="gacha")
+        self.profile = UserProfile.objects.create(user=self.user, coins=10000)
+
+    def test_auto_sold_rolls_are_not_created(self):
+        sell_all_but_epic = {code: 1 for code in ["basic", "uncommon", "special",
+                                                   "legendary", "mythic", "ascended"]}
+        batch = pull_gacha_batch(
+            self.user, GachaType.NORMAL, 100, [ItemSlot.WEAPON], self.build_item,
+            sell_all_but_epic, rng=random.Random(3),
+        )
+        kept = [r for r in batch.rolls if r["item"] is not None]
+        self.assertEqual(CombatItem.objects.filter(owner=self.user).count(), len(kept))
+        self.assertTrue(all(r["rarity"] == "epic" for r in kept))
+
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.coins, 10000 - batch.cost + batch.sold_coins)
+        self.assertEqual(batch.sold_coins, 100 - len(kept))
+
+    def test_not_enough_coins(self):
+        self.assertIsNone(pull_gacha_batch(
+            self.user, GachaType.PREMIUM, 100, [ItemSlot.WEAPON], self.build_item, {},
+        ))
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.coins, 10000)
+        self.assertFalse(CombatItem.objects.filter(owner=self.user).exists())
+
+
+class GachaAuditTests(TestCase):
+    def setUp(self):
+        invalidate_gacha_tables()
+        self.user = User.objects.create(username="audit")
+
+    def test_wilson_interval(self):
+        low, high = wilson_interval(80, 100)
+        self.assertAlmostEqual(low, 0.7111, places=3)
+        self.assertAlmostEqual(high, 0.8666, places=3)
+        self.assertEqual(wilson_interval(0, 0), (0.0, 1.0))
+
+    def test_rollup_and_report(self):
+        now = timezone.now()
+        last_hour = now - timedelta(hours=1)
+        rolls = ["basic"] * 8 + ["epic"] * 2
+        GachaRollLog.objects.bulk_create(
+            [
+                GachaRollLog(user=self.user, gacha_type="normal", rarity=r, created_at=last_hour)
+                for r in rolls
+            ]
+            # Hora en curso: no se resume, pero el informe la cuenta
+            + [GachaRollLog(user=self.user, gacha_type="normal", rarity="basic", created_at=now)]
+        )
+
+        self.assertEqual(rollup_gacha_stats(now), 2)
+        self.assertEqual(
+            dict(GachaRollStat.objects.values_list("rarity", "count")),
+            {"basic": 8, "epic": 2},
+        )
+        # Una tirada que entra tarde en la última hora cerrada se cuenta en
+        # la siguiente pasada (se recalcula, no se duplica)
+        GachaRollLog.objects.create(
+            user=self.user, gacha_type="normal", rarity="basic", created_at=last_hour
+        )
+        self.assertEqual(rollup_gacha_stats(now), 2)
+        self.assertEqual(rollup_gacha_stats(now), 2)
+        self.assertEqual(
+            dict(GachaRollStat.objects.values_list("rarity", "count")),
+            {"basic": 9, "epic": 2},
+        )
+
+        report = gacha_rate_report(GachaType.NORMAL, days=1, now=now)
+        rows = {r["code"]: r for r in report["rows"]}
+        self.assertEqual(report["total"], 12)
+        self.assertEqual(rows["basic"]["count"], 10)
+        self.assertTrue(rows["basic"]["ok"])
+        # 2 épicos de 12 con probabilidad configurada 0.9 %: fuera del intervalo
+        self.assertFalse(rows["epic"]["ok"])
+
+    def test_batch_logs_every_roll(self):
+        from .views import _build_gacha_item
+
+        UserProfile.objects.create(user=self.user, coins=1000)
+        pull_gacha_batch(
+            self.user, GachaType.NORMAL, 10, [ItemSlot.BOOTS], _build_gacha_item,
+            {"basic": 2},
+        )
+        self.assertEqual(GachaRollLog.objects.filter(user=self.user).count(), 10)
+
+
+class StatsSnapshotTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="stats_user")
+        self.profile = UserProfile.objects.create(user=self.user)
+        self.sword = CombatItem.objects.create(
+            owner=self.user, name="Espada", slot=ItemSlot.WEAPON, rarity="epic",
+            attack=15, hp=20, crit_chance=5.0,
+        )
+        self.pet = CombatItem.objects.create(
+            owner=self.user, name="Gato", slot=ItemSlot.PET, rarity="rare", attack_pct=50.0,
+        )
+
+    def snapshot(self):
+        return stats_from_profile(UserProfile.objects.get(user=self.user))
+
+    def test_equip_and_unequip_update_snapshot(self):
+        self.client.force_login(self.user)
+        for item in (self.sword, self.pet):
+            self.client.post(reverse("rpg_inventory"), {"action": "equip", "item_id": item.id})
+        self.assertEqual(
+            self.snapshot(),
+            {"hp": 120, "attack": 37, "defense": 0, "crit_chance": 5.0,
+             "dodge_chance": 0.0, "speed": 0},  # (10 + 15) * 1.5
+        )
+
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertTrue(unequip_items(profile, [self.sword.id, self.pet.id]))
+        refresh_stats_snapshot(profile)
+        self.assertEqual(self.snapshot(), {"hp": 100, "attack": 10, "defense": 0,
+                                           "crit_chance": 0.0, "dodge_chance": 0.0, "speed": 0})
+
+    def test_many_matches_per_user(self):
+        from .views import get_total_stats
+
+        self.profile.equipped_weapon = self.sword
+        refresh_stats_snapshot(self.profile, save=False)
+        self.profile.save()
+        no_profile = User.objects.create(username="stats_sin_perfil")
+
+        many = get_total_stats_many([self.user.id, no_profile.id])
+        self.assertEqual(many[self.user.id], get_total_stats(self.user))
+        self.assertEqual(many[no_profile.id], get_total_stats(no_profile))
+
+
+class WalletTests(TestCase):
+    def setUp(self):
+        self.a = User.objects.create(username="wallet_a")
+        self.b = User.objects.create(username="wallet_b")
+        UserProfile.objects.create(user=self.a, coins=100, rubies=2)
+        UserProfile.objects.create(user=self.b, coins=10)
+
+    def balance(self, user):
+        return tuple(UserProfile.objects.filter(user=user).values_list("coins", "rubies").get())
+
+    def test_debit_checks_balance_in_sql(self):
+        with self.assertRaises(InsufficientFunds):
+            debit(self.b, coins=11, reason="test")
+        with self.assertRaises(InsufficientFunds):
+            debit(self.a, coins=1, rubies=3, reason="test")
+        self.assertEqual(self.balance(self.b), (10, 0))
+        self.assertEqual(self.balance(self.a), (100, 2))
+
+        # El mínimo exigido puede ser mayor que el cambio neto
+        with self.assertRaises(InsufficientFunds):
+            change_balance(self.b, coins=-5, min_coins=20, reason="test")
+
+    def test_transfer_and_ledger(self):
+        transfer(self.a, self.b, 60, reason="test")
+        self.assertEqual(self.balance(self.a), (40, 2))
+        self.assertEqual(self.balance(self.b), (70, 0))
+        with self.assertRaises(InsufficientFunds):
+            transfer(self.a, self.b, 41, reason="test")
+        self.assertEqual(self.balance(self.b), (70, 0))
+        self.assertEqual(
+            sorted(CurrencyLedgerEntry.objects.values_list("user__username", "coins")),
+            [("wallet_a", -60), ("wallet_b", 60)],
+        )
+
+    def test_credit_many_creates_missing_profiles(self):
+        c = User.objects.create(username="wallet_c")
+        credit_many({self.a.id: 5, self.b.id: 5, c.id: 7}, reason="test")
+        self.assertEqual(self.balance(self.a), (105, 2))
+        self.assertEqual(self.balance(c), (7, 0))
+
+
+class InventorySellTests(TestCase):
+    PRICES = {"basic": 2, "epic": 100}
+
+    def setUp(self):
+        self.user = User.objects.create(username="seller_bulk")
+        self.profile = UserProfile.objects.create(user=self.user, coins=0)
+        self.basics = [
+            CombatItem.objects.create(owner=self.user, name=f"B{i}", slot=ItemSlot.WEAPON, rarity="basic")
+            for i in range(5)
+        ]
+        self.epic = CombatItem.objects.create(owner=self.user, name="E", slot=ItemSlot.HELMET, rarity="epic")
+        self.profile.equipped_weapon = self.basics[0]
+        self.profile.equipped_helmet = self.epic
+        self.profile.save()
+
+    def test_sell_selected_unequips_and_pays_once(self):
+        ids = [self.basics[0].id, self.basics[1].id, self.epic.id]
+        self.assertEqual(sell_items(self.user, self.PRICES, item_ids=ids, profile=self.profile), (3, 104))
+
+        self.assertEqual(self.profile.coins, 104)
+        self.assertIsNone(self.profile.equipped_weapon_id)
+        self.assertIsNone(self.profile.equipped_helmet_id)
+        self.assertEqual(CombatItem.objects.filter(owner=self.user).count(), 3)
+        self.assertEqual(CurrencyLedgerEntry.objects.filter(user=self.user).count(), 1)
+
+    def test_sell_rarity_keeps_equipped_and_listed(self):
+        listed = self.basics[1]
+        MarketListing.objects.create(item=listed, seller=self.user, price_coins=5)
+
+        sold = sell_items(self.user, self.PRICES, rarity="basic", keep_ids={self.basics[0].id})
+        self.assertEqual(sold, (3, 6))
+        self.assertEqual(
+            set(CombatItem.objects.filter(owner=self.user).values_list("id", flat=True)),
+            {self.basics[0].id, listed.id, self.epic.id},
+        )
+        self.assertEqual(sell_items(self.user, self.PRICES, item_ids=[]), (0, 0))
+
+
+class InventoryPageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="inv_pages")
+        rarities = ["basic", "ascended", "epic", "uncommon", "epic", "basic", "legendary"]
+        CombatItem.objects.bulk_create([
+            CombatItem(owner=self.user, name=f"I{i}", slot=ItemSlot.WEAPON if i % 2 else ItemSlot.PET, rarity=r)
+            for i, r in enumerate(rarities)
+        ])
+        listed = CombatItem.objects.filter(owner=self.user, rarity="uncommon").get()
+        MarketListing.objects.create(item=listed, seller=self.user, price_coins=5)
+
+    def test_pages_follow_true_rarity_order(self):
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                page, cursor = inventory_page(self.user, cursor=cursor, limit=2)
+            seen.extend(page)
+            if cursor is None:
+                break
+        # Sin el ítem en venta; ascendida > legendaria > épica (un orden de texto fallaría)
+        self.assertEqual(
+            [i.rarity for i in seen],
+            ["ascended", "legendary", "epic", "epic", "basic", "basic"],
+        )
+
+    def test_counts_from_one_group_by(self):
+        with self.assertNumQueries(1):
+            counts = inventory_counts(self.user)
+        self.assertEqual(counts["total"], 6)
+        self.assertEqual(counts["by_slot"][ItemSlot.PET], 4)
+        self.assertEqual(counts["by_rarity"][0], ("basic", "Básica", 2))
+
+    def test_json_endpoint(self):
+        self.client.force_login(self.user)
+        _page, cursor = inventory_page(self.user, limit=2)
+        data = self.client.get(reverse("rpg_inventory_page"), {"cursor": cursor}).json()
+        self.assertEqual(data["html"].count("<tr>"), 4)
+        self.assertIsNone(data["next_cursor"])
+
+
+class MarketSearchTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create(username="market_search")
+        rarities = ["basic", "epic", "epic", "legendary", "basic", "epic", "mythic"]
+        for i, rarity in enumerate(rarities):
+            item = CombatItem.objects.create(
+                owner=self.seller, name=f"Item {i}", slot=ItemSlot.WEAPON, rarity=rarity
+            )
+            # Precios repetidos: el id desempata en el cursor
+            MarketListing.objects.create(item=item, seller=self.seller, price_coins=10 * (i % 3))
+
+    def _walk(self, **filters):
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                page, cursor = search_listings(cursor=cursor, limit=2, **filters)
+            seen.extend(page)
+            if cursor is None:
+                return seen
+
+    def test_keyset_pages_match_full_ordering(self):
+        active = MarketListing.objects.filter(is_active=True)
+        for sort, order in [("price", ["price_coins", "id"]),
+                            ("price_desc", ["-price_coins", "-id"]),
+                            ("new", ["-created_at", "-id"])]:
+            self.assertEqual(
+                [l.id for l in self._walk(sort=sort)],
+                list(active.order_by(*order).values_list("id", flat=True)),
+            )
+
+    def test_bad_cursor_restarts_from_first_page(self):
+        bad = ["basura", "1:2:3", "9999999999999999999999999:1", "1:99999999999999999999999"]
+        # Cabe en BIGINT pero no es una fecha válida
+        for sort, cursors in (("price", bad), ("new", bad + ["999999999999999999:1"])):
+            first, _cursor = search_listings(sort=sort, limit=2)
+            for cursor in cursors:
+                page, _next = search_listings(sort=sort, cursor=cursor, limit=2)
+                self.assertEqual(page, first, (sort, cursor))
+
+    def test_filters_use_denormalized_columns(self):
+        listings = self._walk(rarity="epic", min_price=10, max_price=20)
+        self.assertTrue(listings)
+        for listing in listings:
+            self.assertEqual(listing.rarity, listing.item.rarity)
+            self.assertEqual(listing.rarity, "epic")
+            self.assertTrue(10 <= listing.price_coins <= 20)
+
+
+class MarketPriceIndexTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create(username="price_seller")
+        self.buyer = User.objects.create(username="price_buyer")
+        UserProfile.objects.create(user=self.buyer, coins=10_000)
+
+    def _sell(self, price, rarity="epic"):
+        item = CombatItem.objects.create(
+            owner=self.seller, name="Casco", slot=ItemSlot.HELMET, rarity=rarity
+        )
+        listing = MarketListing.objects.create(item=item, seller=self.seller, price_coins=price)
+        buy_listing(listing.id, self.buyer)
+
+    def test_sales_update_daily_aggregates(self):
+        for price in [100, 120, 90, 1000, 110]:
+            self._sell(price)
+        self._sell(7, rarity="basic")
+
+        with self.assertNumQueries(1):
+            prices = suggested_prices()
+        epic = prices[(ItemSlot.HELMET, "epic")]
+        self.assertEqual((epic["sales"], epic["min"], epic["max"]), (5, 90, 1000))
+        self.assertEqual(epic["avg"], 284)
+        # Mediana real 110; la de los buckets queda a menos de un 10 %
+        self.assertAlmostEqual(epic["median"], 110, delta=11)
+        self.assertEqual(prices[(ItemSlot.HELMET, "basic")]["median"], 7)
+
+        # Fuera de la ventana de días no cuenta
+        later = timezone.localdate() + timedelta(days=30)
+        self.assertEqual(suggested_prices(today=later), {})
+
+
+class UserContextTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="ctx_user")
+        UserProfile.objects.create(user=self.user, coins=42)
+        notify(self.user, "a")
+        notify(self.user, "b")
+
+    def _request(self, user):
+        request = RequestFactory().get("/")
+        request.user = user
+        return request
+
+    def test_one_query_memoized_on_request(self):
+        request = self._request(self.user)
+        with self.assertNumQueries(1):
+            ctx = get_user_context(request)
+            self.assertIs(get_user_context(request), ctx)
+        self.assertEqual((ctx.profile.coins, ctx.unread_count, ctx.is_moderator), (42, 2, False))
+
+    def test_moderator_flag_and_missing_profile(self):
+        other = User.objects.create(username="ctx_mod")
+        other.groups.add(Group.objects.create(name=MODERATOR_GROUP_NAME))
+        ctx = get_user_context(self._request(other))
+        self.assertTrue(ctx.is_moderator)
+        self.assertEqual((ctx.profile.user_id, ctx.unread_count), (other.id, 0))
+
+
+class NotificationCounterTests(TestCase):
+    def setUp(self):
+        self.a = User.objects.create(username="notif_a")
+        self.b = User.objects.create(username="notif_b")
+        UserProfile.objects.create(user=self.a)
+
+    def unread(self, user):
+        return UserProfile.objects.get(user=user).unread_notifications
+
+    def test_counter_follows_inserts_and_reads(self):
+        notify_many([self.a, self.b, self.a], "hola")  # sin duplicados; b sin perfil
+        notify(self.a, "otra")
+        self.assertEqual((self.unread(self.a), self.unread(self.b)), (2, 1))
+
+        self.assertEqual(mark_all_read(self.a), 2)
+        self.assertEqual(mark_all_read(self.a), 0)
+        self.assertEqual(self.unread(self.a), 0)
+        self.assertEqual(
+            Notification.objects.filter(user=self.a, is_read=False).count(), self.unread(self.a)
+        )
+
+    def test_paginated_history_and_purge(self):
+        for i in range(5):
+            notify(self.a, f"n{i}")
+        page, cursor = notifications_page(self.a, limit=3)
+        rest, end = notifications_page(self.a, cursor=cursor, limit=3)
+        self.assertEqual([n.message for n in page + rest], ["n4", "n3", "n2", "n1", "n0"])
+        self.assertIsNone(end)
+
+        mark_all_read(self.a)
+        notify(self.a, "nueva")
+        later = timezone.now() + timedelta(days=31)
+        self.assertEqual(purge_read_notifications(days=30, batch_size=2, now=later), 5)
+        self.assertEqual(list(Notification.objects.values_list("message", flat=True)), ["nueva"])
+        self.assertEqual(self.unread(self.a), 1)
+
+    def test_history_page_marks_only_what_it_shows(self):
+        for i in range(NOTIFICATIONS_PAGE_SIZE + 5):
+            notify(self.a, f"n{i}")
+        self.client.force_login(self.a)
+
+        response = self.client.get(reverse("notifications"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.unread(self.a), 5)
+        older = Notification.objects.filter(user=self.a, is_read=False)
+        self.assertEqual(sorted(older.values_list("message", flat=True)), [f"n{i}" for i in range(5)])
+
+        # Un borrado por fuera del servicio se corrige recalculando
+        older.first().delete()
+        recount_unread([self.a.id])
+        self.assertEqual(self.unread(self.a), 4)
+
+
+class NoteCounterTests(TestCase):
+    def setUp(self):
+        self.a = User.objects.create(username="note_a")
+        self.b = User.objects.create(username="note_b")
+        self.notes = [Note.objects.create(author=self.a, text=f"n{i}") for i in range(5)]
+
+    def test_counters_follow_likes_and_replies(self):
+        note = self.notes[0]
+        self.assertTrue(toggle_note_like(note, self.a))
+        self.assertTrue(toggle_note_like(note, self.b))
+        self.assertFalse(toggle_note_like(note, self.a))
+        add_reply(NoteReply(note=note, author=self.b, text="hola"))
+        note.refresh_from_db()
+        self.assertEqual((note.likes_count, note.replies_count), (1, 1))
+
+        # Un borrado por fuera del servicio se corrige recalculando
+        NoteLike.objects.all().delete()
+        recount_note_counters()
+        note.refresh_from_db()
+        self.assertEqual((note.likes_count, note.replies_count), (0, 1))
+
+    def test_most_liked_keyset_pages(self):
+        for note, users in ((self.notes[1], [self.a, self.b]), (self.notes[3], [self.a])):
+            for user in users:
+                toggle_note_like(note, user)
+
+        page, cursor = public_notes_page("likes", limit=2)
+        rest, end = public_notes_page("likes", cursor=cursor, limit=2)
+        last, none = public_notes_page("likes", cursor=end, limit=2)
+        expected = ["n1", "n3", "n4", "n2", "n0"]
+        self.assertEqual([n.text for n in page + rest + last], expected)
+        self.assertIsNone(none)
+
+        with self.assertNumQueries(1):
+            public_notes_page("likes", cursor="basura", limit=2)
+
+
+class NoteFeedTests(TestCase):
+    def setUp(self):
+        self.a = User.objects.create(username="feed_a")
+        self.b = User.objects.create(username="feed_b")
+        for i in range(3):
+            Note.objects.create(author=self.a, recipient=self.b, text=f"a{i}")
+            Note.objects.create(author=self.b, recipient=self.a, text=f"b{i}")
+            Note.objects.create(author=self.a, text=f"p{i}")
+
+    def collect(self, fetch):
+        texts, cursor = [], None
+        while True:
+            notes, cursor = fetch(cursor)
+            texts += [n.text for n in notes]
+            if cursor is None:
+                return texts
+
+    def test_private_filters_walk_every_page(self):
+        page = lambda filtro: lambda c: private_notes_page(self.a, filtro, cursor=c, limit=2)
+        self.assertEqual(self.collect(page("recibidas")), ["b2", "b1", "b0"])
+        self.assertEqual(self.collect(page("enviadas")), ["a2", "a1", "a0"])
+        self.assertEqual(self.collect(page("todas")), ["b2", "a2", "b1", "a1", "b0", "a0"])
+        self.assertEqual(self.collect(lambda c: public_notes_page(cursor=c, limit=2)), ["p2", "p1", "p0"])
+
+    def test_bad_cursor_restarts_from_first_page(self):
+        first, _cursor = public_notes_page(limit=2)
+        for cursor in ("basura", "1:2:3", "9999999999999999999999999:1",
+                       "999999999999999999:1", "1:99999999999999999999999"):
+            notes, _next = public_notes_page(cursor=cursor, limit=2)
+            self.assertEqual(notes, first, cursor)
+
+        self.client.force_login(self.a)
+        for url in (reverse("home"), reverse("private_notes"), reverse("notes_feed")):
+            response = self.client.get(url, {"cursor": "9999999999999999999999999:1"})
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_json_feed(self):
+        _notes, cursor = public_notes_page(limit=1)
+        url = reverse("notes_feed")
+        data = self.client.get(url, {"muro": "publicas", "cursor": cursor}).json()
+        self.assertIn("p1", data["html"])
+        self.assertNotIn("p2", data["html"])
+
+        self.assertEqual(self.client.get(url, {"muro": "privadas"}).status_code, 403)
+        self.client.force_login(self.a)
+        data = self.client.get(url, {"muro": "privadas", "filtro": "enviadas"}).json()
+        self.assertIn("Para: feed_b", data["html"])
+        self.assertIsNone(data["next_cursor"])
+
+
+class PvpRankingUniqueTests(TestCase):
+    def test_position_is_unique_and_swap_keeps_it(self):
+        first, second = (User.objects.create(username=f"uniq{i}") for i in range(2))
+        ranks = list(PvpRanking.objects.order_by("position"))
+        self.assertEqual([r.position for r in ranks], [1, 2])
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PvpRanking.objects.filter(id=ranks[1].id).update(position=1)
+
+        self.assertEqual(swap_after_victory(ranks[1].id, ranks[0].id), 1)
+        self.assertEqual(
+            list(PvpRanking.objects.order_by("position").values_list("user_id", flat=True)),
+            [second.id, first.id],
+        )
+
+
+class PvpRankingSignalTests(TestCase):
+    def test_new_users_get_consecutive_positions(self):
+        first, second = (User.objects.create(username=f"nuevo{i}") for i in range(2))
+        self.assertEqual(second.pvp_ranking.position, first.pvp_ranking.position + 1)
+
+    def test_raw_fixture_save_is_skipped(self):
+        # loaddata guarda con raw=True: los rankings vienen en el propio fixture
+        user = User(username="fixture_user")
+        user.save_base(raw=True)
+        self.assertFalse(PvpRanking.objects.filter(user=user).exists())
+
+    def test_backfill_then_new_user_can_challenge(self):
+        backfill = import_module("notes.migrations.0029_backfill_pvp_rankings").backfill_pvp_rankings
+
+        ranked = User.objects.create(username="con_ranking")
+        old_users = []
+        for i in range(2):
+            user = User(username=f"antiguo{i}")
+            user.save_base(raw=True)
+            old_users.append(user)
+
+        backfill(django_apps, None)
+
+        positions = [PvpRanking.objects.get(user=u).position for u in [ranked] + old_users]
+        start = ranked.pvp_ranking.position
+        self.assertEqual(positions, [start, start + 1, start + 2])
+
+        newcomer = User.objects.create(username="recien_llegado")
+        self.assertEqual(newcomer.pvp_ranking.position, start + 3)
+        self.assertEqual(get_or_create_pvp_ranking(newcomer), newcomer.pvp_ranking)
+        self.assertTrue(can_challenge(newcomer.pvp_ranking.position, start))
+        self.assertFalse(can_challenge(start, newcomer.pvp_ranking.position))
+
+
+class PvpSwapConcurrencyTests(TransactionTestCase):
+    LADDER_SIZE = 40
+    CHALLENGES = 300
+    WORKERS = 16
+
+    def setUp(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            # La BD en memoria compartida entre hilos no espera bloqueos
+            # ("database table is locked"); hace falta Postgres o un fichero.
+            self.skipTest("Requiere una base de datos de test en disco.")
+
+        # La señal post_save crea el ranking de cada usuario (puestos 1..N)
+        for i in range(self.LADDER_SIZE):
+            User.objects.create(username=f"pvp{i}")
+
+    def _positions(self):
+        return sorted(PvpRanking.objects.values_list("position", flat=True))
+
+    def _challenge(self, seed):
+        rng = random.Random(seed)
+        try:
+            ranks = list(PvpRanking.objects.order_by("position"))
+            attacker = rng.choice(ranks[1:])
+            targets = [r for r in ranks if can_challenge(attacker.position, r.position)]
+            return swap_after_victory(attacker.id, rng.choice(targets).id)
+        finally:
+            connection.close()
+
+    def test_concurrent_challenges_keep_positions_unique(self):
+        self.assertEqual(self._positions(), list(range(1, self.LADDER_SIZE + 1)))
+
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            results = list(pool.map(self._challenge, range(self.CHALLENGES)))
+
+        self.assertEqual(len(results), self.CHALLENGES)
+        self.assertTrue(any(r is not None for r in results))
+        self.assertEqual(self._positions(), list(range(1, self.LADDER_SIZE + 1)))
+
+    def test_swap_revalidates_current_positions(self):
+        ranks = list(PvpRanking.objects.order_by("position"))
+        first, second, fifth = ranks[0], ranks[1], ranks[4]
+
+        self.assertEqual(swap_after_victory(second.id, first.id), 1)
+        # Repetir el mismo desafío: el atacante ya está por encima del rival
+        self.assertIsNone(swap_after_victory(second.id, first.id))
+        # Más de 3 puestos de distancia
+        self.assertIsNone(swap_after_victory(fifth.id, second.id))
+        self.assertEqual(self._positions(), list(range(1, self.LADDER_SIZE + 1)))
+
+
+class MarketPurchaseConcurrencyTests(TransactionTestCase):
+    BUYERS = 12
+    PRICE = 50
+
+    def setUp(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("Requiere una base de datos de test en disco.")
+
+        self.seller = User.objects.create(username="market_seller")
+        UserProfile.objects.create(user=self.seller, coins=0)
+        self.buyers = []
+        for i in range(self.BUYERS):
+            buyer = User.objects.create(username=f"market_buyer{i}")
+            UserProfile.objects.create(user=buyer, coins=self.PRICE)
+            self.buyers.append(buyer)
+
+        item = CombatItem.objects.create(
+            owner=self.seller, name="Espada", slot=ItemSlot.choices[0][0], rarity="epic"
+        )
+        self.listing = MarketListing.objects.create(
+            item=item, seller=self.seller, price_coins=self.PRICE
+        )
+
+    def _buy(self, buyer):
+        try:
+            buy_listing(self.listing.id, buyer)
+            return buyer.id
+        except PurchaseError:
+            return None
+        finally:
+            connection.close()
+
+    def test_one_listing_is_sold_once(self):
+        with ThreadPoolExecutor(max_workers=self.BUYERS) as pool:
+            results = list(pool.map(self._buy, self.buyers))
+
+        winners = [r for r in results if r is not None]
+        self.assertEqual(len(winners), 1)
+
+        self.listing.refresh_from_db()
+        self.assertFalse(self.listing.is_active)
+        self.assertEqual(self.listing.buyer_id, winners[0])
+        self.assertEqual(CombatItem.objects.get(id=self.listing.item_id).owner_id, winners[0])
+
+        coins = dict(UserProfile.objects.values_list("user_id", "coins"))
+        self.assertEqual(coins[self.seller.id], self.PRICE)
+        self.assertEqual(coins[winners[0]], 0)
+        # Nadie más pagó: las monedas totales no cambian
+        self.assertEqual(sum(coins.values()), self.PRICE * self.BUYERS)
+
+    def test_insufficient_funds_leaves_listing_open(self):
+        poor = self.buyers[0]
+        UserProfile.objects.filter(user=poor).update(coins=self.PRICE - 1)
+        with self.assertRaises(InsufficientFunds):
+            buy_listing(self.listing.id, poor)
+        with self.assertRaises(PurchaseError):
+            buy_listing(self.listing.id, self.seller)
+
+        self.listing.refresh_from_db()
+        self.assertTrue(self.listing.is_active)
+        self.assertEqual(CombatItem.objects.get(id=self.listing.item_id).owner_id, self.seller.id)
+
+
+class UserStreamConsumerTests(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("Requiere una base de datos de test en disco.")
+        self.user = User.objects.create(username="ws_user")
+        UserProfile.objects.create(user=self.user, coins=10)
+
+    async def _scenario(self):
+        communicator = WebsocketCommunicator(UserStreamConsumer.as_asgi(), "/ws/notificaciones/")
+        communicator.scope["user"] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        received = [await communicator.receive_json_from()]
+
+        await database_sync_to_async(notify)(self.user, "Te dieron like", url="/n/1/")
+        received.append(await communicator.receive_json_from())
+        await database_sync_to_async(credit_many)({self.user.id: 5}, reason="test")
+        received.append(await communicator.receive_json_from())
+
+        await communicator.disconnect()
+        return received
+
+    def test_pushes_notifications_and_balance(self):
+        state, notification, balance = async_to_sync(self._scenario)()
+        self.assertEqual(state, {"type": "state", "unread": 0, "coins": 10, "rubies": 0})
+        self.assertEqual(
+            notification,
+            {"type": "notification", "message": "Te dieron like", "url": "/n/1/", "unread": 1},
+        )
+        self.assertEqual(balance, {"type": "balance", "coins": 15, "rubies": 0})
+
+    def test_anonymous_is_rejected(self):
+        async def connect():
+            communicator = WebsocketCommunicator(UserStreamConsumer.as_asgi(), "/ws/notificaciones/")
+            connected, _ = await communicator.connect()
+            return connected
+
+        self.assertFalse(async_to_sync(connect)())
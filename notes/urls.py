@@ -6,6 +6,7 @@ urlpatterns = [
     path('privadas/', views.private_notes, name='private_notes'),
     path('like/<int:note_id>/', views.toggle_like, name='toggle_like'),
     path('nota/<int:note_id>/', views.note_detail, name='note_detail'),
+    path('feed/', views.notes_feed, name='notes_feed'),
     path('notificaciones/', views.notifications, name='notifications'),
     path('moderacion/codigos/', views.invitation_admin, name='invitation_admin'),
     path('moderacion/moderadores/', views.moderator_panel, name='moderator_panel'),
@@ -18,8 +19,10 @@ urlpatterns = [
     path('rpg/gacha/', views.rpg_gacha, name='rpg_gacha'),
     path('rpg/torre/', views.rpg_tower, name='rpg_tower'),
     path('rpg/inventario/', views.rpg_inventory, name='rpg_inventory'),
+    path('rpg/inventario/pagina/', views.rpg_inventory_page, name='rpg_inventory_page'),
     path('rpg/gacha/config/', views.rpg_gacha_config, name='rpg_gacha_config'),
     path('rpg/gacha/config/premium/', views.rpg_gacha_premium_config, name='rpg_gacha_premium_config'),
+    path('rpg/gacha/report/', views.rpg_gacha_report, name='rpg_gacha_report'),
     path("rpg/pvp/", views.rpg_pvp_arena, name="rpg_pvp_arena"),
     path("rpg/pvp/challenge/<int:target_id>/", views.rpg_pvp_challenge, name="rpg_pvp_challenge"),
     path("rpg/pvp/leaderboard/", views.rpg_pvp_leaderboard, name="rpg_pvp_leaderboard"),
@@ -5,13 +5,14 @@ from datetime import date, timedelta
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login as auth_login
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.utils import timezone
 from django.views.decorators.http import require_POST
-from django.db.models import Q, Count, Max
-from django.db import transaction, IntegrityError
+from django.db.models import Q, F
+from django.db import transaction, IntegrityError, OperationalError
 from django.urls import reverse
-from django.http import HttpResponseForbidden
+from django.utils.http import urlencode
+from django.http import HttpResponseForbidden, JsonResponse
+from django.template.loader import render_to_string
 from django.contrib import messages
 
 
@@ -20,7 +21,6 @@ from django.contrib.auth.models import Group, User
 from .models import (
     Note,
     NoteLike,
-    Notification,
     InvitationCode,
     UserProfile,
     MineGameResult,
@@ -51,8 +51,67 @@ from .forms import (
     RegistrationForm,
     NoteReplyForm,
 )
+from .services.battle_log import append_battle_log, get_battle_log_page
+from .services.combat_log import (
+    ACTOR_ENEMY,
+    ACTOR_PLAYER,
+    FLAG_CRIT,
+    FLAG_DODGE,
+    FLAG_KO,
+    pack_events,
+)
+from .services.gacha import (
+    DEFAULT_GACHA_PROBS_NORMAL,
+    DEFAULT_GACHA_PROBS_PREMIUM,
+    GACHA_COST,
+    MULTI_PULL_COUNTS,
+    get_gacha_probs,
+    load_gacha_probs,
+    pull_gacha_batch,
+)
+from .services.gacha_audit import gacha_daily_counts, gacha_rate_report
+from .services.inventory import inventory_counts, inventory_page, sell_items
+from .services.market import (
+    MARKET_SORT_LABELS,
+    MARKET_SORTS,
+    PRICE_INDEX_DAYS,
+    PurchaseError,
+    buy_listing,
+    search_listings,
+    suggested_prices,
+)
+from .services.miniboss import (
+    MINI_BOSS_DEFINITIONS,
+    advance_miniboss_battle,
+    get_miniboss_def,
+)
+from .services.note_feed import (
+    FEED_SORTS,
+    PRIVATE_FILTERS,
+    add_reply,
+    private_notes_page,
+    public_notes_page,
+    toggle_note_like,
+)
+from .services.notifications import mark_read, notifications_page, notify
+from .services.odds import get_pvp_odds, get_tower_odds
+from .services.pvp import can_challenge, get_or_create_pvp_ranking, swap_after_victory
+from .services import wallet
+from .services.world_boss import (
+    get_current_world_boss_cycle,
+    world_boss_phase,
+)
+from .services.user_context import MODERATOR_GROUP_NAME, get_request_profile, get_user_context
+from .services.stats import (
+    EQUIPMENT_FIELDS,
+    SNAPSHOT_FIELDS,
+    equipped_item_ids,
+    get_total_stats_many,
+    refresh_stats_snapshot,
+    stats_from_profile,
+    unequip_items,
+)
 
-MODERATOR_GROUP_NAME = "moderador"
 MINE_GAME_SESSION_KEY = "mine_game_state"
 GACHA_LAST_SLOT_SESSION_KEY = "rpg_gacha_last_slot"
 
@@ -62,15 +121,6 @@ def ensure_moderator_group_exists():
     Group.objects.get_or_create(name=MODERATOR_GROUP_NAME)
 
 
-def user_is_moderator(user):
-    if not user.is_authenticated:
-        return False
-    if user.is_superuser:
-        return True
-    ensure_moderator_group_exists()
-    return user.groups.filter(name__iexact=MODERATOR_GROUP_NAME).exists()
-
-
 def get_or_create_profile(user):
     profile, _ = UserProfile.objects.get_or_create(user=user)
     return profile
@@ -82,36 +132,16 @@ def get_or_create_profile(user):
 
 def home(request):
     orden = request.GET.get("orden", "fecha")
+    if orden not in FEED_SORTS:
+        orden = "fecha"
 
-    notes_qs = (
-        Note.objects.filter(recipient__isnull=True)
-        .select_related("author")
-        .annotate(
-            likes_count=Count("likes", distinct=True),
-            replies_count=Count("replies", distinct=True),
-        )
-    )
-
-    if orden == "likes":
-        notes_qs = notes_qs.order_by("-likes_count", "-created_at")
-    else:
-        notes_qs = notes_qs.order_by("-created_at")
-
-    paginator = Paginator(notes_qs, 9)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    # Paginación por cursor; los contadores son columnas de Note
+    notes, next_cursor = public_notes_page(orden, cursor=request.GET.get("cursor"))
 
     form = None
-    liked_ids = set()
+    liked_ids = _liked_note_ids(request, notes)
 
     if request.user.is_authenticated:
-        liked_ids = set(
-            NoteLike.objects.filter(
-                user=request.user,
-                note__in=page_obj.object_list,
-            ).values_list("note_id", flat=True)
-        )
-
         if request.method == "POST":
             form = NoteForm(request.POST)
             if form.is_valid():
@@ -125,23 +155,56 @@ def home(request):
 
     context = {
         "form": form,
-        "page_obj": page_obj,
+        "notes": notes,
+        "next_cursor": next_cursor,
+        "is_first_page": not request.GET.get("cursor"),
         "liked_ids": liked_ids,
         "orden": orden,
     }
     return render(request, "notes/home.html", context)
 
 
+def _liked_note_ids(request, notes):
+    """Ids de las notas de la página a las que el usuario ya dio like."""
+    if not request.user.is_authenticated:
+        return set()
+    return set(
+        NoteLike.objects.filter(
+            user=request.user,
+            note__in=notes,
+        ).values_list("note_id", flat=True)
+    )
+
+
+def notes_feed(request):
+    """
+    Siguiente página de un muro para el scroll infinito:
+    {"html": tarjetas de notas, "next_cursor": cursor o null}.
+    ?muro=publicas&orden=... o ?muro=privadas&filtro=... (esta última con login).
+    """
+    cursor = request.GET.get("cursor")
+
+    if request.GET.get("muro") == "privadas":
+        if not request.user.is_authenticated:
+            return HttpResponseForbidden("Debes iniciar sesión.")
+        filtro = request.GET.get("filtro", "recibidas")
+        notes, next_cursor = private_notes_page(request.user, filtro, cursor=cursor)
+        template = "notes/private_note_cards.html"
+        extra = {}
+    else:
+        orden = request.GET.get("orden", "fecha")
+        notes, next_cursor = public_notes_page(orden, cursor=cursor)
+        template = "notes/note_cards.html"
+        extra = {"liked_ids": _liked_note_ids(request, notes)}
+
+    html = render_to_string(template, {"notes": notes, **extra}, request=request)
+    return JsonResponse({"html": html, "next_cursor": next_cursor})
+
+
 def note_detail(request, note_id):
-    note_qs = (
-        Note.objects.filter(pk=note_id, recipient__isnull=True)
-        .select_related("author")
-        .annotate(
-            likes_count=Count("likes", distinct=True),
-            replies_count=Count("replies", distinct=True),
-        )
+    note = get_object_or_404(
+        Note.objects.select_related("author"), pk=note_id, recipient__isnull=True
     )
-    note = get_object_or_404(note_qs)
 
     replies = note.replies.select_related("author").order_by("created_at")
 
@@ -159,12 +222,12 @@ def note_detail(request, note_id):
             reply = form.save(commit=False)
             reply.note = note
             reply.author = request.user
-            reply.save()
+            add_reply(reply)
 
             if note.author != request.user:
-                Notification.objects.create(
-                    user=note.author,
-                    message=f"{request.user.username} comentó tu nota pública.",
+                notify(
+                    note.author,
+                    f"{request.user.username} comentó tu nota pública.",
                     url=reverse("note_detail", args=[note.id]),
                 )
 
@@ -185,24 +248,13 @@ def note_detail(request, note_id):
 def private_notes(request):
     filtro = request.GET.get("filtro", "recibidas")
 
-    if filtro == "recibidas":
-        notes_qs = Note.objects.filter(recipient=request.user)
-    elif filtro == "enviadas":
-        notes_qs = Note.objects.filter(
-            author=request.user,
-            recipient__isnull=False,
-        )
-    else:
-        notes_qs = Note.objects.filter(
-            Q(recipient=request.user) |
-            Q(author=request.user, recipient__isnull=False)
-        )
-
-    notes_qs = notes_qs.select_related("author", "recipient")
+    if filtro not in PRIVATE_FILTERS:
+        filtro = "todas"
 
-    paginator = Paginator(notes_qs, 9)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    # Paginación por cursor sobre (created_at, id), sin COUNT(*) ni OFFSET
+    notes, next_cursor = private_notes_page(
+        request.user, filtro, cursor=request.GET.get("cursor")
+    )
 
     if request.method == "POST":
         form = PrivateNoteForm(request.POST, user=request.user)
@@ -212,9 +264,9 @@ def private_notes(request):
             note.save()
 
             if note.recipient and note.recipient != request.user:
-                Notification.objects.create(
-                    user=note.recipient,
-                    message=f"{request.user.username} te envió una nota privada.",
+                notify(
+                    note.recipient,
+                    f"{request.user.username} te envió una nota privada.",
                     url=reverse("private_notes"),
                 )
 
@@ -224,7 +276,9 @@ def private_notes(request):
 
     context = {
         "form": form,
-        "page_obj": page_obj,
+        "notes": notes,
+        "next_cursor": next_cursor,
+        "is_first_page": not request.GET.get("cursor"),
         "filtro": filtro,
     }
     return render(request, "notes/private_notes.html", context)
@@ -258,20 +312,14 @@ def register(request):
 def toggle_like(request, note_id):
     note = get_object_or_404(Note, pk=note_id, recipient__isnull=True)
 
-    like, created = NoteLike.objects.get_or_create(
-        note=note,
-        user=request.user,
-    )
+    liked = toggle_note_like(note, request.user)
 
-    if created:
-        if note.author != request.user:
-            Notification.objects.create(
-                user=note.author,
-                message=f"{request.user.username} dio like a tu nota pública.",
-                url=reverse("note_detail", args=[note.id]),
-            )
-    else:
-        like.delete()
+    if liked and note.author != request.user:
+        notify(
+            note.author,
+            f"{request.user.username} dio like a tu nota pública.",
+            url=reverse("note_detail", args=[note.id]),
+        )
 
     next_url = request.META.get("HTTP_REFERER") or "/"
     return redirect(next_url)
@@ -279,18 +327,27 @@ def toggle_like(request, note_id):
 
 @login_required
 def notifications(request):
-    notifications_qs = request.user.notifications.all()
-    notifications_qs.filter(is_read=False).update(is_read=True)
+    cursor = request.GET.get("cursor")
+    page, next_cursor = notifications_page(request.user, cursor=cursor)
+
+    # Se marcan solo las de esta página (las de páginas siguientes siguen
+    # "Nueva"); se leen antes, así que las nuevas conservan su etiqueta aquí
+    marked = mark_read(request.user, [n.id for n in page])
+    if marked:
+        profile = get_request_profile(request)
+        profile.unread_notifications = max(0, profile.unread_notifications - marked)
 
     context = {
-        "notifications": notifications_qs,
+        "notifications": page,
+        "next_cursor": next_cursor,
+        "is_first_page": not cursor,
     }
     return render(request, "notes/notifications.html", context)
 
 
 @login_required
 def invitation_admin(request):
-    if not user_is_moderator(request.user):
+    if not get_user_context(request).is_moderator:
         return HttpResponseForbidden("No tienes permiso para ver esta página.")
 
     if request.method == "POST":
@@ -395,7 +452,7 @@ def leaderboard(request):
 
     current_user_profile = None
     if request.user.is_authenticated:
-        current_user_profile = get_or_create_profile(request.user)
+        current_user_profile = get_request_profile(request)
 
     context = {
         "profiles": profiles,
@@ -471,9 +528,7 @@ def mine_game(request):
 
             bonus = score // 5
             if bonus > 0:
-                profile = get_or_create_profile(request.user)
-                profile.coins += bonus
-                profile.save()
+                wallet.credit(request.user, coins=bonus, reason="mine_game")
                 messages.success(
                     request,
                     f"Te retiraste con {score} puntos. Has ganado {bonus} moneda(s).",
@@ -529,90 +584,8 @@ def mine_game(request):
 # RPG — GACHA CONFIG + STATS
 # =================
 
-# Probabilidades por defecto del GACHA NORMAL
-# Usamos SIEMPRE códigos string (basic, uncommon, ...)
-DEFAULT_GACHA_PROBS_NORMAL = [
-    (ItemRarity.BASIC.value, 0.80),
-    (ItemRarity.UNCOMMON.value, 0.15),
-    (ItemRarity.SPECIAL.value, 0.04),
-    (ItemRarity.EPIC.value, 0.009),
-    (ItemRarity.LEGENDARY.value, 0.0009),
-    (ItemRarity.MYTHIC.value, 0.00009),
-    (ItemRarity.ASCENDED.value, 0.00001),
-]
-
-# Probabilidades por defecto del GACHA PREMIUM
-# (el resto hasta 1.0 se usa como probabilidad de +1 rubí)
-DEFAULT_GACHA_PROBS_PREMIUM = [
-    (ItemRarity.BASIC.value, 0.0),
-    (ItemRarity.UNCOMMON.value, 0.0),
-    (ItemRarity.SPECIAL.value, 0.65),
-    (ItemRarity.EPIC.value, 0.255),
-    (ItemRarity.LEGENDARY.value, 0.045),
-    (ItemRarity.MYTHIC.value, 0.0049),   # 0.199 %
-    (ItemRarity.ASCENDED.value, 0.0001), # 0.001 %
-]
-
-
-def get_gacha_probs(gacha_type=GachaType.NORMAL):
-    """
-    Devuelve una lista de tuplas (code, prob) donde code es SIEMPRE
-    el código string de ItemRarity (basic, uncommon, ...),
-    ordenado de peor a mejor.
-    """
-    if gacha_type == GachaType.NORMAL:
-        defaults = DEFAULT_GACHA_PROBS_NORMAL
-    else:
-        defaults = DEFAULT_GACHA_PROBS_PREMIUM
-
-    qs = GachaProbability.objects.filter(gacha_type=gacha_type)
-    if not qs.exists():
-        # Semilla inicial en BD
-        for rarity_code, prob in defaults:
-            GachaProbability.objects.create(
-                gacha_type=gacha_type,
-                rarity=rarity_code,
-                probability=prob,
-            )
-        qs = GachaProbability.objects.filter(gacha_type=gacha_type)
-
-    db_map = {row.rarity: row.probability for row in qs}
-
-    ordered = []
-    for rarity_enum in [
-        ItemRarity.BASIC,
-        ItemRarity.UNCOMMON,
-        ItemRarity.SPECIAL,
-        ItemRarity.EPIC,
-        ItemRarity.LEGENDARY,
-        ItemRarity.MYTHIC,
-        ItemRarity.ASCENDED,
-    ]:
-        code = rarity_enum.value
-        prob = db_map.get(code, 0.0)
-        ordered.append((code, prob))
-
-    return ordered
-
-
-
-
-def roll_rarity(gacha_type=GachaType.NORMAL):
-    """
-    Devuelve el código de rareza (string) según las probabilidades
-    configuradas para el tipo de gacha dado.
-    """
-    probs = get_gacha_probs(gacha_type)
-    r = random.random()
-    acumulado = 0.0
-    for rarity_code, prob in probs:
-        acumulado += prob
-        if r <= acumulado:
-            return rarity_code
-    return probs[-1][0]
-
-
-
+# Las probabilidades del gacha viven en services/gacha.py (tabla compilada
+# por proceso, método alias); aquí solo quedan los datos de los ítems.
 
 SLOT_LABELS = {
     ItemSlot.WEAPON: "Espada",
@@ -845,70 +818,13 @@ def generate_pet_percents(rarity: ItemRarity):
 
 
 def get_total_stats(user):
+    """
+    Stats de combate del usuario (equipo + mascota).
+    Lee el snapshot guardado en UserProfile; no recorre los ítems equipados.
+    Para varios usuarios a la vez usar get_total_stats_many(user_ids).
+    """
     profile = get_or_create_profile(user)
-
-    base_hp = 100
-    base_atk = 10
-    base_def = 0
-    base_crit = 0.0
-    base_dodge = 0.0
-    base_speed = 0
-
-    total_hp = base_hp
-    total_atk = base_atk
-    total_def = base_def
-    total_crit = base_crit
-    total_dodge = base_dodge
-    total_speed = base_speed
-
-    mapping = [
-        ("equipped_weapon", ItemSlot.WEAPON),
-        ("equipped_helmet", ItemSlot.HELMET),
-        ("equipped_armor", ItemSlot.ARMOR),
-        ("equipped_pants", ItemSlot.PANTS),
-        ("equipped_boots", ItemSlot.BOOTS),
-        ("equipped_shield", ItemSlot.SHIELD),
-        ("equipped_amulet1", ItemSlot.AMULET),
-        ("equipped_amulet2", ItemSlot.AMULET),
-        ("equipped_amulet3", ItemSlot.AMULET),
-    ]
-
-    for field_name, _slot in mapping:
-        item = getattr(profile, field_name, None)
-        if item:
-            total_hp += item.hp
-            total_atk += item.attack
-            total_def += item.defense
-            total_crit += item.crit_chance
-            total_dodge += item.dodge_chance
-            total_speed += item.speed
-        # -------------------------
-    # 2) Aplicar mascota (%)
-    # -------------------------
-    pet = getattr(profile, "equipped_pet", None)
-    if pet:
-        # Nos aseguramos de que existan los campos, con 0 por defecto
-        hp_pct = getattr(pet, "hp_pct", 0.0) or 0.0
-        atk_pct = getattr(pet, "attack_pct", 0.0) or 0.0
-        def_pct = getattr(pet, "defense_pct", 0.0) or 0.0
-
-        # Bonus en función de los stats YA SUMADOS
-        bonus_hp = int(total_hp * (hp_pct / 100.0))
-        bonus_atk = int(total_atk * (atk_pct / 100.0))
-        bonus_def = int(total_def * (def_pct / 100.0))
-
-        total_hp += bonus_hp
-        total_atk += bonus_atk
-        total_def += bonus_def
-
-    return {
-        "hp": total_hp,
-        "attack": total_atk,
-        "defense": total_def,
-        "crit_chance": total_crit,
-        "dodge_chance": total_dodge,
-        "speed": total_speed,
-    }
+    return stats_from_profile(profile)
 
 
 def enemy_stats_for_floor(floor):
@@ -928,7 +844,11 @@ def enemy_stats_for_floor(floor):
 
 
 def simulate_battle(user_stats, enemy_stats, max_turns=50):
-    log_lines = []
+    """
+    Combate de la torre. Devuelve (victory, log_events): el log va empaquetado
+    (ver services/combat_log.py) y solo se pasa a texto al mostrarlo.
+    """
+    events = []
 
     player_hp = user_stats["hp"]
     player_atk = user_stats["attack"]
@@ -942,12 +862,12 @@ def simulate_battle(user_stats, enemy_stats, max_turns=50):
     enemy_def = enemy_stats["defense"]
     enemy_speed = 0
 
+    start_hp = (player_hp, enemy_hp)
+
     for turn in range(1, max_turns + 1):
         if player_hp <= 0 or enemy_hp <= 0:
             break
 
-        log_lines.append(f"TURNO {turn}:")
-
         if player_speed > enemy_speed:
             first = "player"
         elif enemy_speed > player_speed:
@@ -963,58 +883,59 @@ def simulate_battle(user_stats, enemy_stats, max_turns=50):
                 if crit:
                     dmg *= 2
                 enemy_hp -= dmg
-                if crit:
-                    log_lines.append(f"- El jugador hace {dmg} de daño CRÍTICO al enemigo.")
-                else:
-                    log_lines.append(f"- El jugador hace {dmg} de daño al enemigo.")
+                flags = FLAG_CRIT if crit else 0
+                if enemy_hp <= 0:
+                    flags |= FLAG_KO
+                events.append((turn, ACTOR_PLAYER, dmg, flags))
             else:
                 if random.random() < (player_dodge / 100.0):
-                    log_lines.append("- El enemigo ataca pero el jugador ESQUIVA el golpe.")
+                    events.append((turn, ACTOR_ENEMY, 0, FLAG_DODGE))
                     return
                 dmg = max(1, enemy_atk - player_def)
                 player_hp -= dmg
-                log_lines.append(f"- El enemigo hace {dmg} de daño al jugador.")
+                events.append((turn, ACTOR_ENEMY, dmg, FLAG_KO if player_hp <= 0 else 0))
 
         if first == "player":
             do_attack("player")
             if enemy_hp <= 0:
-                log_lines.append("El enemigo ha sido derrotado.")
                 break
             do_attack("enemy")
             if player_hp <= 0:
-                log_lines.append("El jugador ha sido derrotado.")
                 break
         else:
             do_attack("enemy")
             if player_hp <= 0:
-                log_lines.append("El jugador ha sido derrotado.")
                 break
             do_attack("player")
             if enemy_hp <= 0:
-                log_lines.append("El enemigo ha sido derrotado.")
                 break
 
     victory = player_hp > 0 and enemy_hp <= 0
-    return victory, log_lines
+    return victory, pack_events(events, start_hp)
 
 
 @login_required
 def rpg_hub(request):
-    profile = get_or_create_profile(request.user)
-    stats = get_total_stats(request.user)
+    profile = get_request_profile(request)
+    stats = stats_from_profile(profile)
     tower, _ = TowerProgress.objects.get_or_create(user=request.user)
 
+    # Probabilidad estimada de superar el siguiente piso (cacheada, sin escribir en BD)
+    next_floor = tower.current_floor + 1
+    tower_odds = get_tower_odds(stats, next_floor, enemy_stats_for_floor(next_floor))
+
     context = {
         "profile": profile,
         "stats": stats,
         "tower": tower,
+        "tower_odds": tower_odds,
     }
     return render(request, "notes/rpg_hub.html", context)
 
 
 @login_required
 def rpg_shop(request):
-    profile = get_or_create_profile(request.user)
+    profile = get_request_profile(request)
     created_item = None
 
     if request.method == "POST":
@@ -1026,30 +947,29 @@ def rpg_shop(request):
             return redirect("rpg_shop")
 
         COST = 5
-        if profile.coins < COST:
-            messages.error(request, "No tienes suficientes monedas.")
-            return redirect("rpg_shop")
-
         rarity = ItemRarity.BASIC
         stats = generate_item_stats(slot, rarity, from_gacha=False)
         name = f"{SLOT_LABELS[slot]} básica"
 
-        item = CombatItem.objects.create(
-            owner=request.user,
-            name=name,
-            slot=slot,
-            rarity=rarity,
-            source=ItemSource.SHOP,
-            attack=stats["attack"],
-            defense=stats["defense"],
-            hp=stats["hp"],
-            crit_chance=stats["crit_chance"],
-            dodge_chance=stats["dodge_chance"],
-            speed=stats["speed"],
-        )
-
-        profile.coins -= COST
-        profile.save()
+        try:
+            with transaction.atomic():
+                wallet.debit(request.user, coins=COST, reason="shop", profile=profile)
+                item = CombatItem.objects.create(
+                    owner=request.user,
+                    name=name,
+                    slot=slot,
+                    rarity=rarity,
+                    source=ItemSource.SHOP,
+                    attack=stats["attack"],
+                    defense=stats["defense"],
+                    hp=stats["hp"],
+                    crit_chance=stats["crit_chance"],
+                    dodge_chance=stats["dodge_chance"],
+                    speed=stats["speed"],
+                )
+        except wallet.InsufficientFunds:
+            messages.error(request, "No tienes suficientes monedas.")
+            return redirect("rpg_shop")
 
         created_item = item
         messages.success(
@@ -1067,15 +987,34 @@ def rpg_shop(request):
     return render(request, "notes/rpg_shop.html", context)
 
 
+def _build_gacha_item(user, slot, rarity):
+    """CombatItem de gacha SIN guardar (para bulk_create)."""
+    stats = generate_item_stats(slot, rarity, from_gacha=True)
+    return CombatItem(
+        owner=user,
+        name=f"{SLOT_LABELS[slot]} {ItemRarity(rarity).label}",
+        slot=slot,
+        rarity=rarity,
+        source=ItemSource.GACHA,
+        attack=stats["attack"],
+        defense=stats["defense"],
+        hp=stats["hp"],
+        crit_chance=stats["crit_chance"],
+        dodge_chance=stats["dodge_chance"],
+        speed=stats["speed"],
+    )
+
+
 @login_required
 def rpg_gacha(request):
-    profile = get_or_create_profile(request.user)
+    profile = get_request_profile(request)
 
     rolled_item = None
     rolled_rarity = None
     auto_sold = False
     auto_sell_gain = 0
     gained_ruby = False  # solo premium
+    batch = None  # tirada múltiple
 
     # Tipo de gacha actual (normal/premium), viene por GET o POST
     gtype_param = (
@@ -1144,15 +1083,13 @@ def rpg_gacha(request):
                 messages.error(request, "Debes indicar una cantidad válida de rubíes a vender.")
                 return redirect(f"{reverse('rpg_gacha')}?gtype={current_gacha_type.value}")
 
-            if profile.rubies < qty:
+            gained = qty * RUBY_PRICE
+            try:
+                wallet.change_balance(request.user, coins=gained, rubies=-qty, reason="sell_rubies")
+            except wallet.InsufficientFunds:
                 messages.error(request, "No tienes suficientes rubíes.")
                 return redirect(f"{reverse('rpg_gacha')}?gtype={current_gacha_type.value}")
 
-            gained = qty * RUBY_PRICE
-            profile.rubies -= qty
-            profile.coins += gained
-            profile.save()
-
             messages.success(
                 request,
                 f"Has vendido {qty} rubí(es) por {gained} monedas."
@@ -1165,146 +1102,70 @@ def rpg_gacha(request):
         elif action == "config_autosell":
             selected = request.POST.getlist("auto_sell")
             profile.auto_sell_rarities = ",".join(selected)
-            profile.save()
+            profile.save(update_fields=["auto_sell_rarities"])
             messages.success(request, "Preferencias de auto vender actualizadas.")
             return redirect(f"{reverse('rpg_gacha')}?gtype={current_gacha_type.value}")
 
         # ----------------------------------------
-        # 2) Tirada de gacha
+        # 2) Tirada de gacha: simple, o x10 / x100 (botón con "count")
         # ----------------------------------------
         elif action == "roll":
-            # Costes
-            NORMAL_COST = 15
-            PREMIUM_COST = 300
+            try:
+                count = int(request.POST.get("count") or 1)
+            except ValueError:
+                count = 0
+            if count != 1 and count not in MULTI_PULL_COUNTS:
+                messages.error(request, "Cantidad de tiradas inválida.")
+                return redirect(f"{reverse('rpg_gacha')}?gtype={current_gacha_type.value}")
 
             if current_gacha_type == GachaType.NORMAL:
                 # Slot elegido por el usuario
                 slot_code = request.POST.get("slot", last_slot)
-
-                # Validar slot
                 if slot_code not in GACHA_SLOT_VALUES:
                     messages.error(request, "Slot inválido.")
                     return redirect(f"{reverse('rpg_gacha')}?gtype={current_gacha_type.value}")
 
-                slot = ItemSlot(slot_code)
-
-                if profile.coins < NORMAL_COST:
-                    messages.error(request, "No tienes suficientes monedas.")
-                    return redirect(f"{reverse('rpg_gacha')}?gtype={current_gacha_type.value}")
-
                 # Guardamos slot en sesión
-                request.session[GACHA_LAST_SLOT_SESSION_KEY] = slot.value
-                last_slot = slot.value
-
-                # Elegir rareza
-                rarity = roll_rarity(GachaType.NORMAL)
-                stats = generate_item_stats(slot, rarity, from_gacha=True)
-                name = f"{SLOT_LABELS[slot]} {ItemRarity(rarity).label}"
-
-                # Cobrar coste
-                profile.coins -= NORMAL_COST
-                profile.save()
-
-                # Crear ítem
-                item = CombatItem.objects.create(
-                    owner=request.user,
-                    name=name,
-                    slot=slot,
-                    rarity=rarity,
-                    source=ItemSource.GACHA,
-                    attack=stats["attack"],
-                    defense=stats["defense"],
-                    hp=stats["hp"],
-                    crit_chance=stats["crit_chance"],
-                    dodge_chance=stats["dodge_chance"],
-                    speed=stats["speed"],
-                )
-
-                # ¿Auto vender?
-                if rarity in auto_sell_set:
-                    rarity_enum = ItemRarity(rarity)
-                    sell_price = SELL_VALUES.get(rarity_enum, 0)
-                    if sell_price > 0:
-                        profile.coins += sell_price
-                        profile.save()
-                        auto_sold = True
-                        auto_sell_gain = sell_price
-                        item.delete()
-                else:
-                    rolled_item = item
-                    rolled_rarity = rarity
-
+                request.session[GACHA_LAST_SLOT_SESSION_KEY] = slot_code
+                last_slot = slot_code
+                slots = [ItemSlot(slot_code)]
             else:
-                # -------------- GACHA PREMIUM --------------
-                slot = random.choice(list(GACHA_SLOTS))
-
-                if profile.coins < PREMIUM_COST:
-                    messages.error(request, "No tienes suficientes monedas.")
-                    return redirect(f"{reverse('rpg_gacha')}?gtype={current_gacha_type.value}")
-
-                # Probabilidades premium
-                probs = get_gacha_probs(GachaType.PREMIUM)
-                total_prob = sum(prob for _r, prob in probs)
-                ruby_prob = max(0.0, 1.0 - total_prob)
-
-                r = random.random()
-                acumulado = 0.0
-                chosen_rarity = None
+                # Premium: pool completa de equipo
+                slots = list(GACHA_SLOTS)
+
+            # El auto vender se decide ANTES de guardar: una tirada auto
+            # vendida no crea ítem, solo suma sus monedas en el mismo UPDATE
+            auto_sell_prices = {
+                code: SELL_VALUES.get(ItemRarity(code), 0)
+                for code in auto_sell_set
+                if code in ItemRarity.values
+            }
+            batch = pull_gacha_batch(
+                request.user,
+                current_gacha_type,
+                count,
+                slots,
+                _build_gacha_item,
+                auto_sell_prices,
+            )
+            if batch is None:
+                messages.error(request, "No tienes suficientes monedas.")
+                return redirect(f"{reverse('rpg_gacha')}?gtype={current_gacha_type.value}")
 
-                for rarity, prob in probs:
-                    acumulado += prob
-                    if r <= acumulado:
-                        chosen_rarity = rarity
-                        break
+            profile.refresh_from_db(fields=["coins", "rubies"])
 
-                # Si no cayó en ninguna rareza, puede caer en rubí
-                if chosen_rarity is None and ruby_prob > 0 and r <= acumulado + ruby_prob:
-                    # Cobrar coste y dar rubí
-                    profile.coins -= PREMIUM_COST
-                    profile.rubies += 1
-                    profile.save()
+            if count == 1:
+                # Tirada simple: se muestra como siempre, sin la tabla resumen
+                roll = batch.rolls[0]
+                batch = None
+                if roll["ruby"]:
                     gained_ruby = True
-                    # No hay ítem en esta tirada
+                elif roll["item"] is None:
+                    auto_sold = True
+                    auto_sell_gain = roll["sold_for"]
                 else:
-                    # Por seguridad, si no se eligió nada usamos la última rareza
-                    if chosen_rarity is None:
-                        chosen_rarity = probs[-1][0]
-
-                    stats = generate_item_stats(slot, chosen_rarity, from_gacha=True)
-                    name = f"{SLOT_LABELS[slot]} {ItemRarity(chosen_rarity).label}"
-
-                    # Cobrar coste
-                    profile.coins -= PREMIUM_COST
-                    profile.save()
-
-                    item = CombatItem.objects.create(
-                        owner=request.user,
-                        name=name,
-                        slot=slot,
-                        rarity=chosen_rarity,
-                        source=ItemSource.GACHA,
-                        attack=stats["attack"],
-                        defense=stats["defense"],
-                        hp=stats["hp"],
-                        crit_chance=stats["crit_chance"],
-                        dodge_chance=stats["dodge_chance"],
-                        speed=stats["speed"],
-                    )
-
-                    # Auto vender también aplica al premium
-                    rarity_code = chosen_rarity
-                    if rarity_code in auto_sell_set:
-                        rarity_enum = ItemRarity(rarity_code)
-                        sell_price = SELL_VALUES.get(rarity_enum, 0)
-                        if sell_price > 0:
-                            profile.coins += sell_price
-                            profile.save()
-                            auto_sold = True
-                            auto_sell_gain = sell_price
-                            item.delete()
-                    else:
-                        rolled_item = item
-                        rolled_rarity = chosen_rarity
+                    rolled_item = roll["item"]
+                    rolled_rarity = roll["rarity"]
 
     # Probabilidades a mostrar en la tabla
     probs = get_gacha_probs(current_gacha_type)
@@ -1334,6 +1195,10 @@ def rpg_gacha(request):
         "auto_sell_gain": auto_sell_gain,
         "auto_sell_selected": auto_sell_set,
         "GACHA_SLOTS": list(GACHA_SLOTS),      # para el select del gacha normal
+        "batch": batch,                        # resumen de la tirada múltiple
+        "multi_pulls": [
+            (n, n * GACHA_COST[current_gacha_type]) for n in MULTI_PULL_COUNTS
+        ],
     }
     return render(request, "notes/rpg_gacha.html", context)
 
@@ -1342,8 +1207,8 @@ def rpg_gacha(request):
 
 @login_required
 def rpg_tower(request):
-    profile = get_or_create_profile(request.user)
-    stats = get_total_stats(request.user)
+    profile = get_request_profile(request)
+    stats = stats_from_profile(profile)
     tower, _ = TowerProgress.objects.get_or_create(user=request.user)
 
     today = date.today()
@@ -1359,14 +1224,13 @@ def rpg_tower(request):
         if action == "fight":
             next_floor = tower.current_floor + 1
             enemy = enemy_stats_for_floor(next_floor)
-            victory, log_lines = simulate_battle(stats, enemy)
+            victory, log_events = simulate_battle(stats, enemy)
 
-            log_text = "\n".join(log_lines)
             battle = TowerBattleResult.objects.create(
                 user=request.user,
                 floor=next_floor,
                 victory=victory,
-                log_text=log_text,
+                log_events=log_events,
             )
 
             last_battle = battle
@@ -1384,10 +1248,10 @@ def rpg_tower(request):
                     coins_awarded = reward
 
                 if coins_awarded > 0:
-                    profile.coins += coins_awarded
                     tower.daily_coins += coins_awarded
-                    profile.save()
-                    tower.save()
+                    with transaction.atomic():
+                        wallet.credit(request.user, coins=coins_awarded, reason="tower", profile=profile)
+                        tower.save()
                     messages.success(
                         request,
                         f"¡Victoria en el piso {next_floor}! Has ganado {coins_awarded} monedas (límite diario 100)."
@@ -1419,10 +1283,14 @@ def rpg_tower(request):
         .order_by("-max_floor_reached", "user__username")[:10]
     )
 
+    next_floor = tower.current_floor + 1
+    tower_odds = get_tower_odds(stats, next_floor, enemy_stats_for_floor(next_floor))
+
     context = {
         "profile": profile,
         "stats": stats,
         "tower": tower,
+        "tower_odds": tower_odds,
         "last_battle": last_battle,
         "top_players": top_players,
     }
@@ -1431,39 +1299,11 @@ def rpg_tower(request):
 
 @login_required
 def rpg_inventory(request):
-    profile = get_or_create_profile(request.user)
-    stats = get_total_stats(request.user)
+    profile = get_request_profile(request)
 
     # Filtro por tipo de slot
     slot_filter = request.GET.get("slot", "all")
 
-    # Mostrar TODOS los ítems del jugador, excepto los que estén
-    # actualmente listados en el mercado (is_active=True).
-    items_qs = (
-        CombatItem.objects
-        .filter(owner=request.user)
-        .exclude(market_listing__is_active=True)  # no mostrar si está en venta
-        .order_by("-rarity", "-created_at")
-    )
-
-    valid_slots = {s.value for s in ItemSlot}
-    if slot_filter in valid_slots:
-        items_qs = items_qs.filter(slot=slot_filter)
-
-    items = items_qs
-
-    # IDs equipados para marcar en la tabla (incluyendo mascota)
-    equipped_ids = set()
-    for field in [
-        "equipped_weapon", "equipped_helmet", "equipped_armor",
-        "equipped_pants", "equipped_boots", "equipped_shield",
-        "equipped_amulet1", "equipped_amulet2", "equipped_amulet3",
-        "equipped_pet",
-    ]:
-        it = getattr(profile, field, None)
-        if it:
-            equipped_ids.add(it.id)
-
     if request.method == "POST":
         action = request.POST.get("action")
 
@@ -1506,121 +1346,110 @@ def rpg_inventory(request):
                 profile.equipped_pet = item
                 messages.success(request, f"Has equipado a {item.name} como mascota.")
 
-            profile.save()
+            refresh_stats_snapshot(profile, save=False)
+            profile.save(update_fields=EQUIPMENT_FIELDS + list(SNAPSHOT_FIELDS.values()))
             return redirect("rpg_inventory")
 
         # --- VENDER VARIOS ---
         elif action == "sell_bulk":
-            ids = request.POST.getlist("selected_items")
+            ids = [i for i in request.POST.getlist("selected_items") if i.isdigit()]
             if not ids:
                 messages.info(request, "No seleccionaste ningún objeto para vender.")
                 return redirect("rpg_inventory")
 
-            items_to_sell = (
-                CombatItem.objects
-                .filter(owner=request.user, id__in=ids)
-                .exclude(market_listing__is_active=True)
+            # Suma, desequipar, borrar y cobrar en bloque (services/inventory.py)
+            sold_count, total_coins = sell_items(
+                request.user, RARITY_SELL_VALUE, item_ids=ids, profile=profile
             )
-
-            if not items_to_sell.exists():
+            if sold_count > 0:
+                messages.success(
+                    request,
+                    f"Has vendido {sold_count} objeto(s) por {total_coins} monedas."
+                )
+            else:
                 messages.info(request, "Los objetos seleccionados no se pueden vender.")
-                return redirect("rpg_inventory")
 
-            # tabla de precios por rareza
-            rarity_prices = {
-                ItemRarity.BASIC: 2,
-                ItemRarity.UNCOMMON: 20,
-                ItemRarity.SPECIAL: 50,
-                ItemRarity.EPIC: 100,
-                ItemRarity.LEGENDARY: 300,
-                ItemRarity.MYTHIC: 500,
-                ItemRarity.ASCENDED: 1000,
-            }
+            return redirect("rpg_inventory")
 
-            total_coins = 0
-            sold_count = 0
-
-            for it in items_to_sell:
-                price = rarity_prices.get(it.rarity, 0)
-
-                # si está equipado en algún slot, lo des-equipamos (incluyendo mascota)
-                if profile.equipped_weapon_id == it.id:
-                    profile.equipped_weapon = None
-                if profile.equipped_helmet_id == it.id:
-                    profile.equipped_helmet = None
-                if profile.equipped_armor_id == it.id:
-                    profile.equipped_armor = None
-                if profile.equipped_pants_id == it.id:
-                    profile.equipped_pants = None
-                if profile.equipped_boots_id == it.id:
-                    profile.equipped_boots = None
-                if profile.equipped_shield_id == it.id:
-                    profile.equipped_shield = None
-                if profile.equipped_amulet1_id == it.id:
-                    profile.equipped_amulet1 = None
-                if profile.equipped_amulet2_id == it.id:
-                    profile.equipped_amulet2 = None
-                if profile.equipped_amulet3_id == it.id:
-                    profile.equipped_amulet3 = None
-                if getattr(profile, "equipped_pet_id", None) == it.id:
-                    profile.equipped_pet = None
-
-                total_coins += price
-                sold_count += 1
-                it.delete()
+        # --- VENDER TODA UNA RAREZA (menos lo equipado) ---
+        elif action == "sell_rarity":
+            rarity = request.POST.get("rarity")
+            if rarity not in RARITY_CHOICES_VALUES:
+                messages.error(request, "Rareza no válida.")
+                return redirect("rpg_inventory")
 
+            sold_count, total_coins = sell_items(
+                request.user,
+                RARITY_SELL_VALUE,
+                rarity=rarity,
+                keep_ids=equipped_item_ids(profile),
+                profile=profile,
+            )
             if sold_count > 0:
-                profile.coins += total_coins
-                profile.save()
                 messages.success(
                     request,
-                    f"Has vendido {sold_count} objeto(s) por {total_coins} monedas."
+                    f"Has vendido {sold_count} objeto(s) de rareza {ItemRarity(rarity).label} "
+                    f"por {total_coins} monedas."
                 )
             else:
-                messages.info(request, "No se vendió ningún objeto.")
+                messages.info(request, "No tienes objetos sin equipar de esa rareza.")
 
             return redirect("rpg_inventory")
 
-    # Recalcular stats y equipados para mostrar
-    stats = get_total_stats(request.user)
-    equipped_ids = set()
-    for field in [
-        "equipped_weapon", "equipped_helmet", "equipped_armor",
-        "equipped_pants", "equipped_boots", "equipped_shield",
-        "equipped_amulet1", "equipped_amulet2", "equipped_amulet3",
-        "equipped_pet",
-    ]:
-        it = getattr(profile, field, None)
-        if it:
-            equipped_ids.add(it.id)
+    # Primera página del inventario (sin contar los ítems en venta en el
+    # mercado); el resto se carga con rpg_inventory_page al hacer scroll
+    items, next_cursor = inventory_page(
+        request.user, slot=slot_filter if slot_filter in ItemSlot.values else None
+    )
+
+    # Stats y equipados para mostrar
+    stats = stats_from_profile(profile)
+    equipped_ids = equipped_item_ids(profile)
 
     context = {
         "profile": profile,
         "stats": stats,
         "items": items,
+        "next_cursor": next_cursor,
+        "counts": inventory_counts(request.user),
         "equipped_ids": equipped_ids,
         "slot_filter": slot_filter,
+        "sell_rarity_choices": [
+            (code, label, RARITY_SELL_VALUE[code]) for code, label in ItemRarity.choices
+        ],
     }
     return render(request, "notes/rpg_inventory.html", context)
 
 
+@login_required
+def rpg_inventory_page(request):
+    """
+    Siguiente página del inventario para el scroll infinito:
+    {"html": filas de la tabla, "next_cursor": cursor o null}.
+    """
+    slot_filter = request.GET.get("slot", "all")
+    items, next_cursor = inventory_page(
+        request.user,
+        slot=slot_filter if slot_filter in ItemSlot.values else None,
+        cursor=request.GET.get("cursor"),
+    )
+    profile = get_request_profile(request)
+    html = render_to_string(
+        "notes/rpg_inventory_rows.html",
+        {"items": items, "equipped_ids": equipped_item_ids(profile)},
+        request=request,
+    )
+    return JsonResponse({"html": html, "next_cursor": next_cursor})
+
+
 def _gacha_config_view(request, gacha_type, defaults, redirect_name):
     if not request.user.is_superuser:
         return HttpResponseForbidden("Solo el superusuario puede modificar el gacha.")
 
-    # Asegurar que existan filas en BD
-    qs = GachaProbability.objects.filter(gacha_type=gacha_type)
-    if not qs.exists():
-        for rarity_code, prob in defaults:
-            GachaProbability.objects.create(
-                gacha_type=gacha_type,
-                rarity=rarity_code,
-                probability=prob,
-            )
-        qs = GachaProbability.objects.filter(gacha_type=gacha_type)
-
-    # mapa con los valores actuales en BD
-    current_probs = {row.rarity: row.probability for row in qs}
+    # Valores actuales en BD (se crean las filas por defecto si faltan).
+    # Aquí se lee la BD directamente, no la tabla compilada del proceso.
+    current_list = load_gacha_probs(gacha_type)
+    current_probs = dict(current_list)
 
     if request.method == "POST":
         new_values = {}
@@ -1659,22 +1488,24 @@ def _gacha_config_view(request, gacha_type, defaults, redirect_name):
             messages.error(request, "La suma de probabilidades no puede superar 1.0.")
             return redirect(redirect_name)
 
-        # Guardar en BD
-        for rarity_code, default_prob in defaults:
-            obj, _ = GachaProbability.objects.get_or_create(
-                gacha_type=gacha_type,
-                rarity=rarity_code,
-            )
-            obj.probability = new_values.get(rarity_code, default_prob)
-            obj.save()
+        # Guardar en BD (las señales de GachaProbability invalidan las
+        # tablas compiladas al confirmar la transacción)
+        with transaction.atomic():
+            for rarity_code, default_prob in defaults:
+                obj, _ = GachaProbability.objects.get_or_create(
+                    gacha_type=gacha_type,
+                    rarity=rarity_code,
+                    defaults={"probability": default_prob},
+                )
+                obj.probability = new_values.get(rarity_code, default_prob)
+                obj.save()
 
         messages.success(request, "Probabilidades de gacha actualizadas.")
         return redirect(redirect_name)
 
     # GET: mostrar tabla
-    probs_raw = get_gacha_probs(gacha_type)
     rows = []
-    for code, prob in probs_raw:
+    for code, prob in current_list:
         rows.append({
             "code": code,
             "label": ItemRarity(code).label,
@@ -1714,39 +1545,44 @@ def rpg_gacha_premium_config(request):
         redirect_name="rpg_gacha_premium_config",
     )
 
-# ============================================================
-#  PVP — helpers
-# ============================================================
+# Periodos del informe de tasas (días; 0 = desde siempre)
+GACHA_REPORT_PERIODS = [1, 7, 30, 0]
 
-def ensure_all_pvp_rankings():
-    """
-    Crea entradas de ranking PVP para todos los usuarios que aún no tienen,
-    asignando posición inicial según fecha de registro (date_joined).
-    """
-    existing_user_ids = set(PvpRanking.objects.values_list("user_id", flat=True))
-    missing_users = User.objects.exclude(id__in=existing_user_ids).order_by("date_joined")
 
-    max_pos = PvpRanking.objects.aggregate(Max("position"))["position__max"] or 0
-    next_pos = max_pos + 1
+@login_required
+def rpg_gacha_report(request):
+    """Tasas observadas vs configuradas (superusuario)."""
+    if not request.user.is_superuser:
+        return HttpResponseForbidden("Solo el superusuario puede ver el informe del gacha.")
 
-    for u in missing_users:
-        PvpRanking.objects.create(user=u, position=next_pos)
-        next_pos += 1
+    try:
+        gacha_type = GachaType(request.GET.get("gtype") or GachaType.NORMAL)
+    except ValueError:
+        gacha_type = GachaType.NORMAL
 
+    try:
+        days = int(request.GET.get("days", "7"))
+    except ValueError:
+        days = 7
+    if days not in GACHA_REPORT_PERIODS:
+        days = 7
 
-def get_or_create_pvp_ranking(user: User) -> PvpRanking:
-    """
-    Devuelve el ranking PvP del usuario, creándolo si no existe.
-    Los nuevos usuarios se agregan al final del ranking.
-    """
-    ensure_all_pvp_rankings()
-    ranking, created = PvpRanking.objects.get_or_create(user=user)
-    if created:
-        max_pos = PvpRanking.objects.aggregate(Max("position"))["position__max"] or 0
-        ranking.position = max_pos + 1
-        ranking.save()
-    return ranking
+    report = gacha_rate_report(gacha_type, days=days or None)
+    daily_labels, daily_rows = gacha_daily_counts(gacha_type)
 
+    context = {
+        "gacha_type": gacha_type.value,
+        "days": days,
+        "periods": GACHA_REPORT_PERIODS,
+        "report": report,
+        "daily_labels": daily_labels,
+        "daily_rows": daily_rows,
+    }
+    return render(request, "notes/rpg_gacha_report.html", context)
+
+# ============================================================
+#  PVP — helpers
+# ============================================================
 
 class BattleStats:
     """
@@ -1780,15 +1616,19 @@ def simulate_pvp_battle(attacker_user: User, defender_user: User):
     """
     Simula un combate PvP usando exactamente los stats calculados en get_total_stats,
     que devuelve un diccionario con hp, attack, defense, crit_chance, dodge_chance, speed.
+
+    Devuelve (attacker_won, log_events) con el log empaquetado; el texto se
+    genera al mostrarlo (PvpBattleLog.render_log).
     """
-    atk = get_total_stats(attacker_user)
-    deff = get_total_stats(defender_user)
+    stats_map = get_total_stats_many([attacker_user.id, defender_user.id])
+    atk = stats_map[attacker_user.id]
+    deff = stats_map[defender_user.id]
 
-    log = []
-    log.append(f"Combate PvP entre {attacker_user.username} y {defender_user.username}\n")
+    events = []
 
     atk_hp = atk["hp"]
     def_hp = deff["hp"]
+    start_hp = (atk_hp, def_hp)
 
     atk_atk = atk["attack"]
     atk_def = atk["defense"]
@@ -1813,57 +1653,39 @@ def simulate_pvp_battle(attacker_user: User, defender_user: User):
     turno = 1
 
     while atk_hp > 0 and def_hp > 0:
-        log.append(f"Turno {turno}")
-
         if turn == "A":
             # Ataca atacante
             base = max(1, atk_atk - def_def)
             crit = random.random() < (atk_crit / 100.0)
             dodge = random.random() < (def_dodge / 100.0)
-
-            if dodge:
-                log.append(f" - {defender_user.username} esquiva el ataque.")
-                dmg = 0
-            else:
-                dmg = base * (2 if crit else 1)
-
-            def_hp -= dmg
-            log.append(f" - {attacker_user.username} hace {dmg} de daño.")
-            log.append(
-                f"   Vida: {attacker_user.username}={atk_hp} | {defender_user.username}={max(def_hp, 0)}"
-            )
-
-            turn = "D"
-
+            actor = ACTOR_PLAYER
         else:
             # Ataca defensor
             base = max(1, def_atk - atk_def)
             crit = random.random() < (def_crit / 100.0)
             dodge = random.random() < (atk_dodge / 100.0)
+            actor = ACTOR_ENEMY
 
-            if dodge:
-                log.append(f" - {attacker_user.username} esquiva el ataque.")
-                dmg = 0
-            else:
-                dmg = base * (2 if crit else 1)
+        if dodge:
+            dmg = 0
+            flags = FLAG_DODGE
+        else:
+            dmg = base * (2 if crit else 1)
+            flags = FLAG_CRIT if crit else 0
 
+        if turn == "A":
+            def_hp -= dmg
+            turn = "D"
+        else:
             atk_hp -= dmg
-            log.append(f" - {defender_user.username} hace {dmg} de daño.")
-            log.append(
-                f"   Vida: {attacker_user.username}={max(atk_hp, 0)} | {defender_user.username}={def_hp}"
-            )
-
             turn = "A"
 
-        log.append("")
+        if atk_hp <= 0 or def_hp <= 0:
+            flags |= FLAG_KO
+        events.append((turno, actor, dmg, flags))
         turno += 1
 
-    if atk_hp > 0:
-        log.append(f"{attacker_user.username} gana el combate.")
-        return True, "\n".join(log)
-    else:
-        log.append(f"{defender_user.username} gana el combate.")
-        return False, "\n".join(log)
+    return atk_hp > 0, pack_events(events, start_hp)
 
 
 @login_required
@@ -1874,12 +1696,9 @@ def rpg_pvp_arena(request):
     - Muestra hasta 3 rivales por encima de ti para desafiar.
     - Muestra el último combate PvP.
     """
-    profile = get_or_create_profile(request.user)
+    profile = get_request_profile(request)
     my_rank = get_or_create_pvp_ranking(request.user)
-    stats = get_total_stats(request.user)
-
-    # Aseguramos que existan rankings para todos
-    ensure_all_pvp_rankings()
+    stats = stats_from_profile(profile)
 
     # Rivales crudos: hasta 3 puestos por encima
     raw_challengers = (
@@ -1889,25 +1708,36 @@ def rpg_pvp_arena(request):
         .order_by("-position")[:3]
     )
 
+    raw_challengers = list(raw_challengers)
+
+    # Perfiles de los rivales en una sola consulta (stats del snapshot y
+    # *_id del equipo, sin JOIN a CombatItem)
+    challenger_profiles = {
+        p.user_id: p
+        for p in UserProfile.objects
+        .filter(user_id__in=[rank.user_id for rank in raw_challengers])
+    }
+
+    # Solo nombre y rareza de los ítems equipados, que es lo que se muestra
+    equipped_items = CombatItem.objects.only("id", "name", "rarity").in_bulk([
+        item_id
+        for p in challenger_profiles.values()
+        for item_id in equipped_item_ids(p)
+    ])
+
     challengers = []
     for rank in raw_challengers:
         u = rank.user
-        p = get_or_create_profile(u)
-        s = get_total_stats(u)
-
-        # ¿Tiene algo equipado?
-        has_equipped = any([
-            p.equipped_weapon,
-            p.equipped_helmet,
-            p.equipped_armor,
-            p.equipped_pants,
-            p.equipped_boots,
-            p.equipped_shield,
-            p.equipped_amulet1,
-            p.equipped_amulet2,
-            p.equipped_amulet3,
-            getattr(p, "equipped_pet", None),
-        ])
+        p = challenger_profiles.get(u.id) or get_or_create_profile(u)
+        s = stats_from_profile(p)
+
+        # ¿Tiene algo equipado? [(ítem, es_mascota)] en el orden de los slots
+        has_equipped = bool(equipped_item_ids(p))
+        equipped = []
+        for field in EQUIPMENT_FIELDS:
+            item = equipped_items.get(getattr(p, f"{field}_id"))
+            if item is not None:
+                equipped.append((item, field == "equipped_pet"))
 
         # ¿O stats distintos a los básicos?
         has_stats = any([
@@ -1925,6 +1755,8 @@ def rpg_pvp_arena(request):
             "profile": p,
             "stats": s,
             "has_equipment": has_equipped or has_stats,
+            "equipped": equipped,
+            "odds": get_pvp_odds(stats, s),
         })
 
     # Último combate donde participe el usuario
@@ -1949,14 +1781,23 @@ def rpg_pvp_arena(request):
                     "Ya has cobrado tu recompensa diaria o tu puesto no otorga monedas."
                 )
             else:
-                profile.coins += todays_reward
-                profile.save()
-                my_rank.last_reward_date = today
-                my_rank.save()
-                messages.success(
-                    request,
-                    f"Has cobrado {todays_reward} monedas por tu puesto PvP #{my_rank.position}.",
-                )
+                with transaction.atomic():
+                    # Marcar el cobro y pagar juntos: un doble clic no cobra dos veces
+                    claimed = (
+                        PvpRanking.objects
+                        .filter(id=my_rank.id)
+                        .exclude(last_reward_date=today)
+                        .update(last_reward_date=today)
+                    )
+                    if claimed:
+                        wallet.credit(request.user, coins=todays_reward, reason="pvp_daily")
+                if claimed:
+                    messages.success(
+                        request,
+                        f"Has cobrado {todays_reward} monedas por tu puesto PvP #{my_rank.position}.",
+                    )
+                else:
+                    messages.info(request, "Ya has cobrado tu recompensa diaria.")
             return redirect("rpg_pvp_arena")
 
     context = {
@@ -1989,62 +1830,50 @@ def rpg_pvp_challenge(request, target_id):
         messages.error(request, "El rival no existe.")
         return redirect("rpg_pvp_arena")
 
-    # No puedes desafiar a alguien por debajo o igual
+    # Solo rivales con mejor clasificación, como mucho 3 puestos por encima
     if target_rank.position >= attacker_rank.position:
         messages.error(request, "Solo puedes desafiar a jugadores con mejor clasificación que tú.")
         return redirect("rpg_pvp_arena")
 
-    # Máximo 3 puestos por encima
-    if attacker_rank.position - target_rank.position > 3:
+    if not can_challenge(attacker_rank.position, target_rank.position):
         messages.error(request, "Solo puedes desafiar hasta 3 puestos por encima.")
         return redirect("rpg_pvp_arena")
 
     defender = target_rank.user
 
     # Simulación de combate (usa el sistema de stats del RPG)
-    attacker_won, log_text = simulate_pvp_battle(attacker, defender)
+    attacker_won, log_events = simulate_pvp_battle(attacker, defender)
 
-    # Guardar log
+    # Guardar log (empaquetado; se pasa a texto solo al mostrarlo)
     PvpBattleLog.objects.create(
         attacker=attacker,
         defender=defender,
         attacker_won=attacker_won,
-        log_text=log_text,
+        log_events=log_events,
     )
 
     if attacker_won:
-        old_attacker_pos = attacker_rank.position
-        old_target_pos = target_rank.position
-
         try:
-            # Swap SEGURO usando una posición temporal que no esté en uso
-            with transaction.atomic():
-                max_pos = PvpRanking.objects.aggregate(Max("position"))["position__max"] or 0
-                temp_pos = max_pos + 1  # posición libre
-
-                # 1) Mover al atacante a una posición temporal
-                attacker_rank.position = temp_pos
-                attacker_rank.save(update_fields=["position"])
-
-                # 2) Mover al defensor al puesto original del atacante
-                target_rank.position = old_attacker_pos
-                target_rank.save(update_fields=["position"])
-
-                # 3) Mover al atacante al antiguo puesto del defensor
-                attacker_rank.position = old_target_pos
-                attacker_rank.save(update_fields=["position"])
-
-        except IntegrityError:
+            # Bloquea ambos puestos y los intercambia (revalidando el desafío)
+            new_position = swap_after_victory(attacker_rank.id, target_rank.id)
+        except (IntegrityError, OperationalError):
             messages.error(
                 request,
                 "Ocurrió un problema al actualizar el ranking. Inténtalo de nuevo."
             )
             return redirect("rpg_pvp_arena")
 
-        messages.success(
-            request,
-            f"¡Has vencido a {defender.username} y ahora ocupas el puesto #{old_target_pos}!"
-        )
+        if new_position is None:
+            messages.info(
+                request,
+                f"Has vencido a {defender.username}, pero el ranking cambió durante el combate "
+                "y ya no podéis intercambiar puestos."
+            )
+        else:
+            messages.success(
+                request,
+                f"¡Has vencido a {defender.username} y ahora ocupas el puesto #{new_position}!"
+            )
     else:
         messages.info(
             request,
@@ -2059,7 +1888,6 @@ def rpg_pvp_leaderboard(request):
     """
     Muestra el top 10 del ranking PvP.
     """
-    ensure_all_pvp_rankings()
     top_ranks = (
         PvpRanking.objects
         .select_related("user")
@@ -2078,7 +1906,7 @@ def rpg_trades(request):
     - Intercambios recibidos.
     - Intercambios enviados.
     """
-    profile = get_or_create_profile(request.user)
+    profile = get_request_profile(request)
 
     incoming = (
         Trade.objects
@@ -2111,7 +1939,7 @@ def rpg_trade_create(request):
     - Qué objetos tuyos ofreces (máx 10 objetos en total, pero aquí solo cuenta tu lado).
     El detalle se podrá ajustar luego (contra-oferta) por ambos.
     """
-    profile = get_or_create_profile(request.user)
+    profile = get_request_profile(request)
 
     users = User.objects.exclude(id=request.user.id).order_by("username")
     my_items = CombatItem.objects.filter(owner=request.user).order_by("-created_at")
@@ -2159,9 +1987,9 @@ def rpg_trade_create(request):
         trade.offered_from.set(offered_qs)
 
         # Notificación al otro jugador
-        Notification.objects.create(
-            user=to_user,
-            message=f"{request.user.username} te ha enviado una oferta de intercambio.",
+        notify(
+            to_user,
+            f"{request.user.username} te ha enviado una oferta de intercambio.",
             url=reverse("rpg_trade_detail", args=[trade.id]),
         )
 
@@ -2315,11 +2143,6 @@ def rpg_trade_detail(request, trade_id):
                     to_profile, _ = UserProfile.objects.select_for_update().get_or_create(user=trade.to_user)
 
                     # Revalidar que todo está OK
-                    if from_profile.coins < trade.from_coins:
-                        raise ValueError("El emisor ya no tiene suficientes monedas.")
-                    if to_profile.coins < trade.to_coins:
-                        raise ValueError("El receptor ya no tiene suficientes monedas.")
-
                     # Validar propiedad de items
                     for item in trade.offered_from.all():
                         if item.owner_id != trade.from_user_id:
@@ -2328,17 +2151,30 @@ def rpg_trade_detail(request, trade_id):
                         if item.owner_id != trade.to_user_id:
                             raise ValueError(f"{item.name} ya no pertenece al receptor.")
 
-                    # Mover monedas
+                    # Mover monedas (el saldo se comprueba en el propio UPDATE)
                     if trade.from_coins:
-                        from_profile.coins -= trade.from_coins
-                        to_profile.coins += trade.from_coins
+                        try:
+                            wallet.transfer(trade.from_user_id, trade.to_user_id, trade.from_coins, reason="trade")
+                        except wallet.InsufficientFunds:
+                            raise ValueError("El emisor ya no tiene suficientes monedas.")
 
                     if trade.to_coins:
-                        to_profile.coins -= trade.to_coins
-                        from_profile.coins += trade.to_coins
-
-                    from_profile.save()
-                    to_profile.save()
+                        try:
+                            wallet.transfer(trade.to_user_id, trade.from_user_id, trade.to_coins, reason="trade")
+                        except wallet.InsufficientFunds:
+                            raise ValueError("El receptor ya no tiene suficientes monedas.")
+
+                    # Los ítems que cambian de dueño dejan de estar equipados
+                    from_ids = [item.id for item in trade.offered_from.all()]
+                    to_ids = [item.id for item in trade.offered_to.all()]
+                    if unequip_items(from_profile, from_ids):
+                        refresh_stats_snapshot(from_profile, save=False)
+                    if unequip_items(to_profile, to_ids):
+                        refresh_stats_snapshot(to_profile, save=False)
+
+                    profile_fields = EQUIPMENT_FIELDS + list(SNAPSHOT_FIELDS.values())
+                    from_profile.save(update_fields=profile_fields)
+                    to_profile.save(update_fields=profile_fields)
 
                     # Mover items
                     for item in trade.offered_from.all():
@@ -2381,123 +2217,6 @@ def rpg_trade_detail(request, trade_id):
 #  WORLD BOSS
 # ============================================================
 
-def _get_current_world_boss_cycle():
-    """
-    Cada día se divide en bloques de 3 horas empezando a las 00:00 (hora local).
-    Este helper devuelve el ciclo actual de World Boss (prep/batalla/reposo).
-    """
-    now = timezone.localtime(timezone.now())
-    start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
-
-    minutes_since_midnight = now.hour * 60 + now.minute
-    block_minutes = 3 * 60  # 3 horas
-    cycle_index = minutes_since_midnight // block_minutes
-
-    cycle_start = start_of_day + timedelta(hours=3 * cycle_index)
-
-    cycle, _ = WorldBossCycle.objects.get_or_create(start_time=cycle_start)
-    return cycle, now, cycle_start
-
-
-def _advance_world_boss_battle(cycle: WorldBossCycle, now_local, cycle_start):
-    """
-    Avanza los turnos de la batalla en base al tiempo real transcurrido desde
-    el inicio de la fase de batalla. 1 turno = 1 minuto.
-    El jefe:
-      - recibe daño: sumamos el ataque de cada jugador vivo (sin defensa)
-      - golpea a todos los jugadores vivos con 50 de daño fijo.
-    La batalla termina cuando todos los participantes tienen 0 o menos de HP.
-    Al terminar:
-      - Se reparten 5 monedas por cada 100 puntos de daño TOTAL recibido
-        a TODOS los participantes de este ciclo.
-    """
-    if cycle.finished:
-        return
-
-    battle_start = cycle_start + timedelta(hours=1)  # prep = 1h, luego batalla
-
-    # Si aún no empieza la fase de batalla, no hacemos nada
-    if now_local <= battle_start:
-        return
-
-    # ¿Cuántos turnos deberían haberse ejecutado hasta ahora?
-    total_minutes = int((now_local - battle_start).total_seconds() // 60)
-    pending_turns = total_minutes - cycle.turns_processed
-    if pending_turns <= 0:
-        return
-
-    participants = list(
-        cycle.participants.select_related("user")
-    )
-    if not participants:
-        # Nadie participó: marcamos como terminada.
-        cycle.finished = True
-        cycle.save()
-        return
-
-    log_lines = []
-    turn_number = cycle.turns_processed + 1
-
-    for _ in range(pending_turns):
-        # Jugadores vivos al inicio de este turno
-        alive = [p for p in participants if p.current_hp > 0]
-        if not alive:
-            cycle.finished = True
-            break
-
-        log_lines.append(f"Turno {turn_number}")
-
-        # 1) Todos los jugadores golpean al jefe
-        for p in alive:
-            stats = get_total_stats(p.user)
-            dmg = max(1, stats["attack"])  # sin defensa del jefe
-            p.total_damage_done += dmg
-            cycle.total_damage += dmg
-            log_lines.append(f"- {p.user.username} inflige {dmg} de daño al jefe.")
-
-        # 2) El jefe golpea a todos con 50 de daño fijo
-        log_lines.append(f"- El jefe golpea a todos y hace 50 de daño.")
-        for p in alive:
-            p.current_hp -= 75
-            if p.current_hp <= 0:
-                p.current_hp = 0
-                log_lines.append(f"  · {p.user.username} ha sido derrotado.")
-
-        log_lines.append("")
-        turn_number += 1
-        cycle.turns_processed += 1
-
-    # Guardamos cambios en los participantes
-    WorldBossParticipant.objects.bulk_update(
-        participants,
-        ["current_hp", "total_damage_done"],
-    )
-
-    # Append del log
-    if log_lines:
-        new_block = "\n".join(log_lines)
-        if cycle.battle_log:
-            cycle.battle_log += "\n" + new_block
-        else:
-            cycle.battle_log = new_block
-
-    # ¿Queda alguien vivo?
-    if not any(p.current_hp > 0 for p in participants):
-        cycle.finished = True
-
-    # Si la batalla acaba y aún no se han repartido las recompensas, las damos
-    if cycle.finished and not cycle.rewards_given and cycle.total_damage > 0:
-        reward_per_player = (cycle.total_damage // 100) * 5
-        if reward_per_player > 0:
-            for p in participants:
-                prof = get_or_create_profile(p.user)
-                prof.coins += reward_per_player
-                prof.save()
-        cycle.rewards_given = True
-
-    cycle.save()
-
-
 @login_required
 def rpg_world_boss(request):
     """
@@ -2506,29 +2225,20 @@ def rpg_world_boss(request):
       - preparación (1h): los jugadores se pueden unir.
       - batalla (hasta 2h dentro del bloque): se simula 1 turno por minuto.
       - reposo (hasta el final del bloque de 3h): se ve log y daño total.
-    """
-    cycle, now_local, cycle_start = _get_current_world_boss_cycle()
-
-    elapsed = now_local - cycle_start
-    hours = elapsed.total_seconds() / 3600.0
 
-    if cycle.finished:
-        phase = "rest"
-    else:
-        if hours < 1:
-            phase = "prep"
-        elif hours < 2:
-            phase = "battle"
-        else:
-            phase = "rest"
+    La vista solo muestra el estado: los turnos los avanza el scheduler
+    en segundo plano (notes/scheduler.py, tick_world_boss).
+    """
+    cycle, now_local, cycle_start = get_current_world_boss_cycle()
+    phase = world_boss_phase(cycle, now_local, cycle_start)
 
     prep_end = cycle_start + timedelta(hours=1)
     battle_start = cycle_start + timedelta(hours=1)
     battle_end = cycle_start + timedelta(hours=2)
     cycle_end = cycle_start + timedelta(hours=3)
 
-    profile = get_or_create_profile(request.user)
-    stats = get_total_stats(request.user)
+    profile = get_request_profile(request)
+    stats = stats_from_profile(profile)
 
     participation = WorldBossParticipant.objects.filter(
         cycle=cycle,
@@ -2554,11 +2264,6 @@ def rpg_world_boss(request):
                 messages.info(request, "Ya estás inscrito en esta batalla.")
             return redirect("rpg_world_boss")
 
-    # Si estamos en batalla, avanzamos los turnos según el tiempo real
-    if phase == "battle":
-        _advance_world_boss_battle(cycle, now_local, cycle_start)
-
-    # Refrescamos datos después de posible simulación
     participants_qs = cycle.participants.select_related("user").order_by(
         "-total_damage_done",
         "user__username",
@@ -2568,6 +2273,8 @@ def rpg_world_boss(request):
     hero = participants_qs.first() if total_damage > 0 else None
     reward_preview = (total_damage // 100) * 5
 
+    log_page = get_battle_log_page(cycle.log_entries.all(), request.GET.get("log_page"))
+
     context = {
         "profile": profile,
         "stats": stats,
@@ -2578,6 +2285,7 @@ def rpg_world_boss(request):
         "hero": hero,
         "total_damage": total_damage,
         "reward_preview": reward_preview,
+        "log_page": log_page,
         "prep_end": prep_end,
         "battle_start": battle_start,
         "battle_end": battle_end,
@@ -2588,38 +2296,9 @@ def rpg_world_boss(request):
 
 
 # ============================================================
-#  MINI BOSS — Definiciones
+#  MINI BOSS
 # ============================================================
 
-MINI_BOSS_DEFINITIONS = {
-    "moth_baron": {
-        "code": "moth_baron",
-        "name": "Varón Polilla",
-        "damage_per_turn": 30,
-        "reward_per_100": 5,   # 1 moneda por cada 100 de daño
-        "max_reward": 40,      # máximo 40 monedas
-    },
-    "cat_commander": {
-        "code": "cat_commander",
-        "name": "Comandante Gato",
-        "damage_per_turn": 50,
-        "reward_per_100": 5,
-        "max_reward": 60,
-    },
-    "nightmare_freddy": {
-        "code": "nightmare_freddy",
-        "name": "Pesadilla Freddy",
-        "damage_per_turn": 100,
-        "reward_per_100": 5,
-        "max_reward": 100,
-    },
-}
-
-
-def get_miniboss_def(boss_code):
-    return MINI_BOSS_DEFINITIONS.get(boss_code)
-
-
 def get_user_miniboss_daily_count(user):
     """
     Cuenta cuántas veces ha participado un usuario hoy
@@ -2632,142 +2311,6 @@ def get_user_miniboss_daily_count(user):
     ).values("lobby").distinct().count()
 
 
-def _apply_miniboss_rewards(lobby, participants_qs):
-    """
-    Calcula y entrega recompensas SEGÚN EL DAÑO TOTAL GLOBAL
-    que llevaba el jefe en el momento en que murió el jugador.
-
-    Ejemplo: si el jugador muere cuando lobby.total_damage era 1100,
-    se usan esos 1100 para el cálculo de monedas.
-    """
-    boss_def = get_miniboss_def(lobby.boss_code)
-    if not boss_def:
-        return
-
-    reward_per_100 = boss_def["reward_per_100"]
-    max_reward = boss_def["max_reward"]
-
-    for p in participants_qs:
-        if p.reward_given:
-            continue
-
-        # Si nunca se seteó durante la batalla (por seguridad),
-        # usamos el total de daño final del lobby
-        effective_damage = p.boss_damage_at_death or lobby.total_damage
-
-        # monedas = floor(effective_damage / 100) * reward_per_100, cap max_reward
-        coins = (effective_damage // 100) * reward_per_100
-        if coins > max_reward:
-            coins = max_reward
-
-        if coins > 0:
-            profile = get_or_create_profile(p.user)
-            profile.coins += coins
-            profile.save()
-
-        p.reward_coins = coins
-        p.reward_given = True
-        p.save()
-
-
-def _advance_miniboss_battle(lobby: MiniBossLobby):
-    """
-    Avanza la batalla del minijefe según el tiempo transcurrido.
-    - 1 turno cada 30 segundos desde started_at.
-    - El jefe hace daño fijo a todos los jugadores vivos.
-    - Los jugadores hacen daño basado en su ataque total.
-    - La batalla termina cuando todos los jugadores están derrotados.
-
-    AHORA: cada participante guarda lobby.total_damage en boss_damage_at_death
-    en el turno en que muere, para usarlo como base de recompensa.
-    """
-    if lobby.status != MiniBossLobby.STATUS_RUNNING or not lobby.started_at:
-        return
-
-    boss_def = get_miniboss_def(lobby.boss_code)
-    if not boss_def:
-        return
-
-    now = timezone.now()
-    elapsed = (now - lobby.started_at).total_seconds()
-
-    # Si quieres 30 segundos por turno cambia 10 -> 30
-    turns_should_have = int(elapsed // 10)
-    if turns_should_have <= lobby.current_turn:
-        # Ya estamos al día
-        return
-
-    participants = list(
-        MiniBossParticipant.objects
-        .filter(lobby=lobby)
-        .select_related("user")
-    )
-
-    # Filtrar vivos
-    alive = [p for p in participants if p.is_alive and p.hp_remaining > 0]
-
-    log_lines = []
-    if lobby.log_text:
-        log_lines = lobby.log_text.splitlines()
-
-    damage_per_turn = boss_def["damage_per_turn"]
-
-    # Avanzamos turno a turno hasta alcanzar turns_should_have o que no queden vivos
-    while lobby.current_turn < turns_should_have and alive:
-        lobby.current_turn += 1
-        turn_num = lobby.current_turn
-        log_lines.append(f"Turno {turn_num}")
-
-        # 1) Jugadores atacan
-        turn_total_damage = 0
-        for p in alive:
-            stats = get_total_stats(p.user)
-            dmg = max(1, stats["attack"])
-            p.total_damage_done += dmg
-            turn_total_damage += dmg
-
-        lobby.total_damage += turn_total_damage
-        log_lines.append(f"- Los jugadores infligen {turn_total_damage} de daño al jefe.")
-
-        # 2) Jefe contraataca
-        if alive:
-            log_lines.append(f"- El jefe contraataca con {damage_per_turn} de daño a cada jugador.")
-            for p in alive:
-                if not p.is_alive or p.hp_remaining <= 0:
-                    continue
-                p.hp_remaining -= damage_per_turn
-                if p.hp_remaining <= 0:
-                    p.hp_remaining = 0
-                    p.is_alive = False
-                    # 🔥 Guardamos el daño global del jefe en el momento de la muerte
-                    if p.boss_damage_at_death == 0:
-                        p.boss_damage_at_death = lobby.total_damage
-
-        # Actualizar lista de vivos
-        alive = [p for p in alive if p.is_alive and p.hp_remaining > 0]
-
-        if not alive:
-            log_lines.append("- Todos los jugadores han sido derrotados.")
-        log_lines.append("")
-
-    # Guardar participantes
-    for p in participants:
-        # Por seguridad: si alguien nunca quedó con boss_damage_at_death,
-        # le dejamos el total final
-        if p.boss_damage_at_death == 0 and (not p.is_alive or p.hp_remaining <= 0):
-            p.boss_damage_at_death = lobby.total_damage
-        p.save()
-
-    # Si ya no quedan vivos, terminamos la batalla
-    if not any(p.is_alive and p.hp_remaining > 0 for p in participants):
-        lobby.status = MiniBossLobby.STATUS_FINISHED
-        lobby.ended_at = timezone.now()
-        _apply_miniboss_rewards(lobby, participants)
-
-    lobby.log_text = "\n".join(log_lines)
-    lobby.save()
-
-
 @login_required
 def rpg_miniboss_hub(request):
     """
@@ -2776,7 +2319,7 @@ def rpg_miniboss_hub(request):
     - Muestra lobbies en espera.
     - Permite crear un lobby nuevo (respetando máximo 3 participaciones diarias).
     """
-    profile = get_or_create_profile(request.user)
+    profile = get_request_profile(request)
 
     today_count = get_user_miniboss_daily_count(request.user)
     remaining = max(0, 3 - today_count)
@@ -2801,7 +2344,7 @@ def rpg_miniboss_hub(request):
         )
 
         # Crear participante para el creador
-        stats = get_total_stats(request.user)
+        stats = stats_from_profile(profile)
         MiniBossParticipant.objects.create(
             lobby=lobby,
             user=request.user,
@@ -2854,11 +2397,11 @@ def rpg_miniboss_lobby(request, lobby_id):
     """
     lobby = get_object_or_404(MiniBossLobby, pk=lobby_id)
     boss_def = get_miniboss_def(lobby.boss_code)
-    profile = get_or_create_profile(request.user)
+    profile = get_request_profile(request)
 
     # Avanzar la batalla si está en curso
     if lobby.status == MiniBossLobby.STATUS_RUNNING:
-        _advance_miniboss_battle(lobby)
+        advance_miniboss_battle(lobby)
         lobby.refresh_from_db()
 
     participants = list(
@@ -2884,7 +2427,7 @@ def rpg_miniboss_lobby(request, lobby_id):
             elif remaining <= 0:
                 messages.error(request, "Ya has participado en el máximo de 3 minijefes hoy.")
             else:
-                stats = get_total_stats(request.user)
+                stats = stats_from_profile(profile)
                 MiniBossParticipant.objects.create(
                     lobby=lobby,
                     user=request.user,
@@ -2905,11 +2448,11 @@ def rpg_miniboss_lobby(request, lobby_id):
                     lobby.status = MiniBossLobby.STATUS_RUNNING
                     lobby.started_at = timezone.now()
                     lobby.current_turn = 0
-                    text = lobby.log_text or ""
-                    if boss_def:
-                        text += f"Comienza la batalla contra {boss_def['name']}.\n\n"
-                    lobby.log_text = text
                     lobby.save()
+                    if boss_def:
+                        append_battle_log(
+                            0, [f"Comienza la batalla contra {boss_def['name']}."], lobby=lobby
+                        )
                     messages.success(request, "¡La batalla ha comenzado!")
             return redirect("rpg_miniboss_lobby", lobby_id=lobby.id)
 
@@ -2932,9 +2475,12 @@ def rpg_miniboss_lobby(request, lobby_id):
             reverse=True,
         )[0]
 
+    log_page = get_battle_log_page(lobby.log_entries.all(), request.GET.get("log_page"))
+
     context = {
         "lobby": lobby,
         "boss": boss_def,
+        "log_page": log_page,
         "participants": participants,
         "is_participant": is_participant,
         "is_creator": is_creator,
@@ -2962,23 +2508,45 @@ RARITY_CHOICES_VALUES = [choice[0] for choice in ItemRarity.choices]
 def rpg_market(request):
     """
     Mercado global:
-    - Lista todas las ofertas activas.
-    - Permite filtrar por rareza.
+    - Ofertas activas paginadas por cursor (ver services/market.search_listings).
+    - Permite filtrar por rareza, slot y rango de precio, y ordenar por precio o recientes.
     - Muestra las publicaciones propias y los objetos disponibles para listar.
     """
-    profile = get_or_create_profile(request.user)
+    profile = get_request_profile(request)
 
     rarity_filter = request.GET.get("rarity", "all")
+    slot_filter = request.GET.get("slot", "all")
+    sort = request.GET.get("sort", "price")
+    if sort not in MARKET_SORTS:
+        sort = "price"
 
-    listings_qs = (
-        MarketListing.objects
-        .filter(is_active=True)
-        .select_related("item", "seller")
+    def _price_param(name):
+        try:
+            value = int(request.GET.get(name, ""))
+        except ValueError:
+            return None
+        return value if value >= 0 else None
+
+    min_price = _price_param("min_price")
+    max_price = _price_param("max_price")
+
+    listings, next_cursor = search_listings(
+        rarity=rarity_filter if rarity_filter in RARITY_CHOICES_VALUES else None,
+        slot=slot_filter if slot_filter in ItemSlot.values else None,
+        min_price=min_price,
+        max_price=max_price,
+        sort=sort,
+        cursor=request.GET.get("cursor"),
     )
-    if rarity_filter in RARITY_CHOICES_VALUES:
-        listings_qs = listings_qs.filter(item__rarity=rarity_filter)
 
-    listings = list(listings_qs)
+    # Filtros actuales (sin cursor) para los enlaces de paginación
+    filter_query = urlencode({
+        "rarity": rarity_filter,
+        "slot": slot_filter,
+        "sort": sort,
+        "min_price": "" if min_price is None else min_price,
+        "max_price": "" if max_price is None else max_price,
+    })
 
     # Publicaciones del usuario
     my_listings = list(
@@ -2988,10 +2556,17 @@ def rpg_market(request):
     )
 
     # Objetos disponibles para poner en venta (no listados ya)
-    available_items = CombatItem.objects.filter(
+    available_items = list(CombatItem.objects.filter(
         owner=request.user,
         market_listing__isnull=True,   # <-- importante para que no aparezcan los listados
-    ).order_by("-created_at")
+    ).order_by("-created_at"))
+
+    # Precios de referencia (índice de ventas de los últimos días)
+    price_index = suggested_prices()
+    for listing in listings:
+        listing.price_hint = price_index.get((listing.slot, listing.rarity))
+    for item in available_items:
+        item.price_hint = price_index.get((item.slot, item.rarity))
 
     # choices (value, label) para el combo de rareza en el template
     item_rarity_choices = ItemRarity.choices
@@ -2999,10 +2574,20 @@ def rpg_market(request):
     context = {
         "profile": profile,
         "listings": listings,
+        "next_cursor": next_cursor,
+        "is_first_page": not request.GET.get("cursor"),
+        "filter_query": filter_query,
         "my_listings": my_listings,
         "available_items": available_items,
         "rarity_filter": rarity_filter,
+        "slot_filter": slot_filter,
+        "sort": sort,
+        "min_price": min_price,
+        "max_price": max_price,
         "item_rarity_choices": item_rarity_choices,
+        "item_slot_choices": ItemSlot.choices,
+        "sort_choices": MARKET_SORT_LABELS,
+        "price_index_days": PRICE_INDEX_DAYS,
     }
     return render(request, "notes/rpg_market.html", context)
 
@@ -3033,18 +2618,10 @@ def rpg_market_list_item(request, item_id):
         return redirect("rpg_market")
 
     # Si estaba equipado, lo desequipamos
-    profile = get_or_create_profile(request.user)
-    changed = False
-    for field in [
-        "equipped_weapon", "equipped_helmet", "equipped_armor",
-        "equipped_pants", "equipped_boots", "equipped_shield",
-        "equipped_amulet1", "equipped_amulet2", "equipped_amulet3",
-    ]:
-        if getattr(profile, field, None) == item:
-            setattr(profile, field, None)
-            changed = True
-    if changed:
-        profile.save()
+    profile = get_request_profile(request)
+    if unequip_items(profile, [item.id]):
+        refresh_stats_snapshot(profile, save=False)
+        profile.save(update_fields=EQUIPMENT_FIELDS + list(SNAPSHOT_FIELDS.values()))
 
     MarketListing.objects.create(
         item=item,
@@ -3053,7 +2630,14 @@ def rpg_market_list_item(request, item_id):
         is_active=True,
     )
 
-    messages.success(request, f"Has puesto {item.name} en el mercado por {price} monedas.")
+    msg = f"Has puesto {item.name} en el mercado por {price} monedas."
+    hint = suggested_prices(slot=item.slot, rarity=item.rarity).get((item.slot, item.rarity))
+    if hint:
+        msg += (
+            f" Referencia ({PRICE_INDEX_DAYS} días): mediana {hint['median']}"
+            f" (mín. {hint['min']}, máx. {hint['max']}, {hint['sales']} ventas)."
+        )
+    messages.success(request, msg)
     return redirect("rpg_market")
 
 
@@ -3079,40 +2663,25 @@ def rpg_market_cancel(request, listing_id):
 @login_required
 def rpg_market_buy(request, listing_id):
     listing = get_object_or_404(MarketListing, pk=listing_id, is_active=True)
-    buyer = request.user
-    seller = listing.seller
 
-    if buyer == seller:
+    if request.user == listing.seller:
         messages.error(request, "No puedes comprar tu propio objeto.")
         return redirect("rpg_market")
 
-    profile_buyer = get_or_create_profile(buyer)
-    profile_seller = get_or_create_profile(seller)
-
     if request.method == "POST":
-        if profile_buyer.coins < listing.price_coins:
+        # Bloqueo de la oferta + cobro condicionado al saldo (services/market.py)
+        try:
+            listing = buy_listing(listing.id, request.user)
+        except PurchaseError as e:
+            messages.error(request, str(e))
+            return redirect("rpg_market")
+        except wallet.InsufficientFunds:
             messages.error(request, "No tienes suficientes monedas.")
             return redirect("rpg_market")
 
-        # Transferencia de monedas
-        profile_buyer.coins -= listing.price_coins
-        profile_seller.coins += listing.price_coins
-        profile_buyer.save()
-        profile_seller.save()
-
-        # Transferencia de ítem
-        item = listing.item
-        item.owner = buyer
-        item.save()
-
-        # Cerrar listing
-        listing.is_active = False
-        listing.buyer = buyer
-        listing.save()
-
         messages.success(
             request,
-            f"Has comprado {item.name} por {listing.price_coins} monedas."
+            f"Has comprado {listing.item.name} por {listing.price_coins} monedas."
         )
         return redirect("rpg_inventory")
 
@@ -3126,7 +2695,7 @@ def rpg_vip_shop(request):
     - Permite comprar objetos VIP o paquetes de rubíes.
     """
 
-    profile = get_or_create_profile(request.user)
+    profile = get_request_profile(request)
 
     filter_type = request.GET.get("type", "all")
 
@@ -3166,21 +2735,30 @@ def rpg_vip_shop(request):
                     messages.error(request, "No tienes suficientes rubíes.")
                     return redirect("rpg_vip_shop")
 
-                # Cobrar
-                if cost_coins > 0:
-                    profile.coins -= cost_coins
-                if cost_rubies > 0:
-                    profile.rubies -= cost_rubies
-                profile.save()
-
-                # Transferir el ítem al comprador
-                item = offer.item
-                item.owner = request.user
-                item.save()
-
-                offer.is_active = False
-                offer.buyer = request.user
-                offer.save()
+                try:
+                    with transaction.atomic():
+                        # Cobrar
+                        wallet.debit(request.user, coins=cost_coins, rubies=cost_rubies, reason="vip_item")
+
+                        # Transferir el ítem al comprador
+                        item = offer.item
+                        if item.owner_id != request.user.id:
+                            previous_owner = get_or_create_profile(item.owner)
+                            if unequip_items(previous_owner, [item.id]):
+                                refresh_stats_snapshot(previous_owner, save=False)
+                                previous_owner.save(
+                                    update_fields=EQUIPMENT_FIELDS + list(SNAPSHOT_FIELDS.values())
+                                )
+
+                        item.owner = request.user
+                        item.save()
+
+                        offer.is_active = False
+                        offer.buyer = request.user
+                        offer.save()
+                except wallet.InsufficientFunds:
+                    messages.error(request, "No tienes suficiente saldo.")
+                    return redirect("rpg_vip_shop")
 
                 messages.success(
                     request,
@@ -3201,13 +2779,17 @@ def rpg_vip_shop(request):
                     messages.error(request, "No tienes suficientes monedas.")
                     return redirect("rpg_vip_shop")
 
-                profile.coins -= cost_coins
-                profile.rubies += ruby_amount
-                profile.save()
-
-                offer.is_active = False
-                offer.buyer = request.user
-                offer.save()
+                try:
+                    with transaction.atomic():
+                        wallet.change_balance(
+                            request.user, coins=-cost_coins, rubies=ruby_amount, reason="vip_rubies"
+                        )
+                        offer.is_active = False
+                        offer.buyer = request.user
+                        offer.save()
+                except wallet.InsufficientFunds:
+                    messages.error(request, "No tienes suficientes monedas.")
+                    return redirect("rpg_vip_shop")
 
                 messages.success(
                     request,
@@ -3233,7 +2815,7 @@ def rpg_vip_admin(request):
     if not request.user.is_superuser:
         return HttpResponseForbidden("Solo el superusuario puede administrar la tienda VIP.")
 
-    profile = get_or_create_profile(request.user)
+    profile = get_request_profile(request)
 
     if request.method == "POST":
         action = request.POST.get("action")
@@ -3371,7 +2953,7 @@ def rpg_raffle(request):
     # Un solo sorteo "global"
     raffle, _ = Raffle.objects.get_or_create(id=1)
 
-    profile = get_or_create_profile(request.user)
+    profile = get_request_profile(request)
 
     # ¿Ya estoy inscrito?
     my_entry = RaffleEntry.objects.filter(raffle=raffle, user=request.user).first()
@@ -3494,18 +3076,22 @@ def rpg_raffle(request):
                 return redirect("rpg_raffle")
 
             price = raffle.participation_price or 0
-            if price > 0:
-                if profile.coins < price:
-                    messages.error(request, "No tienes suficientes monedas para participar.")
-                    return redirect("rpg_raffle")
-                profile.coins -= price
-                profile.save()
-
-            RaffleEntry.objects.create(
-                raffle=raffle,
-                user=request.user,
-                weight=1,  # por defecto 1, luego el admin puede editar
-            )
+            try:
+                with transaction.atomic():
+                    if price > 0:
+                        wallet.debit(request.user, coins=price, reason="raffle")
+                    RaffleEntry.objects.create(
+                        raffle=raffle,
+                        user=request.user,
+                        weight=1,  # por defecto 1, luego el admin puede editar
+                    )
+            except wallet.InsufficientFunds:
+                messages.error(request, "No tienes suficientes monedas para participar.")
+                return redirect("rpg_raffle")
+            except IntegrityError:
+                # Doble envío: la inscripción ya existía y no se cobra
+                messages.info(request, "Ya estás inscrito en este sorteo.")
+                return redirect("rpg_raffle")
             messages.success(request, "Te has inscrito en el sorteo.")
             return redirect("rpg_raffle")
 